@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+
+"""
+
+Name: Guess Generation Benchmark
+
+Measures how many guesses a second PcfgGrammar can create from the
+pre-terminals popped off the priority queue. Guesses are thrown away vs.
+being printed so this measures the guess generation engine and not stdout.
+
+Both the original recursive engine, (kept as a reference implementation in
+lib_guesser/unit_tests/reference_guesses.py), and the current engine are run
+against the same list of parse trees, so the before and after numbers are
+directly comparable.
+
+Run from the top level directory:
+    python3 -m benchmarks.bench_create_guesses --rule Default
+
+"""
+
+
+import os
+import argparse
+import time
+
+# Local imports
+from lib_guesser.pcfg_grammar import PcfgGrammar
+from lib_guesser.priority_queue import PcfgQueue
+from lib_guesser.guess_output import NullOutput
+from lib_guesser.unit_tests.reference_guesses import recursive_guesses
+
+
+def load_pcfg(rule_name, skip_case = False):
+    """
+    Loads a PCFG grammar from the Rules folder
+
+    Inputs:
+        rule_name: The name of the ruleset to load
+
+        skip_case: If case mangling should be disabled
+
+    Returns:
+        pcfg: The PcfgGrammar
+
+        load_time: How long it took to load the grammar (seconds)
+    """
+
+    base_directory = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+        'Rules',
+        rule_name
+        )
+
+    start_time = time.perf_counter()
+    pcfg = PcfgGrammar(rule_name, base_directory, '4.8', skip_case = skip_case)
+
+    return pcfg, time.perf_counter() - start_time
+
+
+def collect_parse_trees(pcfg, num_guesses):
+    """
+    Pops parse trees off the priority queue until they cover num_guesses
+
+    OMEN parse trees are skipped since they are benchmarked seperately
+
+    Inputs:
+        pcfg: The PcfgGrammar
+
+        num_guesses: The number of guesses the parse trees should cover
+
+    Returns:
+        pt_list: A list of parse trees in probability order
+    """
+
+    pqueue = PcfgQueue(pcfg)
+    pt_list = []
+    total = 0
+
+    while total < num_guesses:
+        pt_item = pqueue.next()
+        if pt_item is None:
+            break
+
+        if pt_item['pt'][0][0] == 'M':
+            continue
+
+        pt_list.append(pt_item['pt'])
+
+        total += pcfg.count_guesses(pt_item['pt'])
+
+    return pt_list
+
+
+def time_engine(pcfg, pt_list, engine):
+    """
+    Times how long it takes to create all the guesses for the parse trees
+
+    Inputs:
+        pcfg: The PcfgGrammar. Its output will be replaced with one that
+        throws the guesses away
+
+        pt_list: The parse trees to generate guesses for
+
+        engine: A function that takes a parse tree and returns the number of
+        guesses generated
+
+    Returns:
+        (num_guesses, elapsed)
+    """
+    pcfg.output = NullOutput(pcfg.encoding)
+
+    num_guesses = 0
+    start_time = time.perf_counter()
+    for pt in pt_list:
+        num_guesses += engine(pt)
+
+    return num_guesses, time.perf_counter() - start_time
+
+
+def main():
+    """
+    Runs the benchmark and prints the results to stdout
+    """
+
+    parser = argparse.ArgumentParser(description = 'PCFG guess generation benchmark')
+    parser.add_argument('--rule', '-r', default = 'Default', help = 'The ruleset to benchmark')
+    parser.add_argument('--guesses', '-n', type = int, default = 2000000,
+        help = 'Number of guesses to generate for each engine')
+    args = parser.parse_args()
+
+    pcfg, load_time = load_pcfg(args.rule)
+    print(f"Grammar load time: {load_time:.2f} seconds")
+
+    pt_list = collect_parse_trees(pcfg, args.guesses)
+    print(f"Parse trees: {len(pt_list):,}")
+
+    engines = [
+        ('recursive', lambda pt: recursive_guesses(pcfg, '', pt)),
+        ('iterative', lambda pt: pcfg.create_guesses(pt)),
+    ]
+
+    for name, engine in engines:
+        num_guesses, elapsed = time_engine(pcfg, pt_list, engine)
+        print(f"{name:>10}: {num_guesses:,} guesses in {elapsed:.2f} seconds, " +
+            f"{num_guesses / elapsed:,.0f} guesses/sec")
+
+
+if __name__ == "__main__":
+    main()
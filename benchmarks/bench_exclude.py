@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+
+"""
+
+Name: Exclude List Benchmark
+
+Measures the cost of checking guesses against an --exclude list, and
+compares it to the cost of hashing guesses with --hashes. The exclude list is
+built from a sample of the guesses, (as if they were cracked in an earlier
+session), padded out with passwords that are never guessed.
+
+For each hash type the same guesses are run through HashOutput with and
+without an ExcludeOutput in front of it. Since none of the target hashes are
+ever cracked, the difference is the filter cost minus the hashing it saves.
+
+Run from the top level directory:
+    python3 -m benchmarks.bench_exclude --rule Default
+
+"""
+
+
+import os
+import argparse
+import time
+
+# Local imports
+from lib_guesser.guess_output import MemoryOutput, NullOutput, DEFAULT_BATCH_SIZE
+from lib_guesser.hash_output import HashOutput, DIGEST_SIZES
+from lib_guesser.filter_output import ExcludeOutput, ExcludeList
+from .bench_create_guesses import load_pcfg, collect_parse_trees
+
+
+def create_batches(pcfg, num_guesses):
+    """
+    Creates the encoded batches of guesses to filter
+
+    Inputs:
+        pcfg: The PcfgGrammar
+
+        num_guesses: The number of guesses to create
+
+    Returns:
+        batches: A list of encoded, newline seperated batches of guesses
+    """
+
+    pcfg.output = MemoryOutput(pcfg.encoding)
+    for pt in collect_parse_trees(pcfg, num_guesses):
+        pcfg.create_guesses(pt)
+
+    guesses = pcfg.output.getvalue().split(b'\n')[:num_guesses]
+
+    return [
+        b'\n'.join(guesses[i:i + DEFAULT_BATCH_SIZE]) + b'\n'
+        for i in range(0, len(guesses), DEFAULT_BATCH_SIZE)
+    ]
+
+
+def time_output(output, batches):
+    """
+    Times writing all the batches of guesses to an output
+
+    Inputs:
+        output: The GuessOutput to write to
+
+        batches: The encoded batches of guesses
+
+    Returns:
+        elapsed: How long it took (seconds)
+    """
+
+    start_time = time.perf_counter()
+    for data in batches:
+        output.write_encoded(data)
+    output.flush()
+
+    return time.perf_counter() - start_time
+
+
+def main():
+    """
+    Runs the benchmark and prints the results to stdout
+    """
+
+    parser = argparse.ArgumentParser(description = 'PCFG exclude list benchmark')
+    parser.add_argument('--rule', '-r', default = 'Default', help = 'The ruleset to benchmark')
+    parser.add_argument('--guesses', '-n', type = int, default = 500000,
+        help = 'Number of guesses to check')
+    parser.add_argument('--excluded', type = float, default = 0.1,
+        help = 'The fraction of the guesses that are on the exclude list')
+    parser.add_argument('--list_size', type = int, default = 1000000,
+        help = 'The number of passwords on the exclude list')
+    args = parser.parse_args()
+
+    pcfg, _ = load_pcfg(args.rule)
+    batches = create_batches(pcfg, args.guesses)
+    guesses = [guess for data in batches for guess in data.split(b'\n')[:-1]]
+    num_guesses = len(guesses)
+    print(f"Guesses: {num_guesses:,}")
+
+    # Spread the excluded guesses out evenly, and pad the list with
+    # passwords the guesser won't create
+    step = max(int(1 / args.excluded), 1) if args.excluded > 0 else num_guesses + 1
+    passwords = guesses[::step]
+    passwords += [b'\x00' + os.urandom(8) for _ in range(max(args.list_size - len(passwords), 0))]
+
+    start_time = time.perf_counter()
+    exclude_list = ExcludeList(passwords)
+    print(f"Exclude list: {len(exclude_list):,} passwords, {exclude_list.memory() / 2**20:.1f} MiB, " +
+        f"built in {time.perf_counter() - start_time:.2f} seconds")
+
+    output = ExcludeOutput(NullOutput(pcfg.encoding), exclude_list)
+    filter_time = time_output(output, batches)
+    print(f"{'filter':>8}: {filter_time * 1e9 / num_guesses:,.0f} ns/guess, " +
+        f"{output.num_excluded:,} guesses excluded")
+
+    for hash_type, digest_size in DIGEST_SIZES.items():
+
+        # None of the targets are cracked, so every guess is hashed
+        targets = {bytes(digest_size)}
+
+        hash_time = time_output(HashOutput(NullOutput(pcfg.encoding), targets, hash_type), batches)
+        both_time = time_output(ExcludeOutput(HashOutput(NullOutput(pcfg.encoding), targets, hash_type), exclude_list), batches)
+
+        print(f"{hash_type:>8}: {hash_time * 1e9 / num_guesses:,.0f} ns/guess hashing every guess, " +
+            f"{both_time * 1e9 / num_guesses:,.0f} ns/guess with the exclude list, " +
+            f"{(hash_time - both_time) / hash_time:+.1%} saved")
+
+
+if __name__ == "__main__":
+    main()
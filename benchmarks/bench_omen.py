@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+
+"""
+
+Name: OMEN Guess Generation Benchmark
+
+Measures how many OMEN guesses a second each engine can create for the first
+few OMEN levels of a ruleset:
+
+    original: MarkovCracker.next_guess(), one guess at a time
+    indexed: IndexedMarkovCracker.next_guesses(), using the compiled grammar
+
+Each engine gets its own empty optimizer. The guesses are thrown away, but
+they are compared to make sure both engines created the same guesses.
+
+Run from the top level directory:
+    python3 -m benchmarks.bench_omen --rule Default
+
+"""
+
+
+import os
+import argparse
+import time
+
+# Local imports
+from lib_guesser.omen.input_file_io import load_rules
+from lib_guesser.omen.markov_cracker import MarkovCracker
+from lib_guesser.omen.indexed_cracker import IndexedMarkovCracker, compile_grammar
+from lib_guesser.omen.optimizer import Optimizer
+
+
+def run_original(grammar, level, limit):
+    """
+    Creates guesses for an OMEN level with the original engine
+
+    Inputs:
+        grammar: The OMEN grammar
+
+        level: The OMEN level
+
+        limit: The maximum number of guesses to create
+
+    Returns:
+        (guesses, elapsed)
+    """
+
+    cracker = MarkovCracker(grammar, level, Optimizer(max_length = 4))
+
+    guesses = []
+    start_time = time.perf_counter()
+    guess = cracker.next_guess()
+    while guess is not None:
+        guesses.append(guess)
+        if len(guesses) >= limit:
+            break
+        guess = cracker.next_guess()
+
+    return guesses, time.perf_counter() - start_time
+
+
+def run_indexed(compiled_grammar, level, limit):
+    """
+    Creates guesses for an OMEN level with the indexed engine
+
+    Inputs:
+        compiled_grammar: The compiled OMEN grammar
+
+        level: The OMEN level
+
+        limit: The maximum number of guesses to create
+
+    Returns:
+        (guesses, elapsed)
+    """
+
+    cracker = IndexedMarkovCracker(compiled_grammar, level, Optimizer(max_length = 4))
+
+    guesses = []
+    start_time = time.perf_counter()
+    block = cracker.next_guesses(limit)
+    while block is not None:
+        guesses.extend(block)
+        if len(guesses) >= limit:
+            break
+        block = cracker.next_guesses(limit - len(guesses))
+
+    return guesses, time.perf_counter() - start_time
+
+
+def main():
+    """
+    Runs the benchmark and prints the results to stdout
+    """
+
+    parser = argparse.ArgumentParser(description = 'OMEN guess generation benchmark')
+    parser.add_argument('--rule', '-r', default = 'Default', help = 'The ruleset to benchmark')
+    parser.add_argument('--levels', type = int, default = 7,
+        help = 'Benchmark OMEN levels 1 through this level')
+    parser.add_argument('--guesses', '-n', type = int, default = 1000000,
+        help = 'The maximum number of guesses to create for each level')
+    args = parser.parse_args()
+
+    omen_directory = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+        'Rules',
+        args.rule,
+        'Omen'
+        )
+
+    start_time = time.perf_counter()
+    grammar = {}
+    if not load_rules(omen_directory, grammar):
+        print(f"Could not load the OMEN rules from {omen_directory}")
+        return
+    print(f"OMEN rules load time: {time.perf_counter() - start_time:.2f} seconds")
+
+    start_time = time.perf_counter()
+    compiled_grammar = compile_grammar(grammar)
+    print(f"Compile time: {time.perf_counter() - start_time:.2f} seconds")
+
+    totals = {'original': [0, 0.0], 'indexed': [0, 0.0]}
+
+    for level in range(1, args.levels + 1):
+        original, original_time = run_original(grammar, level, args.guesses)
+        indexed, indexed_time = run_indexed(compiled_grammar, level, args.guesses)
+
+        if original != indexed:
+            print(f"Level {level}: The engines created different guesses!")
+            return
+
+        for name, elapsed in [('original', original_time), ('indexed', indexed_time)]:
+            totals[name][0] += len(original)
+            totals[name][1] += elapsed
+
+        print(f"Level {level:>2}: {len(original):>10,} guesses, " +
+            f"original {len(original) / max(original_time, 1e-9):>12,.0f} guesses/sec, " +
+            f"indexed {len(indexed) / max(indexed_time, 1e-9):>12,.0f} guesses/sec")
+
+    for name, (num_guesses, elapsed) in totals.items():
+        print(f"{name:>10}: {num_guesses:,} guesses in {elapsed:.2f} seconds, " +
+            f"{num_guesses / max(elapsed, 1e-9):,.0f} guesses/sec")
+
+
+if __name__ == "__main__":
+    main()
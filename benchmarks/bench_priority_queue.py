@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+
+"""
+
+Name: Priority Queue Benchmark
+
+Measures how fast parse trees can be popped off the PcfgQueue, and how much
+memory the queue takes up while doing so. No guesses are generated.
+
+Memory is measured in a seperate run using tracemalloc since tracing slows
+everything else down.
+
+Run from the top level directory:
+    python3 -m benchmarks.bench_priority_queue --rule Default
+
+"""
+
+
+import argparse
+import time
+import tracemalloc
+
+# Local imports
+from lib_guesser.priority_queue import PcfgQueue
+from .bench_create_guesses import load_pcfg
+
+
+def pop_parse_trees(pcfg, num_pops):
+    """
+    Pops parse trees off a new priority queue
+
+    Inputs:
+        pcfg: The PcfgGrammar
+
+        num_pops: The number of parse trees to pop
+
+    Returns:
+        (pqueue, num_popped)
+    """
+
+    pqueue = PcfgQueue(pcfg)
+
+    num_popped = 0
+    while num_popped < num_pops:
+        if pqueue.next() is None:
+            break
+        num_popped += 1
+
+    return pqueue, num_popped
+
+
+def main():
+    """
+    Runs the benchmark and prints the results to stdout
+    """
+
+    parser = argparse.ArgumentParser(description = 'PCFG priority queue benchmark')
+    parser.add_argument('--rule', '-r', default = 'Default', help = 'The ruleset to benchmark')
+    parser.add_argument('--pops', '-n', type = int, default = 500000,
+        help = 'Number of parse trees to pop off the queue')
+    args = parser.parse_args()
+
+    pcfg, load_time = load_pcfg(args.rule)
+    print(f"Grammar load time: {load_time:.2f} seconds")
+
+    # Throughput
+    start_time = time.perf_counter()
+    pqueue, num_popped = pop_parse_trees(pcfg, args.pops)
+    elapsed = time.perf_counter() - start_time
+
+    print(f"Popped {num_popped:,} parse trees in {elapsed:.2f} seconds, " +
+        f"{num_popped / elapsed:,.0f} parse trees/sec")
+    print(f"Final queue size: {len(pqueue.p_queue):,} items")
+    del pqueue
+
+    # Memory
+    tracemalloc.start()
+    pqueue, num_popped = pop_parse_trees(pcfg, args.pops)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"Queue memory: {current / 2**20:,.1f} MiB, " +
+        f"{current / len(pqueue.p_queue):,.0f} bytes/item, " +
+        f"peak {peak / 2**20:,.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+
+"""
+
+Name: Session Restore Benchmark
+
+Measures how long it takes to restore the priority queue of a saved session.
+The session is created by popping parse trees off a new priority queue, and
+is then restored in this process, split up between worker processes, and
+from a snapshot of the queue.
+
+Run from the top level directory:
+    python3 -m benchmarks.bench_restore --rule Default
+
+"""
+
+
+import os
+import argparse
+import configparser
+import tempfile
+import time
+
+# Local imports
+from lib_guesser.priority_queue import PcfgQueue
+from lib_guesser.guess_workers import GuessWorkerPool
+from .bench_create_guesses import load_pcfg
+from .bench_priority_queue import pop_parse_trees
+
+
+def time_restore(pcfg, save_config, workers):
+    """
+    Times restoring the priority queue of a saved session
+
+    Inputs:
+        pcfg: The PcfgGrammar
+
+        save_config: The configparser holding the session info
+
+        workers: The number of processes to restore the session with
+
+    Returns:
+        (num_restored, elapsed)
+    """
+
+    worker_pool = None
+    if workers > 1:
+        worker_pool = GuessWorkerPool(pcfg, workers)
+
+    try:
+        start_time = time.perf_counter()
+        pqueue = PcfgQueue(pcfg, save_config, worker_pool = worker_pool)
+        elapsed = time.perf_counter() - start_time
+
+    finally:
+        if worker_pool is not None:
+            worker_pool.close()
+
+    return len(pqueue.p_queue), elapsed
+
+
+def main():
+    """
+    Runs the benchmark and prints the results to stdout
+    """
+
+    parser = argparse.ArgumentParser(description = 'PCFG session restore benchmark')
+    parser.add_argument('--rule', '-r', default = 'Default', help = 'The ruleset to benchmark')
+    parser.add_argument('--pops', '-n', type = int, default = 1000000,
+        help = 'Number of parse trees the saved session has popped off the queue')
+    parser.add_argument('--workers', '-w', type = int, default = 4,
+        help = 'Number of processes to restore the session with')
+    args = parser.parse_args()
+
+    pcfg, load_time = load_pcfg(args.rule)
+    print(f"Grammar load time: {load_time:.2f} seconds")
+
+    pqueue, num_popped = pop_parse_trees(pcfg, args.pops)
+    print(f"Saved session after popping {num_popped:,} parse trees")
+
+    save_config = configparser.ConfigParser()
+    save_config.add_section('guessing_info')
+    pqueue.update_save_config(save_config)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        snapshot_file = os.path.join(temp_dir, 'session.pqs')
+
+        start_time = time.perf_counter()
+        pqueue.save_snapshot(snapshot_file, 1)
+        elapsed = time.perf_counter() - start_time
+        del pqueue
+
+        print(f"Saved a {os.path.getsize(snapshot_file) / 2**20:,.1f} MiB snapshot " +
+            f"in {elapsed:.2f} seconds")
+
+        for workers in sorted({1, args.workers}):
+            num_restored, elapsed = time_restore(pcfg, save_config, workers)
+            print(f"{workers:>3} process(es): restored {num_restored:,} parse trees " +
+                f"in {elapsed:.2f} seconds")
+
+        save_config.set('guessing_info', 'snapshot_id', '1')
+        start_time = time.perf_counter()
+        pqueue = PcfgQueue(pcfg, save_config, snapshot_file = snapshot_file)
+        elapsed = time.perf_counter() - start_time
+
+        print(f"     snapshot: restored {len(pqueue.p_queue):,} parse trees " +
+            f"in {elapsed:.2f} seconds")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+
+
+"""
+
+Name: Guesser Benchmark Suite
+
+Runs the hot paths of the guesser against one or more rulesets and writes the
+results to a JSON file, so they can be compared across versions to catch
+regressions:
+
+    load_time: How long it takes to load the grammar
+    queue: How fast parse trees are popped off the PcfgQueue
+    guesses: create_guesses() guesses/sec. Also split up by the type of the
+        last replacement in each parse tree, since that is the replacement
+        the guess generation engine loops over the most
+    omen: Indexed OMEN guesses/sec for each level
+    honeywords: Honeywords/sec, using random walks through the grammar
+    peak_rss_mib: The peak memory used by the process benchmarking the ruleset
+
+Each ruleset is benchmarked in its own process so the peak memory is only for
+that ruleset. Rulesets that are missing or can't be loaded are skipped, and
+the reason is saved in the results.
+
+Run from the top level directory:
+    python3 -m benchmarks.bench_suite --output results.json
+
+"""
+
+
+import os
+import sys
+import argparse
+import datetime
+import json
+import multiprocessing
+import platform
+import random
+import time
+
+# Not available on Windows
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Local imports
+from lib_guesser.guess_output import NullOutput
+from .bench_create_guesses import load_pcfg, collect_parse_trees
+from .bench_priority_queue import pop_parse_trees
+from .bench_omen import run_indexed
+
+
+# The version of the results format
+RESULTS_VERSION = 1
+
+
+def rate(count, elapsed):
+    """
+    Returns the results for a timed run
+
+    Inputs:
+        count: The number of items created
+
+        elapsed: How long it took (seconds)
+
+    Returns:
+        results: A dictionary of the count, seconds, and count per second
+    """
+
+    return {
+        'count': count,
+        'seconds': round(elapsed, 4),
+        'per_second': round(count / max(elapsed, 1e-9), 1),
+    }
+
+
+def bench_queue(pcfg, num_pops):
+    """
+    Times popping parse trees off the priority queue
+
+    Inputs:
+        pcfg: The PcfgGrammar
+
+        num_pops: The number of parse trees to pop
+
+    Returns:
+        results: See rate()
+    """
+
+    start_time = time.perf_counter()
+    _, num_popped = pop_parse_trees(pcfg, num_pops)
+
+    return rate(num_popped, time.perf_counter() - start_time)
+
+
+def bench_guesses(pcfg, num_guesses):
+    """
+    Times creating guesses for the most probable parse trees
+
+    Inputs:
+        pcfg: The PcfgGrammar
+
+        num_guesses: The number of guesses the parse trees should cover
+
+    Returns:
+        results: See rate(), along with 'by_type' which has the same results
+        for each type of the last replacement in the parse trees
+    """
+
+    pt_list = collect_parse_trees(pcfg, num_guesses)
+    pcfg.output = NullOutput(pcfg.encoding)
+
+    # [num_guesses, elapsed] for each type
+    by_type = {}
+
+    total_guesses = 0
+    total_time = 0.0
+    for pt in pt_list:
+        start_time = time.perf_counter()
+        count = pcfg.create_guesses(pt)
+        elapsed = time.perf_counter() - start_time
+
+        totals = by_type.setdefault(pt[-1][0][0], [0, 0.0])
+        totals[0] += count
+        totals[1] += elapsed
+
+        total_guesses += count
+        total_time += elapsed
+
+    results = rate(total_guesses, total_time)
+    results['parse_trees'] = len(pt_list)
+    results['by_type'] = {
+        category: rate(count, elapsed) for category, (count, elapsed) in sorted(by_type.items())
+    }
+
+    return results
+
+
+def bench_omen(pcfg, num_levels, num_guesses):
+    """
+    Times creating guesses for each OMEN level with the indexed engine
+
+    Inputs:
+        pcfg: The PcfgGrammar
+
+        num_levels: Benchmark OMEN levels 1 through this level
+
+        num_guesses: The maximum number of guesses to create for each level
+
+    Returns:
+        results: A list of the results for each level, see rate()
+    """
+
+    results = []
+    for level in range(1, num_levels + 1):
+        guesses, elapsed = run_indexed(pcfg.omen_grammar, level, num_guesses)
+
+        level_results = rate(len(guesses), elapsed)
+        level_results['level'] = level
+        results.append(level_results)
+
+    return results
+
+
+def bench_honeywords(pcfg, num_honeywords):
+    """
+    Times creating honeywords
+
+    Inputs:
+        pcfg: The PcfgGrammar
+
+        num_honeywords: The number of honeywords to create
+
+    Returns:
+        results: See rate()
+    """
+
+    pcfg.output = NullOutput(pcfg.encoding)
+
+    # Make the runs repeatable
+    random.seed(1)
+
+    count = 0
+    start_time = time.perf_counter()
+    while count < num_honeywords:
+        pt_item = pcfg.random_walk()
+        count += pcfg.create_guesses(pt_item['pt'], is_honeyword = True, limit = num_honeywords - count)
+
+    return rate(count, time.perf_counter() - start_time)
+
+
+def peak_rss():
+    """
+    Returns the peak memory used by this process in MiB, or None if it can't
+    be found on this platform
+    """
+
+    if resource is None:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Reported in bytes on macOS, and KiB everywhere else
+    if sys.platform == 'darwin':
+        return round(max_rss / 2**20, 1)
+
+    return round(max_rss / 2**10, 1)
+
+
+def bench_ruleset(rule_name, settings):
+    """
+    Runs all the benchmarks for a ruleset
+
+    Inputs:
+        rule_name: The name of the ruleset in the Rules folder
+
+        settings: A dictionary with the size of each benchmark, (see main)
+
+    Returns:
+        results: A dictionary of the results. If the ruleset couldn't be
+        loaded it only has 'skipped' with the reason why
+    """
+
+    base_directory = os.path.join(
+        os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+        'Rules',
+        rule_name
+        )
+
+    if not os.path.isdir(base_directory):
+        return {'skipped': f"The ruleset was not found at {base_directory}"}
+
+    # PcfgGrammar prints out what went wrong before raising an exception
+    try:
+        pcfg, load_time = load_pcfg(rule_name)
+    except Exception as msg:
+        return {'skipped': f"The ruleset could not be loaded, (see the errors printed above) {msg}".strip()}
+
+    results = {'load_time': round(load_time, 4)}
+    results['queue'] = bench_queue(pcfg, settings['pops'])
+    results['guesses'] = bench_guesses(pcfg, settings['guesses'])
+    results['omen'] = bench_omen(pcfg, settings['omen_levels'], settings['omen_guesses'])
+    results['honeywords'] = bench_honeywords(pcfg, settings['honeywords'])
+    results['peak_rss_mib'] = peak_rss()
+
+    return results
+
+
+def print_results(rule_name, results):
+    """
+    Prints a summary of the results for a ruleset to stdout
+    """
+
+    print(f"{rule_name}:")
+
+    if 'skipped' in results:
+        print(f"    Skipped: {results['skipped']}")
+        return
+
+    print(f"    Grammar load time: {results['load_time']:.2f} seconds")
+    print(f"    Priority queue: {results['queue']['per_second']:,.0f} parse trees/sec")
+    print(f"    Guesses: {results['guesses']['per_second']:,.0f} guesses/sec")
+    for category, item in results['guesses']['by_type'].items():
+        print(f"        {category}: {item['count']:>10,} guesses, {item['per_second']:>12,.0f} guesses/sec")
+    for item in results['omen']:
+        print(f"    OMEN level {item['level']:>2}: {item['count']:>10,} guesses, " +
+            f"{item['per_second']:>12,.0f} guesses/sec")
+    print(f"    Honeywords: {results['honeywords']['per_second']:,.0f} honeywords/sec")
+    if results['peak_rss_mib'] is not None:
+        print(f"    Peak RSS: {results['peak_rss_mib']:,.1f} MiB")
+
+
+def main():
+    """
+    Runs the benchmarks, prints a summary to stdout, and saves the results
+    """
+
+    parser = argparse.ArgumentParser(description = 'PCFG guesser benchmark suite')
+    parser.add_argument('--rules', '-r', nargs = '+', default = ['Default', 'Russian'],
+        help = 'The rulesets to benchmark')
+    parser.add_argument('--output', '-o', default = 'bench_results.json',
+        help = 'The JSON file to save the results to')
+    parser.add_argument('--pops', type = int, default = 200000,
+        help = 'Number of parse trees to pop off the queue')
+    parser.add_argument('--guesses', '-n', type = int, default = 1000000,
+        help = 'Number of guesses to create with create_guesses()')
+    parser.add_argument('--omen_levels', type = int, default = 5,
+        help = 'Benchmark OMEN levels 1 through this level')
+    parser.add_argument('--omen_guesses', type = int, default = 200000,
+        help = 'The maximum number of guesses to create for each OMEN level')
+    parser.add_argument('--honeywords', type = int, default = 100000,
+        help = 'Number of honeywords to create')
+    args = parser.parse_args()
+
+    settings = {
+        'pops': args.pops,
+        'guesses': args.guesses,
+        'omen_levels': args.omen_levels,
+        'omen_guesses': args.omen_guesses,
+        'honeywords': args.honeywords,
+    }
+
+    results = {
+        'results_version': RESULTS_VERSION,
+        'date': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': settings,
+        'rulesets': {},
+    }
+
+    # Spawn vs. fork so the memory of earlier rulesets isn't counted
+    context = multiprocessing.get_context('spawn')
+
+    for rule_name in args.rules:
+        with context.Pool(1) as pool:
+            rule_results = pool.apply(bench_ruleset, (rule_name, settings))
+
+        results['rulesets'][rule_name] = rule_results
+        print_results(rule_name, rule_results)
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent = 4)
+
+    print(f"Saved the results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+
+
+"""
+
+Name: PCFG_Guesser Bloom Filter
+
+Description: A memory bounded set membership filter, used to drop guesses
+that have already been seen
+
+This is a scalable Bloom filter. It starts out small and adds a larger layer
+every time the newest layer is full, until the memory limit is reached. After
+that the last layer keeps filling up and the false positive rate starts to
+rise, which can be checked with false_positive_rate().
+
+To keep the cost of each check down in Python, this is a blocked Bloom filter.
+All the bits for an item are in one 64 bit word, so each layer only needs one
+word read per check, and the bits are all set or tested with one mask.
+
+Items are hashed with Python's built in hash(), so a filter can only be used
+in the process that created it.
+
+"""
+
+
+import math
+from array import array
+
+
+# The number of bits set for each item
+NUM_PROBES = 6
+
+# The number of bits in a layer for each item it holds. Along with NUM_PROBES
+# this gives a false positive rate around 0.1% for a full layer. A blocked
+# filter needs more bits than a normal Bloom filter for the same rate, since
+# some words end up with a lot more items than others
+BITS_PER_ITEM = 24
+
+# The number of items the first layer holds
+DEFAULT_INITIAL_CAPACITY = 1 << 20
+
+# How much larger each layer is than the one before it
+GROWTH_FACTOR = 4
+
+# The word index is taken from the low bits of the hash, and the mask from the
+# high bits, so this limits the size of a layer
+MAX_LAYER_WORDS = 1 << 28
+
+# The mask is built from three 12 bit pieces of the hash, each of which sets
+# two bits. Looking the pieces up is faster than shifting in all six bits
+_MASKS = [(1 << (value & 63)) | (1 << (value >> 6)) for value in range(4096)]
+
+
+class BloomFilter:
+    """
+    Scalable blocked Bloom filter with a memory limit
+    """
+
+    def __init__(self, max_bytes, initial_capacity = DEFAULT_INITIAL_CAPACITY):
+        """
+        Creates the first layer of the filter
+
+        Inputs:
+            max_bytes: The maximum amount of memory to use for the filter
+
+            initial_capacity: The number of items the first layer holds
+
+        Returns:
+            BloomFilter
+        """
+
+        self.max_bytes = max_bytes
+
+        # The layers of the filter, oldest first. Each is an array of 64 bit
+        # words. New items are only added to the last layer
+        self.layers = []
+
+        # The number of items added to each layer
+        self.layer_items = []
+
+        # The number of items the last layer holds before a new layer is
+        # added. None once the memory limit is reached
+        self.capacity = None
+
+        words = (initial_capacity * BITS_PER_ITEM) // 64
+        self._add_layer(min(max(words, 1), max(max_bytes // 8, 1), MAX_LAYER_WORDS))
+
+    def add(self, item):
+        """
+        Adds an item to the filter
+
+        Inputs:
+            item: Anything that can be hashed
+
+        Returns:
+            True: The item was, (probably), already in the filter
+
+            False: The item was not in the filter
+        """
+
+        return not self.filter_new([item])
+
+    def __contains__(self, item):
+        """
+        Checks if an item is, (probably), in the filter
+        """
+
+        index, mask = _probe(item)
+        for words in self.layers:
+            if words[index % len(words)] & mask == mask:
+                return True
+
+        return False
+
+    def filter_new(self, items):
+        """
+        Adds a list of items to the filter
+
+        Inputs:
+            items: A list of items that can be hashed
+
+        Returns:
+            new_items: The items that were not already in the filter, (or
+            earlier in the list), in the same order
+        """
+
+        new_items = []
+
+        layers = self.layers
+        last_words = layers[-1]
+        num_words = len(last_words)
+
+        # Skip checking the last layer twice
+        older_layers = [(words, len(words)) for words in layers[:-1]]
+
+        num_added = self.layer_items[-1]
+        capacity = self.capacity
+        masks = _MASKS
+
+        for item in items:
+            value = hash(item) & 0xffffffffffffffff
+            mask = masks[value >> 52] | masks[(value >> 40) & 4095] | masks[(value >> 28) & 4095]
+            index = value & 0xfffffff
+
+            position = index % num_words
+            word = last_words[position]
+            if word & mask == mask:
+                continue
+
+            for words, size in older_layers:
+                if words[index % size] & mask == mask:
+                    break
+
+            else:
+                last_words[position] = word | mask
+                new_items.append(item)
+                num_added += 1
+
+                # The layer is full, so add a bigger one if there is room
+                if capacity is not None and num_added >= capacity:
+                    self.layer_items[-1] = num_added
+                    self._grow()
+
+                    older_layers = [(words, len(words)) for words in self.layers[:-1]]
+                    last_words = self.layers[-1]
+                    num_words = len(last_words)
+                    num_added = self.layer_items[-1]
+                    capacity = self.capacity
+
+        self.layer_items[-1] = num_added
+
+        return new_items
+
+    def memory(self):
+        """
+        Returns the number of bytes used by the layers of the filter
+        """
+
+        return sum(len(words) * 8 for words in self.layers)
+
+    def false_positive_rate(self):
+        """
+        Estimates the chance that a new item will be reported as already
+        being in the filter
+
+        Inputs:
+            None
+
+        Returns:
+            rate: The estimated false positive rate, from 0.0 to 1.0
+        """
+
+        not_found = 1.0
+        for words, num_items in zip(self.layers, self.layer_items):
+            not_found *= 1.0 - _blocked_false_positive_rate(num_items / len(words))
+
+        return 1.0 - not_found
+
+    def _add_layer(self, num_words):
+        """
+        Adds a new layer to the filter
+
+        Inputs:
+            num_words: The size of the layer in 64 bit words
+
+        Returns:
+            None
+        """
+
+        self.layers.append(array('Q', bytes(num_words * 8)))
+        self.layer_items.append(0)
+        self.capacity = (num_words * 64) // BITS_PER_ITEM
+
+    def _grow(self):
+        """
+        Adds a larger layer once the last one is full. If there isn't enough
+        memory left the last layer keeps being used
+        """
+
+        num_words = min(
+            len(self.layers[-1]) * GROWTH_FACTOR,
+            (self.max_bytes - self.memory()) // 8,
+            MAX_LAYER_WORDS
+            )
+
+        if num_words <= len(self.layers[-1]):
+            self.capacity = None
+            return
+
+        self._add_layer(num_words)
+
+
+def _blocked_false_positive_rate(items_per_word):
+    """
+    Returns the false positive rate of one layer of the filter
+
+    The number of items in each word follows a Poisson distribution, so this
+    adds up the false positive rate of a word with j items, weighted by how
+    likely a word is to have j items
+
+    Inputs:
+        items_per_word: The average number of items in each word
+
+    Returns:
+        rate: The false positive rate, from 0.0 to 1.0
+    """
+
+    rate = 0.0
+    probability = math.exp(-items_per_word)
+    for num_items in range(int(items_per_word * 4) + 64):
+        if num_items:
+            probability *= items_per_word / num_items
+        rate += probability * (1.0 - (63 / 64) ** (NUM_PROBES * num_items)) ** NUM_PROBES
+
+    return rate
+
+
+def _probe(item):
+    """
+    Returns the (index, mask) for an item. Needs to match filter_new()
+    """
+
+    value = hash(item) & 0xffffffffffffffff
+    mask = _MASKS[value >> 52] | _MASKS[(value >> 40) & 4095] | _MASKS[(value >> 28) & 4095]
+
+    return value & 0xfffffff, mask
@@ -0,0 +1,537 @@
+#!/usr/bin/env python3
+
+
+"""
+
+Name: PCFG_Guesser Work Queue Coordinator
+
+Description: Hands out guess generation work to other guesser processes
+over a socket
+
+The coordinator owns the priority queue. Parse trees are popped off it in
+probability order and split up into work units, which are lists of
+(pt, start, count) items. Like the worker processes in guess_workers.py,
+small parse trees are batched together into one work unit, and large parse
+trees are split up into index ranges across multiple work units. Each work
+unit is leased to a worker when it asks for work. The worker generates the
+guesses with PcfgGrammar.create_guesses() and writes them to its own output,
+then tells the coordinator the work unit is done.
+
+If a worker disconnects, or doesn't finish a work unit before its lease
+times out, the work unit is handed out again to the next worker that asks.
+
+Workers can run on the same machine or on other machines, as long as they
+load the same ruleset with the same options.
+
+Messages are JSON objects sent one per line:
+
+    worker -> coordinator:
+        {"type": "request"}
+        {"type": "complete", "lease": id, "num_guesses": n}
+
+    coordinator -> worker:
+        {"type": "work", "lease": id, "items": [[pt, start, count], ...]}
+        {"type": "wait", "seconds": s}
+        {"type": "done"}
+
+"""
+
+
+import sys
+import os
+import time
+import json
+import socket
+import socketserver
+import threading
+from collections import deque
+
+# Local imports
+from .priority_queue import PcfgQueue
+
+
+# The maximum number of guesses in a single work unit
+DEFAULT_UNIT_SIZE = 1000000
+
+# The number of seconds a worker has to finish a work unit before it is
+# handed out again
+DEFAULT_LEASE_TIMEOUT = 3600
+
+# The number of seconds between throughput reports
+DEFAULT_REPORT_INTERVAL = 30
+
+# How long to tell a worker to wait if there is no work available right now
+WAIT_TIME = 1
+
+
+def parse_address(address):
+    """
+    Parses the address of a coordinator
+
+    Inputs:
+        address: Either "host:port" for a TCP socket, or the path of a Unix
+        socket
+
+    Returns:
+        (family, address): The socket family and the address to pass to
+        bind() or connect()
+    """
+
+    host, separator, port = address.rpartition(':')
+    if separator and port.isdigit() and os.sep not in address:
+        return socket.AF_INET, (host or 'localhost', int(port))
+
+    return socket.AF_UNIX, address
+
+
+class Coordinator:
+    """
+    Keeps track of the work units that have been handed out
+    """
+
+    def __init__(self, pcfg, unit_size = DEFAULT_UNIT_SIZE,
+        lease_timeout = DEFAULT_LEASE_TIMEOUT, limit = None):
+        """
+        Initializes the priority queue
+
+        Inputs:
+            pcfg: The PcfgGrammar. Only used to manage the priority queue and
+            count guesses, the coordinator doesn't generate any guesses
+
+            unit_size: The maximum number of guesses in a work unit
+
+            lease_timeout: The number of seconds a worker has to finish a
+            work unit
+
+            limit: (None/Int) The maximum number of guesses to hand out.
+            Ignored if None
+
+        Returns:
+            Coordinator
+        """
+
+        self.pcfg = pcfg
+        self.unit_size = unit_size
+        self.lease_timeout = lease_timeout
+        self.limit = limit
+
+        self.pqueue = PcfgQueue(pcfg)
+
+        # Used since every connection is handled in its own thread
+        self.lock = threading.Lock()
+
+        # Work units waiting to be handed out. Units that are handed out again
+        # go to the front so they are worked on first
+        self.pending = deque()
+
+        # The work units that are leased out, by lease id. The value is
+        # (unit, the time the lease times out)
+        self.leases = {}
+        self.next_lease = 0
+
+        # The number of guesses that have been split into work units
+        self.num_scheduled = 0
+
+        # The parse tree that is being split up, as [pt, start, end], or
+        # None if the next one needs to be popped off the queue
+        self.current = None
+
+        # If there are no parse trees left to split up
+        self.queue_done = False
+
+        # Stats for the throughput reports
+        self.start_time = time.time()
+        self.num_guesses = 0
+        self.num_units = 0
+        self.num_reissued = 0
+        self.num_workers = 0
+
+    def get_work(self, worker_leases):
+        """
+        Leases out the next work unit
+
+        Inputs:
+            worker_leases: The set of leases held by the connection asking for
+            work. The new lease is added to it
+
+        Returns:
+            message: The message to send back to the worker
+        """
+
+        with self.lock:
+            self._expire_leases()
+
+            if not self.pending:
+                self._split_next()
+
+            if not self.pending:
+                if self.leases:
+                    return {'type': 'wait', 'seconds': WAIT_TIME}
+                return {'type': 'done'}
+
+            unit = self.pending.popleft()
+            lease = self.next_lease
+            self.next_lease += 1
+            self.leases[lease] = (unit, time.time() + self.lease_timeout)
+            worker_leases.add(lease)
+
+            return {
+                'type': 'work',
+                'lease': lease,
+                'items': unit,
+            }
+
+    def complete(self, lease, num_guesses, worker_leases):
+        """
+        Marks a work unit as done
+
+        Inputs:
+            lease: The lease id of the work unit
+
+            num_guesses: The number of guesses the worker generated
+
+            worker_leases: The set of leases held by the connection
+
+        Returns:
+            None
+        """
+
+        with self.lock:
+            worker_leases.discard(lease)
+
+            # The lease may have timed out and been handed out again
+            if self.leases.pop(lease, None) is None:
+                return
+
+            self.num_guesses += num_guesses
+            self.num_units += 1
+
+    def release(self, worker_leases):
+        """
+        Hands out the work units held by a worker that disconnected again
+
+        Inputs:
+            worker_leases: The set of leases held by the connection
+
+        Returns:
+            None
+        """
+
+        with self.lock:
+            for lease in worker_leases:
+                if lease in self.leases:
+                    unit, _ = self.leases.pop(lease)
+                    self.pending.appendleft(unit)
+                    self.num_reissued += 1
+
+            worker_leases.clear()
+
+    def is_done(self):
+        """
+        Returns True if all the work units have been finished
+        """
+
+        with self.lock:
+            if self.pending or self.leases:
+                return False
+
+            self._split_next()
+            return not self.pending
+
+    def get_status(self):
+        """
+        Returns the aggregated throughput of the workers
+
+        Inputs:
+            None
+
+        Returns:
+            status: A dictionary of stats
+        """
+
+        with self.lock:
+            elapsed = time.time() - self.start_time
+            return {
+                'num_guesses': self.num_guesses,
+                'guesses_per_second': self.num_guesses / max(elapsed, 1e-9),
+                'num_units': self.num_units,
+                'num_leased': len(self.leases),
+                'num_reissued': self.num_reissued,
+                'num_workers': self.num_workers,
+                'elapsed': elapsed,
+            }
+
+    def print_status(self):
+        """
+        Prints the aggregated throughput of the workers to stderr
+        """
+
+        status = self.get_status()
+        print(
+            f"Workers: {status['num_workers']}, " +
+            f"Work Units Done: {status['num_units']:,}, " +
+            f"Leased: {status['num_leased']}, " +
+            f"Reissued: {status['num_reissued']}, " +
+            f"Guesses: {status['num_guesses']:,}, " +
+            f"Guesses/sec: {status['guesses_per_second']:,.0f}",
+            file=sys.stderr
+        )
+
+    def _expire_leases(self):
+        """
+        Hands out the work units whose leases have timed out again
+
+        Must be called with the lock held
+
+        Inputs:
+            None
+
+        Returns:
+            None
+        """
+
+        now = time.time()
+        expired = [lease for lease, (_, timeout) in self.leases.items() if timeout < now]
+        for lease in reversed(expired):
+            unit, _ = self.leases.pop(lease)
+            self.pending.appendleft(unit)
+            self.num_reissued += 1
+
+    def _split_next(self):
+        """
+        Pops parse trees off the priority queue to create the next work unit
+
+        Must be called with the lock held
+
+        Inputs:
+            None
+
+        Returns:
+            None
+        """
+
+        unit = []
+        unit_count = 0
+
+        while unit_count < self.unit_size:
+
+            if self.current is None:
+                if self.queue_done:
+                    break
+
+                if self.limit is not None and self.num_scheduled >= self.limit:
+                    self.queue_done = True
+                    break
+
+                pt_item = self.pqueue.next()
+                if pt_item is None:
+                    self.queue_done = True
+                    break
+
+                pt = pt_item['pt']
+                if pt[0][0][0] == 'M':
+                    total = self.pcfg.count_omen_guesses(pt)
+                else:
+                    total = self.pcfg.count_guesses(pt)
+
+                if self.limit is not None:
+                    total = min(total, self.limit - self.num_scheduled)
+                self.num_scheduled += total
+
+                # JSON doesn't have tuples
+                self.current = [[list(item) for item in pt], 0, total]
+
+            pt, start, end = self.current
+            count = min(self.unit_size - unit_count, end - start)
+            if count > 0:
+                unit.append([pt, start, count])
+                unit_count += count
+
+            self.current[1] += count
+            if self.current[1] >= end:
+                self.current = None
+
+        if unit:
+            self.pending.append(unit)
+
+
+class _CoordinatorHandler(socketserver.StreamRequestHandler):
+    """
+    Handles the messages from one worker connection
+    """
+
+    def handle(self):
+        coordinator = self.server.coordinator
+
+        # The leases this worker is holding
+        worker_leases = set()
+
+        with coordinator.lock:
+            coordinator.num_workers += 1
+
+        try:
+            for line in self.rfile:
+                message = json.loads(line)
+
+                if message['type'] == 'complete':
+                    coordinator.complete(message['lease'], message['num_guesses'], worker_leases)
+                    continue
+
+                response = coordinator.get_work(worker_leases)
+                self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+                if response['type'] == 'done':
+                    return
+
+        except (OSError, ValueError, KeyError):
+            pass
+
+        # If the worker disconnected without finishing, hand its work out again
+        finally:
+            coordinator.release(worker_leases)
+
+            with coordinator.lock:
+                coordinator.num_workers -= 1
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+def create_server(coordinator, address):
+    """
+    Creates the server that workers connect to
+
+    Inputs:
+        coordinator: The Coordinator
+
+        address: The address to listen on, (see parse_address)
+
+    Returns:
+        server: A socketserver. Call serve_forever() to start it
+    """
+
+    family, address = parse_address(address)
+
+    if family == socket.AF_UNIX:
+        # Clean up a socket left behind by an earlier run
+        if os.path.exists(address):
+            os.remove(address)
+        server = _UnixServer(address, _CoordinatorHandler)
+    else:
+        server = _TCPServer(address, _CoordinatorHandler)
+
+    server.coordinator = coordinator
+    return server
+
+
+def run_coordinator(pcfg, address, limit = None, unit_size = DEFAULT_UNIT_SIZE,
+    report_interval = DEFAULT_REPORT_INTERVAL):
+    """
+    Runs a coordinator until all the work units have been finished
+
+    Inputs:
+        pcfg: The PcfgGrammar
+
+        address: The address to listen on, (see parse_address)
+
+        limit: (None/Int) The maximum number of guesses to hand out
+
+        unit_size: The maximum number of guesses in a work unit
+
+        report_interval: The number of seconds between throughput reports
+
+    Returns:
+        None
+    """
+
+    coordinator = Coordinator(pcfg, unit_size = unit_size, limit = limit)
+    server = create_server(coordinator, address)
+
+    server_thread = threading.Thread(target = server.serve_forever, args = (0.5,))
+    server_thread.daemon = True
+    server_thread.start()
+
+    print("Waiting for workers to connect to " + str(address), file=sys.stderr)
+
+    try:
+        last_report = time.time()
+        while not coordinator.is_done():
+            time.sleep(0.5)
+            if time.time() - last_report >= report_interval:
+                coordinator.print_status()
+                last_report = time.time()
+
+    finally:
+        server.shutdown()
+        server.server_close()
+
+        family, address = parse_address(address)
+        if family == socket.AF_UNIX and os.path.exists(address):
+            os.remove(address)
+
+    print("All work units are done", file=sys.stderr)
+    coordinator.print_status()
+
+
+def run_worker(pcfg, address):
+    """
+    Connects to a coordinator and generates guesses for the work units it
+    hands out until there are none left
+
+    If an error occurs writing the guesses will pass back OSError
+
+    Inputs:
+        pcfg: The PcfgGrammar. Guesses are written to its output
+
+        address: The address of the coordinator, (see parse_address)
+
+    Returns:
+        num_guesses: The number of guesses generated
+    """
+
+    family, address = parse_address(address)
+
+    num_guesses = 0
+    with socket.socket(family, socket.SOCK_STREAM) as connection:
+        connection.connect(address)
+        rfile = connection.makefile('rb')
+        wfile = connection.makefile('wb')
+
+        while True:
+            wfile.write(json.dumps({'type': 'request'}).encode('utf-8') + b'\n')
+            wfile.flush()
+
+            line = rfile.readline()
+            if not line:
+                break
+
+            message = json.loads(line)
+            if message['type'] == 'done':
+                break
+
+            if message['type'] == 'wait':
+                time.sleep(message['seconds'])
+                continue
+
+            num_created = 0
+            for pt, start, count in message['items']:
+                pt = [tuple(item) for item in pt]
+                num_created += pcfg.create_guesses(pt, limit = count, start = start)
+
+            # Make sure the guesses are written before saying they are done
+            pcfg.output.flush()
+            num_guesses += num_created
+
+            wfile.write(json.dumps({
+                'type': 'complete',
+                'lease': message['lease'],
+                'num_guesses': num_created,
+            }).encode('utf-8') + b'\n')
+
+    return num_guesses
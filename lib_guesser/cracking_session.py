@@ -13,12 +13,26 @@ modes in the future
 
 
 import sys
+import os
+import io
 import time
+import zlib
 import threading # Used only for the "check for user input" threads
 
 # Local imports
 from .priority_queue import PcfgQueue
 from .status_report import StatusReport
+from .guess_workers import GuessWorkerPool
+from .guess_output import DEFAULT_BATCH_SIZE
+
+
+# When splitting a session across multiple nodes, parse trees with at least
+# this many guesses are split up by index range across all the nodes. Smaller
+# ones are given to a single node
+NODE_SPLIT_SIZE = 1000000
+
+# The default number of seconds between automatic saves of the session
+DEFAULT_CHECKPOINT_INTERVAL = 300
 
 
 class CrackingSession:
@@ -26,9 +40,44 @@ class CrackingSession:
     Used to manage a password cracking session
     """
 
-    def __init__(self, pcfg, save_config, save_filename):
+    def __init__(self, pcfg, save_config, save_filename, workers = 1, strict_order = True,
+        node = 0, nodes = 1, snapshot = False, checkpoint_interval = DEFAULT_CHECKPOINT_INTERVAL,
+        checkpoint_guesses = None, metrics = None):
         """
         Basic initialization function
+
+        Inputs:
+            pcfg: The PcfgGrammar to generate guesses with
+
+            save_config: The configparser holding the session info
+
+            save_filename: The file to save the session to
+
+            workers: The number of processes to generate guesses with. If 1,
+            guesses are generated in this process
+
+            strict_order: If False, guesses from worker processes are written
+            out as soon as they are ready rather than in probability order
+
+            node: Which part of the session to generate guesses for, from
+            0 to nodes - 1
+
+            nodes: The number of parts the session is split into. Every node
+            runs the same session, and between them they generate every guess
+            exactly once
+
+            snapshot: If True, the contents of the priority queue are saved
+            along with the session so it can be restored without rebuilding
+            the queue from the grammar
+
+            checkpoint_interval: (None/Int) The number of seconds between
+            automatic saves of the session. Disabled if None or 0
+
+            checkpoint_guesses: (None/Int) The number of guesses between
+            automatic saves of the session. Disabled if None or 0
+
+            metrics: (None/MetricsExporter) Exports the counters of the
+            session while it runs, (see metrics.py)
         """
 
         # Used to save a session's status to disk
@@ -48,32 +97,164 @@ class CrackingSession:
         # The actual Priority queue. Will be defined when run() is called
         self.pqueue = None
 
+        # Settings for generating guesses using multiple processes
+        self.workers = workers
+        self.strict_order = strict_order
+
+        # The pool of worker processes. Will be created when run() is called
+        self.worker_pool = None
+
+        # The file to save priority queue snapshots to, or None if they
+        # aren't saved
+        self.snapshot_filename = None
+        if snapshot:
+            self.snapshot_filename = save_filename[:-4] + '.pqs'
+
+        # Settings for splitting the session across multiple nodes
+        self.node = node
+        self.nodes = nodes
+
+        # The guess number this node stops at for the current OMEN level,
+        # or None if it creates the rest of the level
+        self.omen_end = None
+
+        # Settings for automatically saving the session. The time and guess
+        # count of the next save are set when run() is called
+        self.checkpoint_interval = checkpoint_interval or None
+        self.checkpoint_guesses = checkpoint_guesses or None
+        self.next_checkpoint_time = None
+        self.next_checkpoint_guesses = None
+
+        # The thread writing out a save in the background, if there is one
+        self.save_thread = None
+
+        # Exports the session's counters. Started when run() is called
+        self.metrics = metrics
+
     def run(self, load_session = False, limit = None):
         """
         Starts the cracking session and starts generating guesses
         """
 
-        ## New session
-        #
-        if not load_session:
+        # Start the worker processes before any other threads are started
+        if self.workers > 1:
+            self.worker_pool = GuessWorkerPool(
+                self.pcfg,
+                self.workers,
+                self.strict_order,
+                written_callback = self._guesses_written
+                )
+
+        try:
+            if self.metrics is not None:
+                self.metrics.start(self)
+
+            ## New session
+            #
+            if not load_session:
+
+                # Initalize the priority queue
+                self.pqueue = PcfgQueue(self.pcfg)
+
+                # Save the inital restore file
+                self._save_session()
+
+            ## Load session described in previously saved configfile
+            #
+            else:
+                print ("Restoring saved progress...",file=sys.stderr)
+                # Update the status report so things like probability coverage
+                # reflect what was done before
+                self.report.load(self.save_config)
+
+                # Update the priority queue to skip over pre-terminals that have
+                # been guessed previously. The workers split up the base
+                # structures between them
+                start_time = time.perf_counter()
+                self.pqueue = PcfgQueue(
+                    self.pcfg,
+                    self.save_config,
+                    worker_pool = self.worker_pool,
+                    snapshot_file = self.snapshot_filename
+                    )
+                print (f"Restored {len(self.pqueue.p_queue):,} pre-terminals in " +
+                    f"{time.perf_counter() - start_time:.2f} seconds",file=sys.stderr)
+
+            self._run(load_session, limit)
+
+        finally:
+            self._wait_for_save()
+
+            if self.metrics is not None:
+                self.metrics.stop()
+
+            if self.worker_pool is not None:
+                self.worker_pool.close()
+                self.worker_pool = None
+
+    def iter_guesses(self, limit = None, batch_size = DEFAULT_BATCH_SIZE, encoded = False):
+        """
+        Generates the guesses for a new session in probability order, in
+        batches, for Python code using the guesser in the same process
+
+        Unlike run() nothing is written to the output, and there is no user
+        input or saving of the session. Guesses are created in this process,
+        and the node settings are followed. The status report is updated as
+        each batch is handed out, so it can be used for status information
+
+        Inputs:
+            limit: (None/Int) The maximum number of guesses to create
 
-            # Initalize the priority queue
+            batch_size: The maximum number of guesses in each batch
+
+            encoded: (bool) If True, each batch is newline seperated guesses
+            encoded in the ruleset's encoding. Otherwise each batch is a list
+            of strings
+
+        Returns:
+            A generator that yields batches of guesses. Batches never span
+            more than one parse tree, (see self.report.pt_item)
+        """
+
+        if self.pqueue is None:
             self.pqueue = PcfgQueue(self.pcfg)
 
-            # Save the inital restore file
-            self._save_session()
+        while limit is None or limit > 0:
 
-        ## Load session described in previously saved configfile
-        #
-        else:
-            print ("Restoring saved progress...",file=sys.stderr)
-            # Update the status report so things like probability coverage
-            # reflect what was done before
-            self.report.load(self.save_config)
+            pt_item = self.pqueue.next()
+            if pt_item is None:
+                return
 
-            # Update the priority queue to skip over pre-terminals that have
-            # been guessed previously
-            self.pqueue = PcfgQueue(self.pcfg, self.save_config)
+            self.report.num_parse_trees += 1
+            self.report.pt_item = pt_item
+
+            start = 0
+            count = limit
+            if self.nodes > 1:
+                start, node_count = self._node_range(pt_item['pt'])
+                if node_count <= 0:
+                    continue
+
+                if count is None or node_count < count:
+                    count = node_count
+
+            for batch in self.pcfg.iter_guesses(pt_item['pt'], batch_size, count, start, encoded):
+                if encoded:
+                    num_guesses = batch.count(b'\n')
+                else:
+                    num_guesses = len(batch)
+
+                self._guesses_written(num_guesses, pt_item['prob'] * num_guesses)
+                if limit is not None:
+                    limit -= num_guesses
+
+                yield batch
+
+    def _run(self, load_session, limit):
+        """
+        Generates guesses until the priority queue is empty, the limit is
+        reached, or the user asks to exit
+        """
 
         print ("Starting to generate password guesses",file=sys.stderr)
         print ("Press [ENTER] to display a status output",file=sys.stderr)
@@ -85,6 +266,8 @@ class CrackingSession:
         user_thread.daemon = True  # thread dies when main thread (only non-daemon thread) exits.
         user_thread.start()
 
+        self._schedule_checkpoint()
+
         ## Check to see if we are restoring an OMEN session
         #
         if load_session:
@@ -100,8 +283,27 @@ class CrackingSession:
                 }
 
                 omen_guess_num = self.save_config.getint('guessing_info','omen_guess_number')
-                num_generated_guesses = self.pcfg.restore_omen(omen_guess_num, self.report.pt_item)
-                self.report.num_guesses += num_generated_guesses
+                partitioned = self.save_config.getboolean(
+                    'guessing_info',
+                    'omen_partitioned',
+                    fallback = False
+                    )
+
+                # Only create the rest of this node's part of the level
+                omen_limit = None
+                if self.save_config.has_option('guessing_info', 'omen_end'):
+                    self.omen_end = self.save_config.getint('guessing_info', 'omen_end')
+                    omen_limit = self.omen_end - omen_guess_num
+
+                if omen_limit is None or omen_limit > 0:
+                    num_generated_guesses = self.pcfg.restore_omen(
+                        omen_guess_num,
+                        self.report.pt_item,
+                        partitioned = partitioned,
+                        worker_pool = self.worker_pool,
+                        limit = omen_limit
+                        )
+                    self.report.num_guesses += num_generated_guesses
 
         # Keep running while the p_queue.next_function still has items in it
         while True:
@@ -113,7 +315,7 @@ class CrackingSession:
             if pt_item is None:
                 print ("Done processing the PCFG. No more guesses to generate",file=sys.stderr)
                 print ("Shutting down guessing session",file=sys.stderr)
-                return
+                break
 
             # Check to see if the program should exit based on user input
             #
@@ -129,19 +331,35 @@ class CrackingSession:
             #          sessions.
             #
             if not user_thread.is_alive():
+                # Make sure all the guesses before this pt have been written
+                if self.worker_pool is not None:
+                    try:
+                        self.worker_pool.drain()
+                    except OSError:
+                        return
+
                 print("Saving Session Info",file=sys.stderr)
                 self._save_session()
                 print("Exiting...",file=sys.stderr)
                 break
 
+            # Save the session every so often in case it gets killed. This is
+            # done at the same point as above so it can be restored the same
+            # way as when the user exits
+            if (self.next_checkpoint_time is not None and time.monotonic() >= self.next_checkpoint_time) or \
+                (self.next_checkpoint_guesses is not None and self.report.num_guesses >= self.next_checkpoint_guesses):
+                try:
+                    self._checkpoint()
+                except OSError:
+                    return
+
             # Update stats after the save might occur so we don't double count
             # them when restoring a session
             self.report.num_parse_trees += 1
             self.report.pt_item = pt_item
 
             try:
-                num_generated_guesses = self.pcfg.create_guesses(pt_item['pt'], limit = limit)
-                self.report.num_guesses += num_generated_guesses
+                num_generated_guesses = self._create_guesses(pt_item, limit)
 
                 # Check if a limit was defined
                 if limit:
@@ -150,30 +368,191 @@ class CrackingSession:
                         print("Limit reached. Exiting...",file=sys.stderr)
                         break
 
-                self.report.probability_coverage += pt_item['prob'] * num_generated_guesses
-
             # The receiving program is no longer accepting guesses
             # Usually occurs after all passwords have been cracked
             except OSError:
-                break
+                return
+
+        # Write out any guesses the worker processes are still working on
+        if self.worker_pool is not None:
+            try:
+                self.worker_pool.drain()
+            except OSError:
+                pass
 
         return
 
-    def _save_session(self):
+    def _create_guesses(self, pt_item, limit):
+        """
+        Creates the guesses for a parse tree, either in this process or by
+        handing it off to the worker processes
+
+        If an error occurs will pass back OSError
+
+        Inputs:
+            pt_item: The parse tree item popped off the priority queue
+
+            limit: (None/Int) The maximum number of guesses to create
+
+        Returns:
+            num_guesses: The number of guesses generated. When using worker
+            processes some of them may not have been written out yet. They
+            are added to the status report once they are
+        """
+
+        start = 0
+        if self.nodes > 1:
+            start, count = self._node_range(pt_item['pt'])
+            if count <= 0:
+                return 0
+
+            if limit is None or count < limit:
+                limit = count
+
+        if self.worker_pool is None:
+            num_guesses = self.pcfg.create_guesses(pt_item['pt'], limit = limit, start = start)
+            self._guesses_written(num_guesses, pt_item['prob'] * num_guesses)
+            return num_guesses
+
+        return self.worker_pool.submit(pt_item['pt'], limit, pt_item['prob'], start)
+
+    def _node_range(self, pt):
+        """
+        Finds the guesses this node should create for a parse tree
+
+        Every node gets the same parse trees in the same order, so this only
+        depends on the parse tree and the node settings:
+
+            - OMEN levels and large parse trees are split into one index
+              range for each node
+
+            - Smaller parse trees are given to a single node based on a hash
+              of the parse tree. Using a hash vs. the order the parse trees are
+              popped means restoring a session, (which can repeat a few parse
+              trees), doesn't change which node gets what
+
+        Inputs:
+            pt: The parse tree
+
+        Returns:
+            (start, count): The index of the first guess and the number of
+            guesses to create. count is 0 if this node doesn't create any
+        """
+
+        if pt[0][0][0] == 'M':
+            total = self.pcfg.count_omen_guesses(pt)
+
+        else:
+            total = self.pcfg.count_guesses(pt)
+            if total < NODE_SPLIT_SIZE:
+                if zlib.crc32(str(pt).encode('utf-8')) % self.nodes != self.node:
+                    return 0, 0
+                return 0, total
+
+        start = total * self.node // self.nodes
+        end = total * (self.node + 1) // self.nodes
+
+        if pt[0][0][0] == 'M':
+            self.omen_end = end
+
+        return start, end - start
+
+    def _guesses_written(self, num_guesses, probability_coverage):
+        """
+        Updates the status report after guesses have been written out
+
+        Inputs:
+            num_guesses: The number of guesses written
+
+            probability_coverage: The total probability of the guesses
+
+        Returns:
+            None
+        """
+
+        self.report.num_guesses += num_guesses
+        self.report.probability_coverage += probability_coverage
+
+    def _schedule_checkpoint(self):
+        """
+        Sets when the next automatic save should happen
+        """
+
+        if self.checkpoint_interval is not None:
+            self.next_checkpoint_time = time.monotonic() + self.checkpoint_interval
+
+        if self.checkpoint_guesses is not None:
+            self.next_checkpoint_guesses = self.report.num_guesses + self.checkpoint_guesses
+
+    def _checkpoint(self):
+        """
+        Automatically saves the session
+
+        Called at the same point in the main loop as saving the session when
+        the user exits. The session is written out in the background so
+        guess generation isn't held up
+
+        If an error occurs will pass back OSError
+
+        Inputs:
+            None
+
+        Returns:
+            None
+        """
+
+        # The save only counts guesses that have been written out, so wait
+        # for the workers to finish up
+        if self.worker_pool is not None:
+            self.worker_pool.drain()
+
+        self._save_session(background = True)
+        self._schedule_checkpoint()
+
+    def _save_session(self, background = False):
         """
         Saves a gussing session's status to disk
+
+        The state of the session is collected in the calling thread. The files
+        are then written to temporary files and renamed over the old ones, so
+        a session killed in the middle of saving still has its last save
+
+        Inputs:
+            background: If True, the files are written by a background thread.
+            If a previous background save is still running, this save is
+            skipped
+
+        Returns:
+            True: The session was saved, (or is being saved in the background)
+
+            False: The session could not be saved
         """
 
+        if self.save_thread is not None:
+            if background and self.save_thread.is_alive():
+                return False
+            self._wait_for_save()
+
         # Update the status report information
         self.report.update_save_config(self.save_config)
 
         # Update the guessing session information
         self.save_config.set('guessing_info', 'mode', self.mode)
 
+        # The files to write out as (filename, data)
+        files = []
+
         # Priority Queue Mode
         if self.mode == "priority_queue":
             self.pqueue.update_save_config(self.save_config)
 
+            # The snapshot is written first, so if the config can't be
+            # written the old config won't match it and it won't be used
+            if self.snapshot_filename is not None:
+                snapshot_id = self.save_config.getint('guessing_info', 'snapshot_id', fallback = 0) + 1
+                files.append((self.snapshot_filename, self.pqueue.create_snapshot(snapshot_id)))
+                self.save_config.set('guessing_info', 'snapshot_id', str(snapshot_id))
+
         #OMEN Guessing is going on so save the current state
         if self.pcfg.omen_exit:
             self.save_config.set(
@@ -181,18 +560,75 @@ class CrackingSession:
                 'omen_guess_number',
                 str(self.pcfg.omen_guess_num)
                 )
+            self.save_config.set(
+                'guessing_info',
+                'omen_partitioned',
+                str(self.pcfg.omen_partitioned)
+                )
+
+            if self.omen_end is not None:
+                self.save_config.set('guessing_info', 'omen_end', str(self.omen_end))
+
+        # Clear out the state of an OMEN level restored from an earlier save
+        else:
+            for option in ['omen_guess_number', 'omen_partitioned', 'omen_end']:
+                self.save_config.remove_option('guessing_info', option)
 
-        # Save the configuration file
+        config_file = io.StringIO()
+        self.save_config.write(config_file)
+        files.append((self.save_filename, config_file.getvalue()))
+
+        if background:
+            self.save_thread = threading.Thread(target=write_files, args=(files,))
+            self.save_thread.start()
+            return True
+
+        return write_files(files)
+
+    def _wait_for_save(self):
+        """
+        Waits for a save running in the background to finish
+        """
+
+        if self.save_thread is not None:
+            self.save_thread.join()
+            self.save_thread = None
+
+
+def write_files(files):
+    """
+    Writes out the files for a saved session
+
+    Each file is written to a temporary file first which is then renamed over
+    the old one, so the old file is kept if anything goes wrong
+
+    Inputs:
+        files: A list of (filename, data). data is either a string or bytes
+
+    Returns:
+        True: All the files were written
+
+        False: An error occurred writing one of the files
+    """
+
+    success = True
+
+    for filename, data in files:
+        temp_filename = filename + '.tmp'
         try:
-            with open(self.save_filename, 'w') as configfile:
-                self.save_config.write(configfile)
+            with open(temp_filename, 'wb' if isinstance(data, bytes) else 'w') as file:
+                file.write(data)
+                file.flush()
+                os.fsync(file.fileno())
+
+            os.replace(temp_filename, filename)
 
         except IOError as error:
             print (error)
-            print ("Error writing sessiong restore file: " + self.save_filename)
-            return False
+            print ("Error writing sessiong restore file: " + filename)
+            success = False
 
-        return True
+    return success
 
 
 def keypress(report, pcfg):
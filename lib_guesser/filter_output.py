@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+
+
+"""
+
+Name: PCFG_Guesser Output Filters
+
+Description: Outputs that sit in front of another output and drop some of
+the guesses before they are written out
+
+DedupOutput drops guesses that have already been written. The same guess can
+be created by more than one parse tree, for example 'password' from A8 and
+from A4 A4 with multiword splitting, or a keyboard walk that is also an alpha
+and digit string. Every duplicate that is written out is wasted work for the
+password cracker reading the guesses.
+
+ExcludeOutput drops guesses that are on a list of known passwords, such as
+the plaintexts in a potfile from an earlier session. There is no point
+writing out, (or hashing), a guess that has already cracked a hash.
+
+Guesses are filtered after they are encoded, so guesses created in this
+process and guesses sent back by worker processes are treated the same.
+
+"""
+
+
+import os
+import sys
+import bisect
+from array import array
+
+# Local imports
+from .guess_output import GuessOutput, DEFAULT_BATCH_SIZE
+from .bloom_filter import BloomFilter
+
+
+# The default memory limit for the duplicate filter, in MiB
+DEFAULT_DEDUP_MEMORY = 256
+
+# The size of the bitmap used to quickly skip guesses that are not on the
+# exclude list, in bits for each password on the list. This gives a false
+# positive rate around 6%, and only those guesses need a binary search
+EXCLUDE_BITMAP_BITS = 16
+
+# The average number of passwords in each bucket of the index into the
+# sorted hashes. Keeps the binary search to a few nearby entries
+EXCLUDE_BUCKET_SIZE = 16
+
+# Files with these extensions are loaded as potfiles, (hash:plaintext)
+POTFILE_EXTENSIONS = ('.pot', '.potfile')
+
+
+class FilterOutput(GuessOutput):
+    """
+    Base class for outputs that filter guesses before passing them on to
+    another output
+
+    Classes that inherit from this need to provide _filter()
+    """
+
+    def __init__(self, output, batch_size = DEFAULT_BATCH_SIZE):
+        """
+        Basic initialization function
+
+        Inputs:
+            output: The GuessOutput to write the remaining guesses to
+
+            batch_size: The number of guesses to buffer before filtering them
+
+        Returns:
+            FilterOutput
+        """
+
+        super().__init__(output.encoding, batch_size)
+
+        self.output = output
+
+    def create_worker_output(self):
+        # Filtering is done in this process, so the workers write to
+        # whatever the next output wants
+        return self.output.create_worker_output()
+
+    def close(self):
+        """
+        Filters any remaining guesses and closes the next output
+
+        Inputs:
+            None
+
+        Returns:
+            None
+        """
+
+        super().close()
+        self.output.close()
+
+    def _write_bytes(self, data):
+        """
+        Filters the encoded guesses and passes the rest to the next output
+
+        If an error occurs will pass back OSError
+
+        Inputs:
+            data: The newline seperated guesses
+
+        Returns:
+            None
+        """
+
+        lines = data.split(b'\n')
+        lines.pop()
+
+        num_lines = len(lines)
+        lines = self._filter(lines)
+
+        # Nothing was filtered, so skip joining the guesses back together
+        if len(lines) == num_lines:
+            self.output.write_encoded(data)
+
+        elif lines:
+            lines.append(b'')
+            self.output.write_encoded(b'\n'.join(lines))
+
+    def _filter(self, lines):
+        """
+        Returns the guesses to keep. Needs to be provided by child classes
+
+        Inputs:
+            lines: A list of encoded guesses
+
+        Returns:
+            lines: The guesses to pass on to the next output
+        """
+
+        raise NotImplementedError
+
+
+class DedupOutput(FilterOutput):
+    """
+    Drops guesses that have already been written out
+
+    Uses a Bloom filter so the memory used is bounded. This means a small
+    number of guesses that were never written out will be dropped too, (see
+    false_positive_rate()). Duplicates are only found within a single run,
+    so guesses written before a session was restored can be repeated
+    """
+
+    def __init__(self, output, max_memory = DEFAULT_DEDUP_MEMORY, batch_size = DEFAULT_BATCH_SIZE):
+        """
+        Basic initialization function
+
+        Inputs:
+            output: The GuessOutput to write the remaining guesses to
+
+            max_memory: The maximum memory to use for the filter, in MiB
+
+            batch_size: The number of guesses to buffer before filtering them
+
+        Returns:
+            DedupOutput
+        """
+
+        super().__init__(output, batch_size)
+
+        self.seen = BloomFilter(max_memory * 2**20)
+
+        # Statistics for the status report
+        self.num_duplicates = 0
+
+    def false_positive_rate(self):
+        """
+        Returns the estimated chance a new guess is dropped as a duplicate
+        """
+
+        return self.seen.false_positive_rate()
+
+    def _filter(self, lines):
+        new_lines = self.seen.filter_new(lines)
+        self.num_duplicates += len(lines) - len(new_lines)
+
+        return new_lines
+
+
+class ExcludeList:
+    """
+    A compact set of passwords to exclude
+
+    Stores the 64 bit hash of each password in a sorted array, (8 bytes a
+    password), which is checked with a binary search. A bitmap in front of
+    it skips the search for most guesses that aren't on the list, and an
+    index on the top bits of the hash narrows down the search for the rest
+
+    Passwords are hashed with Python's built in hash(), so the list can only
+    be used in the process that created it. Two different passwords with the
+    same 64 bit hash are very unlikely, but would both be excluded
+    """
+
+    def __init__(self, passwords):
+        """
+        Builds the list
+
+        Inputs:
+            passwords: An iterable of encoded passwords, (bytes)
+
+        Returns:
+            ExcludeList
+        """
+
+        values = array('Q', (hash(password) & 0xffffffffffffffff for password in passwords))
+        self.values = array('Q', sorted(values))
+
+        # The start of each bucket in the sorted values. Bucket b holds the
+        # values where value >> self.shift == b
+        num_bits = max((len(self.values) // EXCLUDE_BUCKET_SIZE).bit_length(), 1)
+        self.shift = 64 - num_bits
+        self.starts = array('Q', (
+            bisect.bisect_left(self.values, bucket << self.shift)
+            for bucket in range((1 << num_bits) + 1)
+            ))
+
+        num_bits = max(len(self.values) * EXCLUDE_BITMAP_BITS, 64)
+        self.bitmap_mask = (1 << (num_bits - 1).bit_length()) - 1
+        self.bitmap = bytearray((self.bitmap_mask + 1) // 8)
+        for value in self.values:
+            index = value & self.bitmap_mask
+            self.bitmap[index >> 3] |= 1 << (index & 7)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, password):
+        """
+        Checks if an encoded password is on the list
+        """
+
+        value = hash(password) & 0xffffffffffffffff
+        index = value & self.bitmap_mask
+        if not self.bitmap[index >> 3] >> (index & 7) & 1:
+            return False
+
+        bucket = value >> self.shift
+        end = self.starts[bucket + 1]
+        position = bisect.bisect_left(self.values, value, self.starts[bucket], end)
+
+        return position < end and self.values[position] == value
+
+    def memory(self):
+        """
+        Returns the number of bytes used by the list
+        """
+
+        return (len(self.values) + len(self.starts)) * 8 + len(self.bitmap)
+
+    def filter(self, passwords):
+        """
+        Removes the passwords that are on the list
+
+        Inputs:
+            passwords: A list of encoded passwords
+
+        Returns:
+            passwords: The passwords that aren't on the list, in the same
+            order
+        """
+
+        # Most guesses are ruled out by the bitmap. Since hash() is cached
+        # by bytes objects, hashing each guess twice is cheaper than the
+        # extra Python operations needed to keep the first result
+        bitmap = self.bitmap
+        mask = self.bitmap_mask
+        candidates = [password for password in passwords if bitmap[(hash(password) & mask) >> 3] >> (hash(password) & 7) & 1]
+        if not candidates:
+            return passwords
+
+        values = self.values
+        starts = self.starts
+        shift = self.shift
+        bisect_left = bisect.bisect_left
+
+        excluded = set()
+        for password in candidates:
+            value = hash(password) & 0xffffffffffffffff
+            bucket = value >> shift
+            end = starts[bucket + 1]
+            position = bisect_left(values, value, starts[bucket], end)
+            if position < end and values[position] == value:
+                excluded.add(password)
+
+        if not excluded:
+            return passwords
+
+        return [password for password in passwords if password not in excluded]
+
+
+def load_exclude_list(filename):
+    """
+    Loads the passwords to exclude from a wordlist or potfile
+
+    Files ending in .pot or .potfile are read as potfiles, where each line is
+    hash:plaintext. Hashcat's $HEX[...] plaintexts are decoded. Anything else
+    is read as a wordlist with one password per line
+
+    The passwords are compared to the encoded guesses as is, so they should
+    use the same encoding as the ruleset
+
+    Inputs:
+        filename: The file to load
+
+    Returns:
+        exclude_list: An ExcludeList of the passwords
+
+        If the file can't be read will pass back OSError
+    """
+
+    is_potfile = os.path.splitext(filename)[1].lower() in POTFILE_EXTENSIONS
+
+    passwords = []
+    num_skipped = 0
+    with open(filename, 'rb') as file:
+        for line in file:
+            line = line.rstrip(b'\r\n')
+
+            if is_potfile:
+                # Salted hashes can contain ':' as well, but the plaintext
+                # is the part after the first one for the common unsalted
+                # hash types
+                _, separator, line = line.partition(b':')
+                if not separator:
+                    num_skipped += 1
+                    continue
+
+                if line.startswith(b'$HEX[') and line.endswith(b']'):
+                    try:
+                        line = bytes.fromhex(line[5:-1].decode('ascii'))
+                    except ValueError:
+                        pass
+
+            if not line:
+                continue
+
+            passwords.append(line)
+
+    if num_skipped:
+        print(f"Skipped {num_skipped:,} lines in {filename} that were not in hash:plaintext format",file=sys.stderr)
+
+    return ExcludeList(passwords)
+
+
+class ExcludeOutput(FilterOutput):
+    """
+    Drops guesses that are on an exclude list
+    """
+
+    def __init__(self, output, exclude_list, batch_size = DEFAULT_BATCH_SIZE):
+        """
+        Basic initialization function
+
+        Inputs:
+            output: The GuessOutput to write the remaining guesses to
+
+            exclude_list: The ExcludeList of passwords to drop
+
+            batch_size: The number of guesses to buffer before filtering them
+
+        Returns:
+            ExcludeOutput
+        """
+
+        super().__init__(output, batch_size)
+
+        self.exclude_list = exclude_list
+
+        # Statistics for the status report
+        self.num_excluded = 0
+
+    def _filter(self, lines):
+        new_lines = self.exclude_list.filter(lines)
+        self.num_excluded += len(lines) - len(new_lines)
+
+        return new_lines
@@ -0,0 +1,532 @@
+#!/usr/bin/env python3
+
+
+"""
+
+Name: PCFG Grammar Cache
+
+Description: Saves a compiled copy of a ruleset to a single binary file so it
+doesn't have to be re-parsed from the text files every time a program starts
+
+The cache is saved next to the config.ini of the ruleset. It holds multiple
+named sections, (for example the PCFG grammar used by the guesser and the
+OMEN rules), since different programs load different parts of a ruleset.
+
+The whole cache is tied to the UUID of the ruleset and the modification times
+of every file in the ruleset, so retraining or editing a ruleset will cause
+the cache to be rebuilt. Each section is also tied to the options it was
+created with, (such as skip_case), so the same ruleset loaded with different
+options gets different sections.
+
+Since the sections are pickled, loading a cache someone else created could
+run arbitrary code. Rulesets are often downloaded or shared, so the header
+and every section are signed with an HMAC using a secret key that is kept in
+the user's own cache directory, (see KEY_FILENAME). Nothing is unpickled
+unless its signature matches, so a cache can only be loaded by the user who
+created it. Caches owned by a different user are also ignored.
+
+File layout:
+
+    MAGIC
+    header length, (8 bytes, little endian)
+    HMAC of the header
+    pickled header: {'key': ruleset key, 'sections': {(name, options): section info}}
+    pickled section data, one after another
+
+Section offsets are from the end of the header. The section info includes
+the HMAC of each section
+
+The main function that will be called by other programs is:
+    load_cached(base_directory, name, options, build_function)
+
+"""
+
+
+import sys
+import os
+import configparser
+import gc
+import hashlib
+import hmac
+import mmap
+import pickle
+import secrets
+import struct
+import tempfile
+
+
+# The name of the cache file saved in the ruleset directory
+CACHE_FILENAME = "grammar.cache"
+
+# Identifies the file as a grammar cache. Change the version number if the
+# layout or the format of any of the sections change
+MAGIC = b'PCFGCACHE\x00\x03'
+
+# Used to save the length of the header
+HEADER_LENGTH = struct.Struct('<Q')
+
+# The hash used to sign the cache, and the size of the signatures
+DIGEST = hashlib.sha256
+DIGEST_SIZE = DIGEST().digest_size
+
+# The file holding the secret key the cache is signed with. It is saved in
+# the user's cache directory, not the ruleset
+KEY_FILENAME = os.path.join("pcfg_cracker", "grammar_cache.key")
+
+
+def load_cached(base_directory, name, options, build_function):
+    """
+    Loads a section from the grammar cache, building it if needed
+
+    Inputs:
+        base_directory: The directory of the ruleset
+
+        name: The name of the section, (String)
+
+        options: Anything that changes what build_function returns, (for
+        example skip_case). Needs to be able to be pickled and hashed. The
+        same section can be cached with different options
+
+        build_function: Called with no arguments to load the section from the
+        ruleset if it isn't cached. If it returns None, nothing is saved
+
+    Returns:
+        data: The loaded section
+    """
+
+    cache = GrammarCache(base_directory)
+
+    found, data = cache.load(name, options)
+    if found:
+        return data
+
+    data = build_function()
+    if data is not None:
+        cache.save(name, options, data)
+
+    return data
+
+
+def _load_secret_key():
+    """
+    Loads the secret key used to sign caches, creating it if needed
+
+    The key is saved in $XDG_CACHE_HOME, (or ~/.cache), and is only readable
+    by the current user
+
+    Inputs:
+        None
+
+    Returns:
+        secret_key: The key, (bytes)
+
+        None: If the key couldn't be loaded or created
+    """
+
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    filename = os.path.join(cache_home, KEY_FILENAME)
+
+    try:
+        with open(filename, 'rb') as file:
+            secret_key = file.read()
+        if len(secret_key) == DIGEST_SIZE:
+            return secret_key
+
+    except FileNotFoundError:
+        pass
+
+    except OSError:
+        return None
+
+    # Create a new key. If another program creates one at the same time, use
+    # theirs
+    try:
+        os.makedirs(os.path.dirname(filename), mode = 0o700, exist_ok = True)
+        file_handle = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(file_handle, 'wb') as file:
+            file.write(secrets.token_bytes(DIGEST_SIZE))
+
+    except FileExistsError:
+        pass
+
+    except OSError:
+        return None
+
+    try:
+        with open(filename, 'rb') as file:
+            secret_key = file.read()
+
+    except OSError:
+        return None
+
+    if len(secret_key) != DIGEST_SIZE:
+        return None
+
+    return secret_key
+
+
+def _unpickle(blob):
+    """
+    Unpickles a section of the cache
+
+    The garbage collector is paused while doing so. Otherwise it keeps
+    scanning the millions of objects being created, which can take longer
+    than the unpickling itself
+
+    Inputs:
+        blob: The pickled data
+
+    Returns:
+        data: The unpickled data
+    """
+
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return pickle.loads(blob)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+class GrammarCache:
+    """
+    Reads and writes the grammar cache file for a ruleset
+    """
+
+    def __init__(self, base_directory):
+        """
+        Basic initialization function
+
+        Inputs:
+            base_directory: The directory of the ruleset
+
+        Returns:
+            GrammarCache
+        """
+
+        self.base_directory = base_directory
+        self.filename = os.path.join(base_directory, CACHE_FILENAME)
+
+        # Identifies the version of the ruleset the cache is for
+        self.key = self._ruleset_key()
+
+        # Used to sign the cache. If None the cache isn't used
+        self.secret_key = _load_secret_key()
+
+        # The last header that was read, and the file it was read from. Lets
+        # a lot of small sections be loaded without re-reading the header
+        self.header = None
+        self.header_file = None
+
+    def load(self, name, options):
+        """
+        Loads a section from the cache
+
+        Inputs:
+            name: The name of the section
+
+            options: The options the section needs to have been created with
+
+        Returns:
+            (found, data): found is False if the section isn't cached or the
+            cache is out of date
+        """
+
+        try:
+            with open(self.filename, 'rb') as file:
+                if not self._is_trusted(file):
+                    return False, None
+
+                # Identifies the file, since the cache may be replaced at any
+                # time by another program
+                stats = os.fstat(file.fileno())
+                header_file = (stats.st_dev, stats.st_ino, stats.st_size, stats.st_mtime_ns)
+
+                with mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as cache_map:
+                    if header_file == self.header_file:
+                        header, data_start = self.header
+                    else:
+                        header, data_start = self._read_header(cache_map)
+                        if header is None or header['key'] != self.key:
+                            return False, None
+
+                        self.header = (header, data_start)
+                        self.header_file = header_file
+
+                    section = header['sections'].get((name, options))
+                    if section is None:
+                        return False, None
+
+                    start = data_start + section['offset']
+                    with memoryview(cache_map) as view:
+                        with view[start:start + section['length']] as blob:
+                            if not self._check_signature(blob, section['mac']):
+                                return False, None
+                            return True, _unpickle(blob)
+
+        # Treat any problem with the cache as it not existing. It'll be
+        # rebuilt from the ruleset
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+            return False, None
+
+    def save(self, name, options, data):
+        """
+        Saves a section to the cache
+
+        Other sections already in the cache are kept if they are for the same
+        version of the ruleset. The new cache is written to a temp file and
+        then renamed so other programs never see a partially written cache
+
+        Inputs:
+            name: The name of the section
+
+            options: The options the section was created with
+
+            data: The section to save
+
+        Returns:
+            True: The cache was saved
+
+            False: The cache could not be saved, (for example the ruleset
+            directory is read only)
+        """
+
+        return self.save_sections({(name, options): data})
+
+    def save_sections(self, sections):
+        """
+        Saves multiple sections to the cache at once
+
+        Saving a lot of small sections one at a time would rewrite the whole
+        cache for each one
+
+        Inputs:
+            sections: A dictionary of {(name, options): data}
+
+        Returns:
+            True: The cache was saved
+
+            False: The cache could not be saved
+        """
+
+        if self.secret_key is None:
+            return False
+
+        blobs = self._read_sections()
+        for section_key, data in sections.items():
+            blobs[section_key] = pickle.dumps(data, protocol = pickle.HIGHEST_PROTOCOL)
+
+        # Work out where every section will be saved
+        header = {'key': self.key, 'sections': {}}
+        offset = 0
+        for section_key, blob in blobs.items():
+            header['sections'][section_key] = {
+                'offset': offset,
+                'length': len(blob),
+                'mac': self._sign(blob),
+            }
+            offset += len(blob)
+
+        raw_header = pickle.dumps(header, protocol = pickle.HIGHEST_PROTOCOL)
+
+        temp_name = None
+        try:
+            file_handle, temp_name = tempfile.mkstemp(
+                dir = self.base_directory,
+                prefix = '.' + CACHE_FILENAME + '.'
+            )
+            with os.fdopen(file_handle, 'wb') as file:
+                file.write(MAGIC)
+                file.write(HEADER_LENGTH.pack(len(raw_header)))
+                file.write(self._sign(raw_header))
+                file.write(raw_header)
+                for blob in blobs.values():
+                    file.write(blob)
+
+            # mkstemp only gives the owner access, but the cache should be
+            # readable by anyone who can read the ruleset
+            os.chmod(temp_name, 0o644)
+            os.replace(temp_name, self.filename)
+
+        except OSError as error:
+            print(f"Could not save the grammar cache: {error}", file=sys.stderr)
+            try:
+                if temp_name is not None:
+                    os.remove(temp_name)
+            except OSError:
+                pass
+            return False
+
+        return True
+
+    def is_writable(self):
+        """
+        Checks if it is possible to save the cache
+
+        Inputs:
+            None
+
+        Returns:
+            True: The cache can be saved
+
+            False: There is no key to sign it with, or the ruleset directory
+            is read only
+        """
+
+        return self.secret_key is not None and os.access(self.base_directory, os.W_OK)
+
+    def _read_sections(self):
+        """
+        Reads the raw sections from the current cache if it is up to date
+
+        Inputs:
+            None
+
+        Returns:
+            blobs: A dictionary of {(name, options): pickled data}
+        """
+
+        blobs = {}
+        try:
+            with open(self.filename, 'rb') as file:
+                if not self._is_trusted(file):
+                    return {}
+
+                with mmap.mmap(file.fileno(), 0, access = mmap.ACCESS_READ) as cache_map:
+                    header, data_start = self._read_header(cache_map)
+                    if header is None or header['key'] != self.key:
+                        return {}
+
+                    for section_key, section in header['sections'].items():
+                        start = data_start + section['offset']
+                        blob = cache_map[start:start + section['length']]
+                        if self._check_signature(blob, section['mac']):
+                            blobs[section_key] = blob
+
+        except (OSError, ValueError, EOFError, pickle.UnpicklingError):
+            return {}
+
+        return blobs
+
+    def _read_header(self, cache_map):
+        """
+        Reads the header of the cache
+
+        Inputs:
+            cache_map: The mmap of the cache file
+
+        Returns:
+            (header, data_start): The header dictionary and where the section
+            data starts. header is None if this isn't a valid cache file, or
+            it wasn't signed with this user's key
+        """
+
+        if cache_map[:len(MAGIC)] != MAGIC:
+            return None, 0
+
+        start = len(MAGIC) + HEADER_LENGTH.size
+        header_length = HEADER_LENGTH.unpack(cache_map[len(MAGIC):start])[0]
+
+        mac = cache_map[start:start + DIGEST_SIZE]
+        start += DIGEST_SIZE
+
+        raw_header = cache_map[start:start + header_length]
+        if not self._check_signature(raw_header, mac):
+            return None, 0
+
+        return pickle.loads(raw_header), start + header_length
+
+    def _is_trusted(self, file):
+        """
+        Checks if a cache file can be loaded at all
+
+        Inputs:
+            file: The open cache file
+
+        Returns:
+            True: The file is owned by the current user and there is a key to
+            check its signatures with
+
+            False: The cache should be ignored
+        """
+
+        if self.secret_key is None:
+            return False
+
+        # Not all operating systems have user ids
+        if hasattr(os, 'getuid') and os.fstat(file.fileno()).st_uid != os.getuid():
+            return False
+
+        return True
+
+    def _sign(self, blob):
+        """
+        Creates the signature for part of the cache
+
+        Inputs:
+            blob: The data to sign
+
+        Returns:
+            mac: The signature, (bytes)
+        """
+
+        return hmac.new(self.secret_key, blob, DIGEST).digest()
+
+    def _check_signature(self, blob, mac):
+        """
+        Checks the signature for part of the cache
+
+        Inputs:
+            blob: The signed data
+
+            mac: The signature saved in the cache
+
+        Returns:
+            True: The signature matches
+
+            False: The data was changed, or signed by someone else
+        """
+
+        return hmac.compare_digest(self._sign(blob), mac)
+
+    def _ruleset_key(self):
+        """
+        Creates the key that identifies the current version of the ruleset
+
+        Based on the ruleset's UUID and the size and modification time of all
+        of the files in the ruleset
+
+        Inputs:
+            None
+
+        Returns:
+            key: A tuple of (uuid, digest)
+        """
+
+        config = configparser.ConfigParser()
+        try:
+            config.read(os.path.join(self.base_directory, "config.ini"))
+            uuid = config.get('TRAINING_DATASET_DETAILS', 'uuid')
+        except configparser.Error:
+            uuid = None
+
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(self.base_directory):
+            dirs.sort()
+            for filename in sorted(files):
+
+                # Skip the cache itself
+                if filename.startswith(CACHE_FILENAME) or filename.startswith('.' + CACHE_FILENAME):
+                    continue
+
+                full_path = os.path.join(root, filename)
+                try:
+                    stats = os.stat(full_path)
+                except OSError:
+                    continue
+
+                relative_path = os.path.relpath(full_path, self.base_directory)
+                digest.update(f"{relative_path}\t{stats.st_size}\t{stats.st_mtime_ns}\n".encode('utf-8', 'surrogateescape'))
+
+        return (uuid, digest.hexdigest())
@@ -14,12 +14,25 @@ import os
 import configparser
 import json
 import codecs
+import functools
+
+# Local imports
+from .grammar_cache import GrammarCache
 
 
 def load_grammar(rule_name, base_directory, version, skip_brute, skip_case, base_structure_folder):
     """
     Main function to load up a grammar from disk
 
+    The terminals are not read in up front. Instead a LazyGrammar is returned
+    that loads each terminal the first time it is used. That way short
+    sessions only pay to load the terminals they actually make guesses with
+
+    If the ruleset can be cached, the first time it is loaded everything is
+    read in and saved to the grammar cache. After that the base structures
+    and the probabilities of every terminal come from the cache, and the
+    terminals themselves are loaded from the cache when they are first used
+
     Note, will pass exceptions and errors back up to the calling program
 
     Inputs:
@@ -39,8 +52,9 @@ def load_grammar(rule_name, base_directory, version, skip_brute, skip_case, base
 
     Returns:
         
-        grammar: A loaded PCFG Grammar, minus the (S)tart item and base structures.
-        Mostly terminals, but some can be transforms like capitalization masks.
+        grammar: A LazyGrammar holding the PCFG Grammar, minus the (S)tart item
+        and base structures. Mostly terminals, but some can be transforms like
+        capitalization masks.
         Takes the form of a dictionary with the variable name, and
         a sub-dictionary of the form:
         
@@ -69,13 +83,34 @@ def load_grammar(rule_name, base_directory, version, skip_brute, skip_case, base
     if not _load_config(ruleset_info, base_directory, config):
         raise Exception
 
-    # Holds all of the grammar with the exception of the base structures and
-    # OMEN probabilities
-    grammar = {}
-
-    if not _load_terminals(ruleset_info, grammar, base_directory, config, skip_case):
+    # Functions to load each terminal from the text files of the ruleset
+    loaders = {}
+    if not _find_terminals(ruleset_info, loaders, base_directory, config, skip_case):
         raise Exception
 
+    # The options the grammar was loaded with. Used to tell cached copies
+    # apart from each other
+    options = (rule_name, version, skip_brute, skip_case, base_structure_folder)
+
+    cache = GrammarCache(base_directory)
+
+    # The base structures and the probabilities of all the terminals are
+    # saved together in the cache. Each terminal is saved in its own section
+    found, data = cache.load('pcfg_grammar', options)
+    if found:
+        probabilities, base_structures = data
+
+        cached_loaders = {}
+        for name, loader in loaders.items():
+            cached_loaders[name] = functools.partial(
+                _load_cached_terminal,
+                cache,
+                (name,) + options,
+                loader
+                )
+
+        return LazyGrammar(cached_loaders, probabilities), base_structures, ruleset_info
+
     # Holds the base structures
     base_structures = []
     if not _load_base_structures(
@@ -86,9 +121,122 @@ def load_grammar(rule_name, base_directory, version, skip_brute, skip_case, base
 
         raise Exception
 
+    # Holds all of the grammar with the exception of the base structures and
+    # OMEN probabilities
+    grammar = LazyGrammar(loaders)
+
+    # If the cache can't be saved, (for example the ruleset is read only),
+    # load the terminals from the text files as they are needed
+    if not cache.is_writable():
+        return grammar, base_structures, ruleset_info
+
+    # Otherwise load everything now so the cache only needs to be written once
+    grammar.load_all()
+
+    sections = {}
+    probabilities = {}
+    for name, section in grammar.items():
+        sections[('pcfg_terminal', (name,) + options)] = section
+        probabilities[name] = [item['prob'] for item in section]
+
+    sections[('pcfg_grammar', options)] = (probabilities, base_structures)
+    cache.save_sections(sections)
+
     return grammar, base_structures, ruleset_info
 
 
+class LazyGrammar(dict):
+    """
+    A grammar dictionary that loads each terminal the first time it is used
+
+    Looks like a normal dictionary of {name: [items]} to the rest of the code.
+    Looking up a terminal that hasn't been loaded yet calls its loader
+    """
+
+    def __init__(self, loaders, probabilities = None):
+        """
+        Basic initialization function
+
+        Inputs:
+            loaders: A dictionary of {name: function} where each function
+            takes no arguments and returns the items of that terminal, or None
+            if the terminal could not be loaded
+
+            probabilities: (Optional) A dictionary of {name: [prob, ...]}
+            with the probability of every item for each terminal. Lets the
+            base structures be set up without loading the terminals
+
+        Returns:
+            LazyGrammar
+        """
+
+        super().__init__()
+
+        self.loaders = loaders
+
+        if probabilities is None:
+            probabilities = {}
+        self.probabilities = probabilities
+
+    def __missing__(self, name):
+        """
+        Loads a terminal the first time it is looked up
+
+        Inputs:
+            name: The name of the terminal, (for example 'D2')
+
+        Returns:
+            section: The list of items for the terminal
+        """
+
+        loader = self.loaders.get(name)
+        if loader is None:
+            raise KeyError(name)
+
+        section = loader()
+        if section is None:
+            print(f"Error loading the terminals for {name}", file=sys.stderr)
+            raise Exception
+
+        self[name] = section
+        return section
+
+    def __contains__(self, name):
+        return super().__contains__(name) or name in self.loaders
+
+    def get_probabilities(self, name):
+        """
+        Returns the probability of every item for a terminal
+
+        Only loads the terminal if the probabilities weren't saved in the cache
+
+        Inputs:
+            name: The name of the terminal
+
+        Returns:
+            probabilities: A list of the probability of each item
+        """
+
+        if name in self.probabilities:
+            return self.probabilities[name]
+
+        return [item['prob'] for item in self[name]]
+
+    def load_all(self):
+        """
+        Loads every terminal that hasn't been loaded yet
+
+        Inputs:
+            None
+
+        Returns:
+            None
+        """
+
+        for name in self.loaders:
+            self[name]
+
+
 def load_omen_keyspace(base_directory):
     """
     Loads the OMEN keyspace information from file
@@ -243,21 +391,24 @@ def _load_base_structures(base_structures, base_directory, skip_brute, base_stru
     return True
 
 
-def _load_terminals(ruleset_info, grammar, base_directory, config, skip_case):
+def _find_terminals(ruleset_info, loaders, base_directory, config, skip_case):
     """
-    Loads most of the terminals for the grammar
+    Finds all of the terminals for the grammar
 
     This includes things like alpha strings, digits, keyboard patterns, etc
 
+    The terminals aren't loaded here. Instead a function to load each one is
+    saved so they can be loaded as they are needed
+
     Inputs:
         
         ruleset_info: A dictionary containing some general information about the
         ruleset
 
-        grammar: A dictionary to return the data in
+        loaders: A dictionary to return the data in
         Takes the form of a dictionary with the variable name, and
-        a list of (value, prob) tuples in probability order.
-        For example {'D2':[('11',0.3),('12',0.2),....]}
+        a function that returns a list of items in probability order.
+        For example {'D2':load_function}
 
         base_directory: The base directory to load the rules from
 
@@ -276,18 +427,22 @@ def _load_terminals(ruleset_info, grammar, base_directory, config, skip_case):
     # Quick way to reference variables
     encoding = ruleset_info['encoding']
 
-    # Load the alpha terminals
-    if not _load_from_multiple_files(grammar, config['BASE_A'], base_directory, encoding):
+    # Find the alpha terminals
+    if not _find_multiple_files(loaders, config['BASE_A'], base_directory, encoding):
         print("Error loading alpha terminals")
         return False
 
-    # Load the capitalziaton masks, (if the user wants to apply case mangling)
+    # Find the capitalziaton masks, (if the user wants to apply case mangling)
+    #
+    # The masks are precompiled so they don't need to be parsed character by
+    # character for every guess
     if not skip_case:
-        if not _load_from_multiple_files(
-                grammar,
+        if not _find_multiple_files(
+                loaders,
                 config['CAPITALIZATION'],
                 base_directory,
-                encoding):
+                encoding,
+                compile_masks = True):
 
             print("Error loading capitalization masks")
             return False
@@ -298,58 +453,162 @@ def _load_terminals(ruleset_info, grammar, base_directory, config, skip_case):
         for file in filenames:
             name = config['CAPITALIZATION'].get('name') + file.split('.')[0]
             length = int(file.split('.')[0])
-            item = {
-                        'values': ['L'*length],
-                        'prob': 1.0
-                    }
-            grammar[name] = [item]
+            loaders[name] = functools.partial(_lowercase_masks, length)
 
-    # Load the digit terminals
-    if not _load_from_multiple_files(grammar, config['BASE_D'], base_directory, encoding):
+    # Find the digit terminals
+    if not _find_multiple_files(loaders, config['BASE_D'], base_directory, encoding):
         print("Error loading digit terminals")
         return False
 
-    # Load the 'other' terminals
-    if not _load_from_multiple_files(grammar, config['BASE_O'], base_directory, encoding):
+    # Find the 'other' terminals
+    if not _find_multiple_files(loaders, config['BASE_O'], base_directory, encoding):
         print("Error loading other/special terminals")
         return False
 
-    # Load the keyboard terminals
-    if not _load_from_multiple_files(grammar, config['BASE_K'], base_directory, encoding):
+    # Find the keyboard terminals
+    if not _find_multiple_files(loaders, config['BASE_K'], base_directory, encoding):
         print("Error loading keyboard terminals")
         return False
 
-    # Load the years
-    if not _load_from_multiple_files(grammar, config['BASE_Y'], base_directory, encoding):
+    # Find the years
+    if not _find_multiple_files(loaders, config['BASE_Y'], base_directory, encoding):
         print("Error loading year terminals")
         return False
 
-    # Load Context Sensitive replacements
-    if not _load_from_multiple_files(grammar, config['BASE_X'], base_directory, encoding):
+    # Find Context Sensitive replacements
+    if not _find_multiple_files(loaders, config['BASE_X'], base_directory, encoding):
         print("Error loading context sensitive terminals")
         return False
 
-    # Load OMEN level probabilities
-    full_path = os.path.join(base_directory, "Omen", "pcfg_omen_prob.txt")
-    grammar['M'] = []
-    if not _load_from_file(grammar['M'], full_path, encoding):
-        return False
+    # Find OMEN level probabilities, e-mail replacements and website replacements
+    for name, directory, file in [
+            ('M', "Omen", "pcfg_omen_prob.txt"),
+            ('E', "Emails", "email_providers.txt"),
+            ('W', "Websites", "website_hosts.txt")]:
 
-    # Load e-mail replacements
-    full_path = os.path.join(base_directory, "Emails", "email_providers.txt")
-    grammar['E'] = []
-    if not _load_from_file(grammar['E'], full_path, encoding):
-        return False
-
-    # Load website replacements
-    full_path = os.path.join(base_directory, "Websites", "website_hosts.txt")
-    grammar['W'] = []
-    if not _load_from_file(grammar['W'], full_path, encoding):
-        return False
+        full_path = os.path.join(base_directory, directory, file)
+        if not _find_file(loaders, name, full_path, encoding):
+            return False
 
     return True
 
 
+def _lowercase_masks(length):
+    """
+    Creates the capitalization masks used when case mangling is turned off
+
+    Inputs:
+        length: The length of the mask
+
+    Returns:
+        grammar_section: A single lowercase mask of the given length
+    """
+
+    grammar_section = [{
+        'values': ['L'*length],
+        'prob': 1.0
+    }]
+
+    compile_capitalization_masks(grammar_section)
+
+    return grammar_section
+
+
+def _load_terminal(filename, encoding, compile_masks):
+    """
+    Loads a single terminal from its text file
+
+    Inputs:
+        filename: The full filename of the terminal
+
+        encoding: The encoding to use to parse the file
+
+        compile_masks: (Bool) If True, the file holds capitalization masks
+
+    Returns:
+        grammar_section: The list of items for the terminal
+
+        None: If an error occured loading the file
+    """
+
+    grammar_section = []
+    if not _load_from_file(grammar_section, filename, encoding):
+        return None
+
+    if compile_masks:
+        compile_capitalization_masks(grammar_section)
+
+    return grammar_section
+
+
+def _load_cached_terminal(cache, options, load_function):
+    """
+    Loads a single terminal from the grammar cache
+
+    If it isn't in the cache, (for example the cache was rebuilt by another
+    program after the grammar was loaded), it is loaded from the text file
+
+    Inputs:
+        cache: The GrammarCache for the ruleset
+
+        options: The options of the terminal's section in the cache
+
+        load_function: Loads the terminal from the text file
+
+    Returns:
+        grammar_section: The list of items for the terminal
+
+        None: If an error occured loading the terminal
+    """
+
+    found, grammar_section = cache.load('pcfg_terminal', options)
+    if found:
+        return grammar_section
+
+    return load_function()
+
+
+def compile_capitalization_masks(grammar_section):
+    """
+    Precompiles capitalization masks into the runs of characters to uppercase
+
+    Adds a 'plans' list to each item in the grammar section that lines up with
+    its 'values'. Each plan is a tuple of (start, end) slices that need to be
+    uppercased. For example:
+
+    .. code-block:: python
+
+        {
+            'values':['ULLU', 'LLLL', 'UUUU'],
+            'plans':[((0,1),(3,4)), (), ((0,4),)],
+            'prob':0.3
+        }
+
+    Inputs:
+        grammar_section: A list of the capitalization mask items for a length
+
+    Returns:
+        None
+    """
+
+    for item in grammar_section:
+        item['plans'] = []
+        for mask in item['values']:
+            runs = []
+            start = None
+            for index, value in enumerate(mask):
+                if value != 'L' and start is None:
+                    start = index
+                elif value == 'L' and start is not None:
+                    runs.append((start, index))
+                    start = None
+
+            if start is not None:
+                runs.append((start, len(mask)))
+
+            item['plans'].append(tuple(runs))
+
+
 def _load_config(ruleset_info, base_directory, config):
     """
     Loads the main config from a ruleset
@@ -408,13 +667,14 @@ def _load_config(ruleset_info, base_directory, config):
     return True
 
 
-def _load_from_multiple_files(grammar, config, base_directory, encoding):
+def _find_multiple_files(loaders, config, base_directory, encoding, compile_masks = False):
     """
-    Loads grammar information from multiple files for length specified terminals
+    Finds grammar information from multiple files for length specified terminals
 
     Inputs:
         
-        grammar: A Python dictionary to save the grammar to
+        loaders: A Python dictionary to save the load function for each
+        terminal to
 
         config: The grammar/ruleset config
 
@@ -422,11 +682,13 @@ def _load_from_multiple_files(grammar, config, base_directory, encoding):
 
         encoding: What file encoding was used to save the grammar/ruleset
 
+        compile_masks: (Bool) If True, the files hold capitalization masks
+
     Returns:
         
-        True: If everything was loaded ok
+        True: If all the files were found
 
-        False: If an error occured loading the ruleset
+        False: If a file of the ruleset is missing
 
     """
 
@@ -437,16 +699,46 @@ def _load_from_multiple_files(grammar, config, base_directory, encoding):
     for file in filenames:
         full_path = os.path.join(base_directory, directory, file)
 
-        # Initialize the structure to hold the data
         name = config.get('name') + file.split('.')[0]
-        grammar[name] = []
 
-        if not _load_from_file(grammar[name], full_path, encoding):
+        if not _find_file(loaders, name, full_path, encoding, compile_masks):
             return False
 
     return True
 
 
+def _find_file(loaders, name, filename, encoding, compile_masks = False):
+    """
+    Saves the load function for a terminal if its file exists
+
+    Inputs:
+        
+        loaders: A Python dictionary to save the load function to
+
+        name: The name of the terminal
+
+        filename: The full filename of the grammar file
+
+        encoding: The encoding to use to parse the file
+
+        compile_masks: (Bool) If True, the file holds capitalization masks
+
+    Returns:
+        
+        True: If the file exists
+
+        False: If the file is missing
+    """
+
+    if not os.path.isfile(filename):
+        print ("Error opening file " + filename ,file=sys.stderr)
+        return False
+
+    loaders[name] = functools.partial(_load_terminal, filename, encoding, compile_masks)
+
+    return True
+
+
 def _load_from_file(grammar_section, filename, encoding):
     """
     Loads grammar information from a file
@@ -0,0 +1,523 @@
+#!/usr/bin/env python3
+
+
+"""
+
+Name: PCFG_Guesser Output Handling
+
+Description: Responsible for getting password guesses out of the guesser,
+either to stdout, a file, or a named pipe
+
+Calling print() for every guess makes the guesser syscall bound when piping
+guesses into a password cracker. Instead the output classes here collect
+guesses in a buffer, encode them using the ruleset's encoding, and then write
+them out in large chunks.
+
+The main function that will be called by other programs is:
+    create_output(filename, encoding)
+
+"""
+
+
+import sys
+import os
+import stat
+import time
+
+
+# The number of guesses to buffer before writing them out
+DEFAULT_BATCH_SIZE = 32768
+
+
+def create_output(filename, encoding, batch_size = DEFAULT_BATCH_SIZE):
+    """
+    Creates the output to write guesses to
+
+    Inputs:
+        filename: The file or named pipe to write guesses to. If None, guesses
+        will be written to stdout
+
+        encoding: The encoding to write guesses in. This should be the
+        encoding of the ruleset
+
+        batch_size: The number of guesses to buffer before writing them out
+
+    Returns:
+        GuessOutput: The output to write guesses to
+    """
+
+    if filename is None:
+        return StdoutOutput(encoding, batch_size)
+
+    if os.path.exists(filename) and stat.S_ISFIFO(os.stat(filename).st_mode):
+        return PipeOutput(filename, encoding, batch_size)
+
+    return FileOutput(filename, encoding, batch_size)
+
+
+def find_output(output, output_class):
+    """
+    Finds an output of the requested type in a chain of outputs
+
+    Outputs that filter or check guesses, (like HashOutput), pass the rest on
+    to the next output, which is saved as .output
+
+    Inputs:
+        output: The first output in the chain
+
+        output_class: The class of the output to find
+
+    Returns:
+        output: The first output in the chain of the requested type, or None
+        if there isn't one
+    """
+
+    while output is not None:
+        if isinstance(output, output_class):
+            return output
+        output = getattr(output, 'output', None)
+
+    return None
+
+
+class GuessOutput:
+    """
+    Base class for writing guesses out
+
+    Collects guesses and writes them out in large pre-encoded chunks.
+    Classes that inherit from this need to provide _write_bytes()
+    """
+
+    def __init__(self, encoding, batch_size = DEFAULT_BATCH_SIZE):
+        """
+        Basic initialization function
+
+        Inputs:
+            encoding: The encoding to write guesses in
+
+            batch_size: The number of guesses to buffer before writing them out
+
+        Returns:
+            GuessOutput
+        """
+
+        self.encoding = encoding
+        self.batch_size = batch_size
+
+        # The guesses that haven't been written out yet
+        self.buffer = []
+
+        # Set if the consumer stopped accepting guesses. Once this happens
+        # no more guesses will be written
+        self.is_broken = False
+
+        # Statistics for the metrics export. The number of bytes written out,
+        # and the number of seconds spent waiting on the consumer to accept
+        # them. A high stall time means the consumer is the bottleneck
+        self.bytes_written = 0
+        self.stall_time = 0.0
+
+    def write(self, guess):
+        """
+        Adds a single guess to the output
+
+        If an error occurs will pass back OSError
+
+        Inputs:
+            guess: The guess to write out
+
+        Returns:
+            None
+        """
+
+        self.buffer.append(guess)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def write_batch(self, guesses):
+        """
+        Adds a list of guesses to the output
+
+        If an error occurs will pass back OSError
+
+        Inputs:
+            guesses: A list of guesses to write out
+
+        Returns:
+            None
+        """
+
+        self.buffer.extend(guesses)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Encodes all the buffered guesses and writes them out
+
+        If an error occurs will pass back OSError
+
+        Inputs:
+            None
+
+        Returns:
+            None
+        """
+
+        if not self.buffer:
+            return
+
+        guesses = self.buffer
+        self.buffer = []
+
+        if self.is_broken:
+            raise OSError
+
+        self._timed_write(self._encode(guesses))
+
+    def write_encoded(self, data):
+        """
+        Writes out guesses that have already been encoded
+
+        Used when guesses were generated by another process. Any buffered
+        guesses are written out first so the ordering is kept
+
+        If an error occurs will pass back OSError
+
+        Inputs:
+            data: The encoded, newline seperated guesses
+
+        Returns:
+            None
+        """
+
+        self.flush()
+
+        if self.is_broken:
+            raise OSError
+
+        if data:
+            self._timed_write(data)
+
+    def create_worker_output(self):
+        """
+        Returns the output for worker processes to write their guesses to.
+        The main process then writes them out with write_encoded()
+
+        Inputs:
+            None
+
+        Returns:
+            MemoryOutput
+        """
+
+        return MemoryOutput(self.encoding)
+
+    def close(self):
+        """
+        Writes out any remaining guesses and cleans up
+
+        Inputs:
+            None
+
+        Returns:
+            None
+        """
+
+        try:
+            self.flush()
+        except OSError:
+            pass
+
+    def _encode(self, guesses):
+        """
+        Encodes a list of guesses as newline seperated bytes
+
+        Guesses that can't be encoded are skipped, which is the same thing that
+        happened when each guess was printed seperately
+
+        Inputs:
+            guesses: A list of guesses
+
+        Returns:
+            data: The encoded guesses
+        """
+
+        # The ruleset was read in with surrogateescape, so use the same thing
+        # here to write out any un-decodable bytes exactly as they were read
+        try:
+            return ('\n'.join(guesses) + '\n').encode(self.encoding, 'surrogateescape')
+
+        # While I could silently replace/ignore the Unicode character for now I
+        # want to provide a good spot to debug if this is happening
+        except UnicodeEncodeError:
+            encoded = []
+            for guess in guesses:
+                try:
+                    encoded.append(guess.encode(self.encoding, 'surrogateescape'))
+                except UnicodeEncodeError:
+                    pass
+            encoded.append(b'')
+            return b'\n'.join(encoded)
+
+    def _timed_write(self, data):
+        """
+        Writes out encoded guesses and updates the output statistics
+
+        If an error occurs will pass back OSError
+
+        Inputs:
+            data: The bytes to write
+
+        Returns:
+            None
+        """
+
+        start_time = time.perf_counter()
+        self._write_bytes(data)
+        self.stall_time += time.perf_counter() - start_time
+        self.bytes_written += len(data)
+
+    def _consumer_stopped(self):
+        """
+        Prints out that the consumer stopped accepting guesses and raises OSError
+
+        Inputs:
+            None
+
+        Returns:
+            Raises OSError
+        """
+
+        self.is_broken = True
+        print('',file=sys.stderr)
+        print("The consumer, probably the password cracker, has stopped",file=sys.stderr)
+        print("accepting input.",file=sys.stderr)
+        print("Halting guess generation and exiting",file=sys.stderr)
+        raise OSError
+
+    def _write_bytes(self, data):
+        """
+        Writes the encoded guesses out. Needs to be provided by child classes
+
+        Inputs:
+            data: The bytes to write
+
+        Returns:
+            None
+        """
+
+        raise NotImplementedError
+
+
+class NullOutput(GuessOutput):
+    """
+    Throws away all guesses. Used for debugging runs
+    """
+
+    def write(self, guess):
+        pass
+
+    def write_batch(self, guesses):
+        pass
+
+    def _write_bytes(self, data):
+        pass
+
+
+class MemoryOutput(GuessOutput):
+    """
+    Collects the encoded guesses in memory
+
+    Used by worker processes to hand their guesses back to the main process
+    """
+
+    def __init__(self, encoding, batch_size = DEFAULT_BATCH_SIZE):
+        super().__init__(encoding, batch_size)
+
+        # The encoded chunks of guesses
+        self.chunks = []
+
+    def _write_bytes(self, data):
+        self.chunks.append(data)
+
+    def getvalue(self):
+        """
+        Returns all the guesses written so far and clears them out
+
+        Inputs:
+            None
+
+        Returns:
+            data: The encoded guesses
+        """
+
+        self.flush()
+        data = b''.join(self.chunks)
+        self.chunks = []
+
+        return data
+
+
+class ListOutput(GuessOutput):
+    """
+    Collects the guesses in a list without encoding them
+
+    Used to hand guesses to Python code running in the same process
+    """
+
+    def write(self, guess):
+        self.buffer.append(guess)
+
+    def write_batch(self, guesses):
+        self.buffer.extend(guesses)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        """
+        Returns all the guesses written so far and clears them out
+
+        Inputs:
+            None
+
+        Returns:
+            guesses: A list of the guesses
+        """
+
+        guesses = self.buffer
+        self.buffer = []
+
+        return guesses
+
+
+class StdoutOutput(GuessOutput):
+    """
+    Writes guesses to stdout
+    """
+
+    def _write_bytes(self, data):
+        """
+        Writes the encoded guesses to stdout
+
+        Inputs:
+            data: The bytes to write
+
+        Returns:
+            None
+        """
+
+        try:
+            sys.stdout.buffer.write(data)
+            sys.stdout.buffer.flush()
+
+        except OSError:
+            # Python will try to flush stdout again when it exits, which
+            # just results in another error being printed. Point stdout at
+            # devnull to avoid that.
+            try:
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, sys.stdout.fileno())
+            except OSError:
+                pass
+
+            self._consumer_stopped()
+
+
+class FileOutput(GuessOutput):
+    """
+    Writes guesses to a file
+    """
+
+    def __init__(self, filename, encoding, batch_size = DEFAULT_BATCH_SIZE):
+        """
+        Opens the file to write guesses to
+
+        Inputs:
+            filename: The name of the file to write guesses to
+
+            encoding: The encoding to write guesses in
+
+            batch_size: The number of guesses to buffer before writing them out
+
+        Returns:
+            FileOutput
+        """
+
+        super().__init__(encoding, batch_size)
+
+        self.filename = filename
+        self.file = self._open()
+
+    def _open(self):
+        """
+        Opens the file for writing
+
+        Inputs:
+            None
+
+        Returns:
+            file: A binary file object
+        """
+
+        return open(self.filename, 'wb')
+
+    def _write_bytes(self, data):
+        """
+        Writes the encoded guesses to the file
+
+        Inputs:
+            data: The bytes to write
+
+        Returns:
+            None
+        """
+
+        try:
+            self.file.write(data)
+            self.file.flush()
+
+        except OSError as error:
+            print(error, file=sys.stderr)
+            self._consumer_stopped()
+
+    def close(self):
+        """
+        Writes out any remaining guesses and closes the file
+
+        Inputs:
+            None
+
+        Returns:
+            None
+        """
+
+        super().close()
+
+        try:
+            self.file.close()
+        except OSError:
+            pass
+
+
+class PipeOutput(FileOutput):
+    """
+    Writes guesses to a named pipe, (FIFO)
+
+    Opening a named pipe blocks until the consumer opens the other end
+    """
+
+    def _open(self):
+        """
+        Opens the named pipe for writing, waiting for the consumer to connect
+
+        Inputs:
+            None
+
+        Returns:
+            file: A binary file object
+        """
+
+        print(f"Waiting for a reader to open the named pipe: {self.filename}",file=sys.stderr)
+        return open(self.filename, 'wb')
@@ -0,0 +1,583 @@
+#!/usr/bin/env python3
+
+
+"""
+
+Name: PCFG_Guesser Guess Generation Worker Pool
+
+Description: Hands parse trees off to a pool of worker processes which
+expand them into guesses
+
+The main process keeps the priority queue and pops parse trees off it as
+normal. Instead of creating the guesses itself it splits the parse trees
+into work items of (pt, start, count). Small parse trees are batched
+together into one task, and large parse trees are split up into index
+ranges across multiple tasks. The workers send back the encoded guesses
+which the main process then writes to the output.
+
+Guesses are only reported as generated once they have been written out, so
+the status report doesn't count guesses a worker is still creating.
+
+In strict order mode the results are written out in the same order the
+parse trees were popped off the priority queue, so the guesses are
+identical to running with a single process. In relaxed mode results are
+written out as soon as any worker finishes them, which means guesses from
+neighboring parse trees can be mixed together.
+
+OMEN levels are split up by (length, IP) into partitions, (see
+omen/partitioned_cracker.py), and the partitions are handed out to the
+workers. The position of every partition is only moved forward once its
+guesses have been written, so the session can be saved at any point.
+
+"""
+
+
+import multiprocessing
+import queue
+import heapq
+from collections import deque
+
+from .pcfg_grammar import PtNode
+from .omen.partitioned_cracker import PartitionedMarkovCracker, generate_guesses
+
+
+# The number of guesses to hand to a worker at a time
+DEFAULT_CHUNK_SIZE = 262144
+
+# The number of base structures to hand to a worker at a time when restoring
+# a session
+RESTORE_CHUNK_SIZE = 64
+
+
+# The grammar used by a worker process. Set when the worker is started
+_worker_pcfg = None
+
+
+def _init_worker(pcfg, output):
+    """
+    Sets up a worker process
+
+    Inputs:
+        pcfg: The PcfgGrammar to create guesses with
+
+        output: The MemoryOutput to write guesses to
+
+    Returns:
+        None
+    """
+
+    global _worker_pcfg
+
+    _worker_pcfg = pcfg
+    _worker_pcfg.output = output
+
+
+def _expand_work(work):
+    """
+    Creates the guesses for a list of work items in a worker process
+
+    Inputs:
+        work: A list of (pt, start, count) work items
+
+    Returns:
+        (data, num_guesses): The encoded guesses and how many were created
+    """
+
+    num_guesses = 0
+    for pt, start, count in work:
+        num_guesses += _worker_pcfg.create_guesses(pt, limit = count, start = start)
+
+    return _worker_pcfg.output.getvalue(), num_guesses
+
+
+def _expand_omen(task):
+    """
+    Creates the next guesses for an OMEN partition in a worker process
+
+    Inputs:
+        task: The (target_level, cells, parse_tree, max_guesses) returned by
+        PartitionedMarkovCracker.task()
+
+    Returns:
+        (data, num_guesses, num_finished, parse_tree): The encoded guesses,
+        how many were created, and where the partition should move to once
+        they are written
+    """
+
+    target_level, cells, parse_tree, max_guesses = task
+    guesses, num_finished, parse_tree = generate_guesses(
+        _worker_pcfg.omen_grammar,
+        target_level,
+        cells,
+        parse_tree,
+        max_guesses,
+        _worker_pcfg.omen_optimizer
+        )
+
+    num_guesses = len(guesses)
+    if _worker_pcfg.policy is not None:
+        guesses = _worker_pcfg.policy.filter_guesses(guesses)
+
+    _worker_pcfg.output.write_batch(guesses)
+    return _worker_pcfg.output.getvalue(), num_guesses, num_finished, parse_tree
+
+
+def _restore_bases(task):
+    """
+    Restores the parse trees for a list of base structures in a worker process
+
+    Inputs:
+        task: (base_ids, max_prob, min_prob) to pass to
+        PcfgGrammar.restore_prob_order()
+
+    Returns:
+        items: A list of (prob, base_id, indices) for the restored parse trees
+    """
+
+    base_ids, max_prob, min_prob = task
+
+    # The workers can be started before the priority queue sets up the
+    # base structures
+    if not hasattr(_worker_pcfg, 'base_probs'):
+        _worker_pcfg.initalize_base_structures()
+
+    items = []
+
+    def save_function(prob, node):
+        items.append((prob, node.base_id, node.indices))
+
+    for base_id in base_ids:
+        prob, node = _worker_pcfg.create_base_node(base_id)
+        _worker_pcfg.restore_prob_order(node, prob, max_prob, min_prob, save_function)
+
+    return items
+
+
+class GuessWorkerPool:
+    """
+    A pool of processes to generate guesses with
+    """
+
+    def __init__(self, pcfg, num_workers, strict_order = True, chunk_size = DEFAULT_CHUNK_SIZE,
+        written_callback = None):
+        """
+        Starts up the worker processes
+
+        Should be called before any other threads are started since
+        the workers are forked off this process where supported
+
+        Inputs:
+            pcfg: The PcfgGrammar. Guesses will be written to its output
+
+            num_workers: The number of worker processes to start
+
+            strict_order: If True, guesses are written in the same order as
+            they would be by a single process. If False, they are written as
+            soon as they are ready
+
+            chunk_size: The number of guesses to hand to a worker at a time
+
+            written_callback: Called with (num_guesses, probability_coverage)
+            every time a batch of guesses has been written out. Can be None
+
+        Returns:
+            GuessWorkerPool
+        """
+
+        self.pcfg = pcfg
+        self.num_workers = num_workers
+        self.strict_order = strict_order
+        self.chunk_size = chunk_size
+        self.written_callback = written_callback
+
+        # Limit how many tasks can be waiting to be written so memory usage
+        # stays bounded if the consumer is slow
+        self.max_in_flight = 2 * num_workers
+
+        # Forking lets the workers share the grammar without copying it
+        try:
+            context = multiprocessing.get_context('fork')
+        except ValueError:
+            context = multiprocessing.get_context()
+
+        # The workers don't need, (and can't always copy), the output. They
+        # write to the output it creates for them instead
+        output = pcfg.output
+        pcfg.output = None
+        try:
+            self.pool = context.Pool(
+                num_workers,
+                initializer = _init_worker,
+                initargs = (pcfg, output.create_worker_output())
+            )
+        finally:
+            pcfg.output = output
+
+        # Work items that haven't been handed to a worker yet
+        self.pending = []
+        self.pending_count = 0
+        self.pending_coverage = 0
+
+        # The probability coverage of each task that hasn't been written yet
+        self.coverage = {}
+
+        # The sequence number of the next task to submit
+        self.next_seq = 0
+
+        # The sequence number of the next task to write in strict mode
+        self.next_write = 0
+
+        # The number of tasks whose results have been written out
+        self.num_written = 0
+
+        # Results from the workers come back on this queue
+        self.results = queue.Queue()
+
+        # Results that arrived before earlier tasks finished, (strict mode)
+        self.waiting = {}
+
+    def submit(self, pt, limit = None, prob = 0.0, start = 0):
+        """
+        Schedules all the guesses for a parse tree to be generated
+
+        If an error occurs will pass back OSError
+
+        Inputs:
+            pt: The parse tree, which is a list of tuples
+
+            limit: (None/Int) The maximum number of guesses to create.
+            Ignored if None
+
+            prob: The probability of the parse tree. Used to report the
+            probability coverage of the guesses once they are written
+
+            start: (Int) The index of the first guess to generate
+
+        Returns:
+            num_guesses: The number of guesses scheduled. They may not have
+            been written out yet
+        """
+
+        # OMEN levels are split up into partitions vs. index ranges. Wait for
+        # everything before it to be written first
+        if pt[0][0][0] == 'M':
+            self.drain()
+
+            # The partitions only give the first guesses of a level when they
+            # are written in order, so generate a sub-range in this process
+            if start or (limit is not None and not self.strict_order):
+                num_guesses = self.pcfg.create_guesses(pt, limit = limit, start = start)
+                self._report_written(num_guesses, prob * num_guesses)
+                return num_guesses
+
+            # Get the level
+            level = int(self.pcfg.grammar[pt[0][0]][pt[0][1]]['values'][0])
+            markov_cracker = PartitionedMarkovCracker(
+                self.pcfg.omen_grammar,
+                level,
+                self.pcfg.omen_optimizer
+                )
+
+            # Initalize counter used for status reports and save files
+            self.pcfg.omen_guess_num = 0
+
+            num_guesses = self.submit_omen(markov_cracker, limit)
+            self._report_written(num_guesses, prob * num_guesses)
+            return num_guesses
+
+        total = self.pcfg.count_guesses(pt) - start
+        if limit is not None:
+            total = min(total, limit)
+
+        end = start + total
+        while start < end:
+            count = min(self.chunk_size - self.pending_count, end - start)
+            self.pending.append((pt, start, count))
+            self.pending_count += count
+            self.pending_coverage += prob * count
+            start += count
+
+            if self.pending_count >= self.chunk_size:
+                self._send()
+
+        return max(total, 0)
+
+    def submit_omen(self, markov_cracker, limit = None):
+        """
+        Generates the remaining guesses for an OMEN level, handing its
+        partitions out to the workers
+
+        Any guesses already scheduled should be drained first. The guesses
+        are written out before this returns. If the user asks to exit, the
+        position of every partition is saved so the session can be restored
+
+        If an error occurs will pass back OSError
+
+        Inputs:
+            markov_cracker: A PartitionedMarkovCracker
+
+            limit: (None/Int) The maximum number of guesses to create.
+            Ignored if None
+
+        Returns:
+            num_guesses: The number of guesses generated
+        """
+
+        # Results from the workers come back on this queue as
+        # (partition, max_guesses, result, error)
+        results = queue.Queue()
+
+        # The partitions that can be handed out to a worker. The lowest
+        # partition is always handed out first
+        to_send = [
+            partition for partition in range(markov_cracker.num_partitions())
+            if not markov_cracker.is_done(partition)
+        ]
+
+        # The partitions that haven't been finished yet, in order. Only
+        # used in strict order mode
+        unfinished = deque(to_send)
+
+        # Results that can't be written out yet, by partition
+        waiting = {}
+
+        # The number of tasks the workers are working on
+        num_running = 0
+
+        # The number of guesses that can still be handed out
+        budget = limit
+
+        num_guesses = 0
+
+        while True:
+
+            # Hand out work
+            while to_send and num_running + len(waiting) < self.max_in_flight:
+                if budget is not None and budget <= 0:
+                    break
+
+                partition = heapq.heappop(to_send)
+                max_guesses = self.chunk_size
+                if budget is not None:
+                    max_guesses = min(max_guesses, budget)
+                    budget -= max_guesses
+
+                num_running += 1
+                self.pool.apply_async(
+                    _expand_omen,
+                    (markov_cracker.task(partition, max_guesses),),
+                    callback = lambda result, partition = partition, max_guesses = max_guesses:
+                        results.put((partition, max_guesses, result, None)),
+                    error_callback = lambda error: results.put((None, None, None, error))
+                )
+
+            if num_running == 0:
+                # Everything has been written, or the limit was reached
+                if not waiting:
+                    return num_guesses
+
+                # The results waiting on an earlier partition are holding on to
+                # the guesses it needs to stay under the limit. Throw them
+                # away and create them again later
+                for partition, (max_guesses, result) in waiting.items():
+                    budget += max_guesses
+                    heapq.heappush(to_send, partition)
+                waiting = {}
+                continue
+
+            partition, max_guesses, result, error = results.get()
+
+            # Pass errors in the worker processes on to the main process
+            if error is not None:
+                raise error
+
+            num_running -= 1
+            waiting[partition] = (max_guesses, result)
+
+            # Write out everything that is ready
+            while waiting:
+                if self.strict_order:
+                    partition = unfinished[0]
+                    if partition not in waiting:
+                        break
+                else:
+                    partition = next(iter(waiting))
+
+                max_guesses, (data, num_created, num_finished, parse_tree) = waiting.pop(partition)
+                self.pcfg.output.write_encoded(data)
+                markov_cracker.update(partition, num_finished, parse_tree)
+
+                num_guesses += num_created
+                self.pcfg.omen_guess_num += num_created
+                if budget is not None:
+                    budget += max_guesses - num_created
+
+                if not markov_cracker.is_done(partition):
+                    heapq.heappush(to_send, partition)
+                elif self.strict_order:
+                    unfinished.popleft()
+
+            # Check the limit
+            if limit is not None and num_guesses >= limit:
+                return num_guesses
+
+            # Check to see if the user wanted to exit the program
+            if self.pcfg.should_exit:
+                self.pcfg.save_omen_partitions(markov_cracker)
+                return num_guesses
+
+    def restore(self, base_ids, max_prob, min_prob, save_function):
+        """
+        Restores the parse trees of the base structures for a saved session
+
+        The base structures are split up between the workers. The parse
+        trees are saved in the same order as restoring them in this process
+
+        Inputs:
+            base_ids: A list of the base structures to restore
+
+            max_prob, min_prob: Passed to PcfgGrammar.restore_prob_order()
+
+            save_function: Called as save_function(prob, node) for every
+            parse tree that was restored
+
+        Returns:
+            None
+        """
+
+        tasks = [
+            (base_ids[start:start + RESTORE_CHUNK_SIZE], max_prob, min_prob)
+            for start in range(0, len(base_ids), RESTORE_CHUNK_SIZE)
+        ]
+
+        for items in self.pool.imap(_restore_bases, tasks):
+            for prob, base_id, indices in items:
+                save_function(prob, PtNode(base_id, indices))
+
+    def drain(self):
+        """
+        Waits for all the scheduled guesses to be written out
+
+        If an error occurs will pass back OSError
+
+        Inputs:
+            None
+
+        Returns:
+            None
+        """
+
+        self._send()
+
+        while self.num_written < self.next_seq:
+            self._collect()
+
+    def close(self):
+        """
+        Stops the worker processes. Any guesses that haven't been written
+        out are thrown away
+
+        Inputs:
+            None
+
+        Returns:
+            None
+        """
+
+        self.pool.terminate()
+        self.pool.join()
+
+    def _send(self):
+        """
+        Hands the pending work items to a worker
+
+        Inputs:
+            None
+
+        Returns:
+            None
+        """
+
+        if not self.pending:
+            return
+
+        while self.next_seq - self.num_written >= self.max_in_flight:
+            self._collect()
+
+        seq = self.next_seq
+        self.next_seq += 1
+        self.coverage[seq] = self.pending_coverage
+
+        self.pool.apply_async(
+            _expand_work,
+            (self.pending,),
+            callback = lambda result: self.results.put((seq, result, None)),
+            error_callback = lambda error: self.results.put((seq, None, error))
+        )
+
+        self.pending = []
+        self.pending_count = 0
+        self.pending_coverage = 0
+
+    def _collect(self):
+        """
+        Waits for a task to finish and writes out any results that are ready
+
+        Inputs:
+            None
+
+        Returns:
+            None
+        """
+
+        seq, result, error = self.results.get()
+
+        # Pass errors in the worker processes on to the main process
+        if error is not None:
+            raise error
+
+        if not self.strict_order:
+            self._write(seq, result)
+            return
+
+        self.waiting[seq] = result
+        while self.next_write in self.waiting:
+            seq = self.next_write
+            self.next_write += 1
+            self._write(seq, self.waiting.pop(seq))
+
+    def _write(self, seq, result):
+        """
+        Writes out the guesses from a finished task
+
+        If an error occurs will pass back OSError
+
+        Inputs:
+            seq: The sequence number of the task
+
+            result: The (data, num_guesses) returned by the worker
+
+        Returns:
+            None
+        """
+
+        data, num_guesses = result
+        self.num_written += 1
+        self.pcfg.output.write_encoded(data)
+        self._report_written(num_guesses, self.coverage.pop(seq))
+
+    def _report_written(self, num_guesses, coverage):
+        """
+        Lets the written_callback know guesses have been written out
+
+        Inputs:
+            num_guesses: The number of guesses written
+
+            coverage: The probability coverage of the guesses
+
+        Returns:
+            None
+        """
+
+        if self.written_callback is not None:
+            self.written_callback(num_guesses, coverage)
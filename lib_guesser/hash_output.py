@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+
+
+"""
+
+Name: PCFG_Guesser Hash Verification Output
+
+Description: Checks guesses against a list of password hashes in the guesser
+itself, rather than piping every guess into a password cracker
+
+For fast unsalted hashes, writing guesses to a pipe and reading them in
+another program costs more than hashing them. HashOutput is used in place of
+the normal output. It hashes every guess as it is written out and only writes
+out the guesses that crack one of the target hashes, in the format:
+
+    hash:plaintext
+
+Cracked hashes are removed from the targets, and once every hash is cracked
+the output stops accepting guesses, which ends the session the same way as a
+password cracker exiting.
+
+When using worker processes, each worker checks the guesses it creates with
+HashFilterOutput, and only the cracked guesses are sent back to the main
+process.
+
+Supported hash types: md5, sha1, sha256, ntlm
+
+"""
+
+
+import sys
+import hashlib
+import struct
+import functools
+
+# Local imports
+from .guess_output import GuessOutput, MemoryOutput, DEFAULT_BATCH_SIZE
+
+
+# The supported hash types and the size of their digests in bytes
+DIGEST_SIZES = {
+    'md5': 16,
+    'sha1': 20,
+    'sha256': 32,
+    'ntlm': 16,
+}
+
+
+# The (word, shift) used by each step of the three MD4 rounds
+_MD4_ROUND_1 = [(i, (3, 7, 11, 19)[i % 4]) for i in range(16)]
+_MD4_ROUND_2 = [((i % 4) * 4 + i // 4, (3, 5, 9, 13)[i % 4]) for i in range(16)]
+_MD4_ROUND_3 = [(k, (3, 9, 11, 15)[i % 4]) for i, k in enumerate((0, 8, 4, 12, 2, 10, 6, 14, 1, 9, 5, 13, 3, 11, 7, 15))]
+
+
+def _md4(data):
+    """
+    Pure Python MD4, (RFC 1320)
+
+    Only used for NTLM if hashlib doesn't provide MD4, which is the case
+    with newer versions of OpenSSL
+
+    Inputs:
+        data: The bytes to hash
+
+    Returns:
+        digest: The 16 byte MD4 digest
+    """
+
+    mask = 0xffffffff
+
+    # Pad the message to a multiple of 64 bytes, ending with the bit length
+    length = len(data)
+    data = data + b'\x80' + b'\x00' * ((55 - length) % 64) + struct.pack('<Q', (length * 8) & 0xffffffffffffffff)
+
+    h0, h1, h2, h3 = 0x67452301, 0xefcdab89, 0x98badcfe, 0x10325476
+
+    for offset in range(0, len(data), 64):
+        x = struct.unpack_from('<16I', data, offset)
+        a, b, c, d = h0, h1, h2, h3
+
+        # Each step updates one register and then the registers are rotated,
+        # so the next step updates the one before it, (a, d, c, b, ...)
+        for k, shift in _MD4_ROUND_1:
+            value = (a + (d ^ (b & (c ^ d))) + x[k]) & mask
+            a, b, c, d = d, ((value << shift) | (value >> (32 - shift))) & mask, b, c
+
+        for k, shift in _MD4_ROUND_2:
+            value = (a + ((b & c) | (d & (b | c))) + x[k] + 0x5a827999) & mask
+            a, b, c, d = d, ((value << shift) | (value >> (32 - shift))) & mask, b, c
+
+        for k, shift in _MD4_ROUND_3:
+            value = (a + (b ^ c ^ d) + x[k] + 0x6ed9eba1) & mask
+            a, b, c, d = d, ((value << shift) | (value >> (32 - shift))) & mask, b, c
+
+        h0 = (h0 + a) & mask
+        h1 = (h1 + b) & mask
+        h2 = (h2 + c) & mask
+        h3 = (h3 + d) & mask
+
+    return struct.pack('<4I', h0, h1, h2, h3)
+
+
+def _hashlib_md4(data):
+    return hashlib.new('md4', data).digest()
+
+
+# Use the much faster OpenSSL version of MD4 if it is available
+try:
+    hashlib.new('md4', b'')
+    md4 = _hashlib_md4
+except ValueError:
+    md4 = _md4
+
+
+def _hash_md5(data):
+    return hashlib.md5(data).digest()
+
+
+def _hash_sha1(data):
+    return hashlib.sha1(data).digest()
+
+
+def _hash_sha256(data):
+    return hashlib.sha256(data).digest()
+
+
+def _hash_ntlm(data, encoding):
+    # NTLM is the MD4 of the UTF-16LE password, so undo the ruleset's encoding
+    return md4(data.decode(encoding, 'surrogateescape').encode('utf-16-le', 'surrogatepass'))
+
+
+def create_hash_function(hash_type, encoding):
+    """
+    Returns the function to hash a guess with
+
+    The function can be pickled so it can be sent to worker processes
+
+    Inputs:
+        hash_type: One of the keys of DIGEST_SIZES
+
+        encoding: The encoding guesses are written in
+
+    Returns:
+        hash_function: A function that takes an encoded guess and returns
+        the digest as bytes
+    """
+
+    if hash_type == 'md5':
+        return _hash_md5
+    if hash_type == 'sha1':
+        return _hash_sha1
+    if hash_type == 'sha256':
+        return _hash_sha256
+    if hash_type == 'ntlm':
+        return functools.partial(_hash_ntlm, encoding = encoding)
+
+    raise ValueError(f"Unsupported hash type: {hash_type}")
+
+
+def load_hashes(filename, hash_type):
+    """
+    Loads the hashes to crack
+
+    Each line should have one hex encoded hash. Lines can also have other
+    fields seperated by ':', (such as "username:hash" or pwdump format), in
+    which case the last field that is a hash of the right length is used
+
+    Inputs:
+        filename: The file of hashes to load
+
+        hash_type: One of the keys of DIGEST_SIZES
+
+    Returns:
+        targets: A set of the digests as bytes
+
+        If the file can't be read will pass back OSError
+    """
+
+    hex_length = DIGEST_SIZES[hash_type] * 2
+
+    targets = set()
+    num_skipped = 0
+    with open(filename, 'r', encoding = 'utf-8', errors = 'replace') as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+
+            digest = None
+            for field in line.split(':'):
+                if len(field) == hex_length:
+                    try:
+                        digest = bytes.fromhex(field)
+                    except ValueError:
+                        pass
+
+            if digest is None:
+                num_skipped += 1
+                continue
+
+            targets.add(digest)
+
+    if num_skipped:
+        print(f"Skipped {num_skipped:,} lines in {filename} that did not have a {hash_type} hash",file=sys.stderr)
+
+    return targets
+
+
+class HashOutput(GuessOutput):
+    """
+    Hashes guesses and writes out the ones that crack a target hash
+    """
+
+    def __init__(self, output, targets, hash_type, batch_size = DEFAULT_BATCH_SIZE):
+        """
+        Basic initialization function
+
+        Inputs:
+            output: The GuessOutput to write cracked hashes to
+
+            targets: A set of the digests to crack, (see load_hashes). Cracked
+            digests are removed from it
+
+            hash_type: One of the keys of DIGEST_SIZES
+
+            batch_size: The number of guesses to buffer before hashing them
+
+        Returns:
+            HashOutput
+        """
+
+        super().__init__(output.encoding, batch_size)
+
+        self.output = output
+        self.targets = targets
+        self.hash_type = hash_type
+        self.hash_function = create_hash_function(hash_type, output.encoding)
+
+        # Statistics for the status report
+        self.num_targets = len(targets)
+        self.num_cracked = 0
+
+    def create_worker_output(self):
+        """
+        Returns the output for worker processes to write guesses to, which
+        only passes on the guesses that crack a hash
+
+        Inputs:
+            None
+
+        Returns:
+            HashFilterOutput
+        """
+
+        return HashFilterOutput(self.targets, self.hash_type, self.encoding, self.batch_size)
+
+    def close(self):
+        """
+        Hashes any remaining guesses and closes the output for cracked hashes
+
+        Inputs:
+            None
+
+        Returns:
+            None
+        """
+
+        super().close()
+        self.output.close()
+
+    def _write_bytes(self, data):
+        """
+        Hashes the encoded guesses, and writes out any that crack a hash
+
+        If an error occurs, or every hash has been cracked, will pass back
+        OSError
+
+        Inputs:
+            data: The newline seperated guesses
+
+        Returns:
+            None
+        """
+
+        lines = data.split(b'\n')
+        lines.pop()
+
+        hash_function = self.hash_function
+        digests = [hash_function(line) for line in lines]
+
+        # The common case, nothing was cracked
+        if self.targets.isdisjoint(digests):
+            return
+
+        cracked = []
+        for line, digest in zip(lines, digests):
+            if digest in self.targets:
+                self.targets.remove(digest)
+                cracked.append(digest.hex().encode('ascii') + b':' + line + b'\n')
+
+        self.num_cracked += len(cracked)
+        self.output.write_encoded(b''.join(cracked))
+
+        if not self.targets:
+            self.is_broken = True
+            print('',file=sys.stderr)
+            print(f"All {self.num_targets:,} hashes have been cracked",file=sys.stderr)
+            print("Halting guess generation and exiting",file=sys.stderr)
+            raise OSError
+
+
+class HashFilterOutput(MemoryOutput):
+    """
+    Used by worker processes to only send back guesses that crack a hash
+
+    The worker's copy of the targets isn't updated as hashes are cracked, so
+    the main process checks the guesses again before writing them out
+    """
+
+    def __init__(self, targets, hash_type, encoding, batch_size = DEFAULT_BATCH_SIZE):
+        super().__init__(encoding, batch_size)
+
+        self.targets = targets
+        self.hash_function = create_hash_function(hash_type, encoding)
+
+    def _write_bytes(self, data):
+        lines = data.split(b'\n')
+        lines.pop()
+
+        hash_function = self.hash_function
+        cracked = [line for line in lines if hash_function(line) in self.targets]
+        if cracked:
+            cracked.append(b'')
+            self.chunks.append(b'\n'.join(cracked))
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+
+
+"""
+
+Name: PCFG_Guesser Metrics Export
+
+Description: Exports counters from a running cracking session so it can be
+monitored while it runs
+
+The status report only prints a summary when the user asks for it. This
+collects the counters kept by the CrackingSession, PcfgQueue, PcfgGrammar and
+the guess output, and exports them in one or both of these ways:
+
+    - A JSON object written as one line to a file every interval. Along with
+      the counters, each line has the guesses/sec and the fraction of time
+      spent waiting on the output over the last interval
+
+    - An HTTP endpoint on localhost that returns the counters in the
+      Prometheus text format, (GET /metrics)
+
+The counters can be used to see if a session is grammar bound or consumer
+bound. If output_stall_seconds grows almost as fast as the running time, the
+password cracker reading the guesses is the bottleneck. If it stays low the
+guesser is.
+
+When using worker processes, children, OMEN optimizer hits/misses and output
+bytes only count the work done in the main process.
+
+"""
+
+
+import sys
+import time
+import json
+import threading
+import http.server
+
+# Local imports
+from .guess_output import find_output
+from .filter_output import DedupOutput, ExcludeOutput
+
+
+# The default number of seconds between lines written to the metrics file
+DEFAULT_METRICS_INTERVAL = 10
+
+# Prefix for the names of the metrics in the Prometheus format
+PROMETHEUS_PREFIX = 'pcfg_guesser_'
+
+# The metrics that are exported, as (name, type, description)
+METRICS = [
+    ('running_time', 'gauge', 'Seconds since the metrics export started'),
+    ('guesses', 'counter', 'Guesses written out, including earlier runs of a restored session'),
+    ('parse_trees', 'counter', 'Parse trees guessed, including earlier runs of a restored session'),
+    ('probability_coverage', 'gauge', 'Total probability of the guesses written out'),
+    ('queue_size', 'gauge', 'Parse trees in the priority queue'),
+    ('queue_probability', 'gauge', 'Probability of the last parse tree popped off the priority queue'),
+    ('queue_popped', 'counter', 'Parse trees popped off the priority queue'),
+    ('queue_dropped', 'counter', 'Parse trees dropped from the priority queue to save memory'),
+    ('children', 'counter', 'Children pushed onto the priority queue by the Deadbeat Dad algorithm'),
+    ('rejected_children', 'counter', 'Children left for another parent by the Deadbeat Dad algorithm'),
+    ('omen_optimizer_hits', 'counter', 'OMEN optimizer cache hits'),
+    ('omen_optimizer_misses', 'counter', 'OMEN optimizer cache misses'),
+    ('output_bytes', 'counter', 'Bytes of guesses written to the output'),
+    ('output_stall_seconds', 'counter', 'Seconds spent waiting for the output to accept guesses'),
+    ('duplicates', 'counter', 'Duplicate guesses that were not written out, (with --dedup)'),
+    ('excluded', 'counter', 'Guesses that were not written out since they are on the exclude list'),
+]
+
+
+def collect_metrics(session, start_time):
+    """
+    Collects the current value of all the metrics for a session
+
+    This is called from a different thread than the one generating guesses.
+    The counters are only read, so at worst a value is one update behind
+
+    Inputs:
+        session: The CrackingSession
+
+        start_time: The time.perf_counter() the metrics export started at
+
+    Returns:
+        metrics: A dictionary of the metrics, with the names in METRICS
+    """
+
+    report = session.report
+    pcfg = session.pcfg
+    pqueue = session.pqueue
+    output = pcfg.output
+
+    metrics = {
+        'running_time': time.perf_counter() - start_time,
+        'guesses': report.num_guesses,
+        'parse_trees': report.num_parse_trees,
+        'probability_coverage': report.probability_coverage,
+        'queue_size': 0,
+        'queue_probability': 1.0,
+        'queue_popped': 0,
+        'queue_dropped': 0,
+        'children': pcfg.num_children,
+        'rejected_children': pcfg.num_rejected_children,
+        'omen_optimizer_hits': pcfg.omen_optimizer.hits,
+        'omen_optimizer_misses': pcfg.omen_optimizer.misses,
+        'output_bytes': output.bytes_written,
+        'output_stall_seconds': output.stall_time,
+        'duplicates': 0,
+        'excluded': 0,
+    }
+
+    dedup_output = find_output(output, DedupOutput)
+    if dedup_output is not None:
+        metrics['duplicates'] = dedup_output.num_duplicates
+
+    exclude_output = find_output(output, ExcludeOutput)
+    if exclude_output is not None:
+        metrics['excluded'] = exclude_output.num_excluded
+
+    # The priority queue isn't created until the session starts running
+    if pqueue is not None:
+        metrics['queue_size'] = len(pqueue.p_queue)
+        metrics['queue_probability'] = pqueue.max_probability
+        metrics['queue_popped'] = pqueue.num_popped
+        metrics['queue_dropped'] = pqueue.num_dropped
+
+    return metrics
+
+
+def format_prometheus(metrics):
+    """
+    Formats metrics in the Prometheus text format
+
+    Inputs:
+        metrics: A dictionary of metrics, (see collect_metrics)
+
+    Returns:
+        text: The metrics in the Prometheus text format
+    """
+
+    lines = []
+    for name, metric_type, description in METRICS:
+        full_name = PROMETHEUS_PREFIX + name
+        if metric_type == 'counter':
+            full_name += '_total'
+
+        lines.append(f"# HELP {full_name} {description}")
+        lines.append(f"# TYPE {full_name} {metric_type}")
+        lines.append(f"{full_name} {metrics[name]!r}")
+
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsExporter:
+    """
+    Exports the metrics of a cracking session to a file and/or an HTTP
+    endpoint from a background thread
+    """
+
+    def __init__(self, filename = None, port = None, interval = DEFAULT_METRICS_INTERVAL):
+        """
+        Opens the metrics file and the HTTP endpoint
+
+        Both are opened here so any errors, (like the port already being in
+        use), are found before the session starts
+
+        If an error occurs will pass back OSError
+
+        Inputs:
+            filename: (None/String) The file to append JSON lines to
+
+            port: (None/Int) The localhost port to serve the Prometheus
+            metrics on. If 0, a free port is picked, (see self.port)
+
+            interval: The number of seconds between lines written to the file
+
+        Returns:
+            MetricsExporter
+        """
+
+        self.interval = interval
+
+        # The session being exported. Set when start() is called
+        self.session = None
+        self.start_time = None
+
+        # The metrics in the last line written to the file. Used to work out
+        # the rates over the last interval
+        self.last_metrics = None
+
+        # Tells the background thread to stop
+        self.stop_event = threading.Event()
+        self.threads = []
+
+        self.file = None
+        if filename is not None:
+            self.file = open(filename, 'a')
+
+        self.server = None
+        self.port = None
+        if port is not None:
+            try:
+                self.server = http.server.ThreadingHTTPServer(('127.0.0.1', port), _MetricsHandler)
+            except OSError:
+                self.close()
+                raise
+
+            self.server.daemon_threads = True
+            self.server.exporter = self
+            self.port = self.server.server_address[1]
+
+    def start(self, session):
+        """
+        Starts exporting the metrics of a session
+
+        Inputs:
+            session: The CrackingSession
+
+        Returns:
+            None
+        """
+
+        self.session = session
+        self.start_time = time.perf_counter()
+
+        if self.file is not None:
+            self.threads.append(threading.Thread(target = self._write_loop, daemon = True))
+
+        if self.server is not None:
+            self.threads.append(threading.Thread(target = self.server.serve_forever, daemon = True))
+
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """
+        Stops exporting metrics. A final line is written to the metrics file
+        so it has the totals for the whole session
+
+        Inputs:
+            None
+
+        Returns:
+            None
+        """
+
+        self.stop_event.set()
+        if self.server is not None and self.threads:
+            self.server.shutdown()
+
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+        if self.session is not None and self.file is not None:
+            self.write_line()
+
+        self.close()
+
+    def close(self):
+        """
+        Closes the metrics file and the HTTP endpoint
+        """
+
+        if self.server is not None:
+            self.server.server_close()
+            self.server = None
+
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def get_metrics(self):
+        """
+        Returns the current metrics of the session, (see collect_metrics)
+        """
+
+        return collect_metrics(self.session, self.start_time)
+
+    def write_line(self):
+        """
+        Writes the current metrics to the metrics file as a JSON line
+
+        Adds the time, along with the guesses/sec and the fraction of the
+        time spent waiting on the output since the previous line
+
+        Inputs:
+            None
+
+        Returns:
+            None
+        """
+
+        metrics = self.get_metrics()
+
+        previous = self.last_metrics
+        if previous is None:
+            previous = dict.fromkeys(metrics, 0)
+        self.last_metrics = metrics
+
+        elapsed = metrics['running_time'] - previous['running_time']
+        line = {'time': round(time.time(), 3)}
+        line.update(metrics)
+        line['guesses_per_second'] = 0.0
+        line['output_stall_fraction'] = 0.0
+        if elapsed > 0:
+            line['guesses_per_second'] = round((metrics['guesses'] - previous['guesses']) / elapsed, 1)
+            line['output_stall_fraction'] = round(
+                (metrics['output_stall_seconds'] - previous['output_stall_seconds']) / elapsed,
+                4
+                )
+
+        try:
+            self.file.write(json.dumps(line) + '\n')
+            self.file.flush()
+        except OSError as error:
+            print(f"Error writing metrics: {error}", file=sys.stderr)
+
+    def _write_loop(self):
+        """
+        Writes a line to the metrics file every interval until stopped
+        """
+
+        while not self.stop_event.wait(self.interval):
+            self.write_line()
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Returns the metrics in the Prometheus text format
+    """
+
+    def do_GET(self):
+        if self.path not in ['/', '/metrics']:
+            self.send_error(404)
+            return
+
+        data = format_prometheus(self.server.exporter.get_metrics()).encode('utf-8')
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Don't print every request to stderr
+        pass
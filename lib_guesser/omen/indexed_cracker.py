@@ -0,0 +1,593 @@
+#!/usr/bin/env python3
+
+
+"""
+Faster version of the OMEN guess generation engine
+
+Generates the exact same guesses, in the same order, as MarkovCracker and
+GuessStructure but works on a compiled copy of the OMEN grammar:
+
+    - Every context ngram of the CP table is given a row number, and the
+      transitions for each (row, level) are stored in flat arrays. Each
+      transition saves the row of the ngram it leads to, so no strings need
+      to be sliced or looked up in dictionaries while walking the Markov chain
+
+    - The guess for everything but the last CP is saved off, so when the
+      parse tree changes only the part of the guess after the change is
+      rebuilt
+
+    - All of the guesses for the last CP are created at once, and guesses
+      are returned in blocks vs. one at a time
+
+Use compile_grammar() to create the grammar this engine uses from one loaded
+by input_file_io.load_rules()
+
+"""
+
+
+from array import array
+
+# Local imports
+from .markov_cracker import MarkovCracker
+
+
+# The maximum number of guesses to create at one time
+MAX_BLOCK_SIZE = 4096
+
+
+def compile_grammar(grammar):
+    """
+    Compiles an OMEN grammar into the format IndexedMarkovCracker uses
+
+    Inputs:
+        grammar: An OMEN grammar loaded by input_file_io.load_rules()
+
+    Returns:
+        compiled_grammar: A dictionary holding:
+
+            'max_level', 'ngram', 'ip', 'ln': Copied from the original grammar
+
+            'contexts': A list of the context ngrams, indexed by row
+
+            'rows': A dictionary of {context ngram: row}
+
+            'cp_start': array of where the transitions for each (row, level)
+            start in cp_chars. The transitions for (row, level) are at
+            cp_start[row * (max_level + 1) + level] up to the next entry
+
+            'cp_chars': The character each transition adds
+
+            'cp_next': The row of the context ngram after each transition, or
+            -1 if that ngram has no transitions
+
+            'best_level': For each (row, level), the highest level at or below
+            it that has transitions, or -1 if there isn't one
+    """
+
+    max_level = grammar['max_level']
+    num_levels = max_level + 1
+
+    contexts = sorted(grammar['cp'])
+    rows = {context: row for row, context in enumerate(contexts)}
+
+    cp_start = array('l')
+    cp_chars = []
+    cp_next = array('l')
+    best_level = array('b')
+
+    for context in contexts:
+        levels = grammar['cp'][context]
+
+        best = -1
+        for level in range(num_levels):
+            cp_start.append(len(cp_chars))
+
+            chars = levels.get(level, [])
+            if chars:
+                best = level
+            best_level.append(best)
+
+            for char in chars:
+                cp_chars.append(char)
+                cp_next.append(rows.get(context[1:] + char, -1))
+
+    cp_start.append(len(cp_chars))
+
+    return {
+        'max_level': max_level,
+        'ngram': grammar['ngram'],
+        'ip': grammar['ip'],
+        'ln': grammar['ln'],
+        'contexts': contexts,
+        'rows': rows,
+        'cp_start': cp_start,
+        'cp_chars': cp_chars,
+        'cp_next': cp_next,
+        'best_level': best_level,
+    }
+
+
+class IndexedMarkovCracker(MarkovCracker):
+    """
+    MarkovCracker that uses a compiled grammar, (see compile_grammar)
+
+    Sessions are saved in the same format as MarkovCracker, so a session saved
+    by one can be loaded by the other
+    """
+
+    def _create_guess_structure(self):
+        """
+        Creates the guess structure for the current IP and length pointers
+
+        Inputs:
+            None
+
+        Returns:
+            IndexedGuessStructure
+        """
+
+        return IndexedGuessStructure(
+            grammar = self.grammar,
+            ip = self.grammar['ip'][self.cur_ip[0]][self.cur_ip[1]],
+            cp_length = self.grammar['ln'][self.cur_len[0]][self.cur_len[1]],
+            target_level = self.target_level - self.cur_len[0] - self.cur_ip[0],
+            optimizer = self.optimizer,
+            )
+
+    def next_guesses(self, max_guesses = None):
+        """
+        Generates the "next" block of guesses from this model
+
+        Works the same as next_guess(), but returns a list of guesses at once.
+        The guesses all come from the same IP and length
+
+        Inputs:
+            max_guesses: (None/Int) The maximum number of guesses to return.
+            If None, up to MAX_BLOCK_SIZE guesses are returned
+
+        Returns:
+            guesses: A list of guesses
+
+            None: If there are no guesses left
+        """
+
+        # Deal with starting off the Markov chain
+        if self.cur_guess is None:
+
+            # Set the starting IP and Length
+            self.cur_len = [self.start_length, 0]
+            self.cur_ip  = [self.start_ip, 0]
+
+            self.cur_guess = self._create_guess_structure()
+
+        guesses = self.cur_guess.next_guesses(max_guesses)
+
+        # If guesses is None, then there isn't a guess for the current length
+        # so increase the length if possible
+        while guesses is None:
+
+            # Attempt to increase the IP for the curent target level + length
+            if not self._increase_ip_for_target(working_target = self.target_level - self.cur_len[0]):
+                # Attempt to increase the length for the current target level
+                if not self._increase_len_for_target():
+
+                    # Done with all password guesses for this level
+                    self.cur_guess = None
+                    return None
+
+            guesses = self.cur_guess.next_guesses(max_guesses)
+
+        return guesses
+
+    def _save_parse_tree(self):
+        """
+        Returns the parse tree of the current guess in the format it is saved to disk
+
+        Rows are saved as the context ngrams they stand for so that the save
+        file doesn't depend on how the grammar was compiled
+
+        Inputs:
+            None
+
+        Returns:
+            parse_tree: A list of [ip, level, index] for each CP of the guess
+        """
+
+        contexts = self.grammar['contexts']
+        return [[contexts[row], level, index] for row, level, index in self.cur_guess.parse_tree]
+
+    def _load_parse_tree(self, parse_tree):
+        """
+        Restores the parse tree of the current guess from the format it is
+        saved to disk in
+
+        Inputs:
+            parse_tree: A list of [ip, level, index] for each CP of the guess
+
+        Returns:
+            None
+        """
+
+        rows = self.grammar['rows']
+        self.cur_guess.parse_tree = [[rows[ip], level, index] for ip, level, index in parse_tree]
+
+
+class IndexedGuessStructure:
+    """
+    Will attempt to create guesses for a particular length + IP + target level
+
+    Works the same as GuessStructure, but each item in the parse tree is a
+    [row, level, index] list where row is the row of the context ngram in the
+    compiled grammar
+    """
+
+    def __init__(self, grammar, ip, cp_length, target_level, optimizer):
+        """
+        Initializes the guess structure
+
+        Inputs:
+            grammar: The compiled OMEN grammar
+
+            ip: The Initial probability: (Starting NGRAM)
+
+            cp_length: The number of conditional probability ngrams to
+            add after the IP.
+
+            target_level: The OMEN level to generate a gues for
+
+            optimizer: A TMTO optimizer to cache OMEN generated results
+            to make future guesses faster.
+
+        Returns:
+            IndexedGuessStructure
+        """
+
+        # Kept for compatibility with the save files of GuessStructure
+        self.first_guess = True
+
+        # The compiled CP tables
+        self.cp_start = grammar['cp_start']
+        self.cp_chars = grammar['cp_chars']
+        self.cp_next = grammar['cp_next']
+        self.best_level = grammar['best_level']
+
+        # The maximum level an item can be
+        self.max_level = grammar['max_level']
+        self.num_levels = self.max_level + 1
+
+        # The IP string to use, and its row in the CP tables
+        self.ip = ip
+        self.ip_row = grammar['rows'].get(ip, -1)
+
+        # The number of cps to add after the IP
+        self.cp_length = cp_length
+
+        # The target level for this item
+        self.target_level = target_level
+
+        # Initialize the parse_tree
+        self.parse_tree = []
+
+        # The optimizer
+        self.optimizer = optimizer
+
+        # If all the guesses have been created
+        self.done = False
+
+        # prefixes[i] is the guess created by the IP and the first i items in
+        # the parse tree. Only valid up to and including prefixes[changed]
+        self.prefixes = [ip]
+        self.changed = 0
+
+    def next_guess(self):
+        """
+        Get the next guess for this guess structure (aka level + IP)
+        Returns None if no valid guess is left
+
+        Inputs:
+            None:
+
+        Returns:
+            guess: The next guess that can be generated for this Markov structure.
+
+            None: If no more guesses can be generated
+        """
+
+        guesses = self.next_guesses(1)
+        if guesses is None:
+            return None
+
+        return guesses[0]
+
+    def next_guesses(self, max_guesses = None):
+        """
+        Get the next block of guesses for this guess structure
+
+        Inputs:
+            max_guesses: (None/Int) The maximum number of guesses to return.
+            If None, up to MAX_BLOCK_SIZE guesses are returned
+
+        Returns:
+            guesses: A list of the next guesses
+
+            None: If no more guesses can be generated
+        """
+
+        if self.done:
+            return None
+
+        if max_guesses is None or max_guesses > MAX_BLOCK_SIZE:
+            max_guesses = MAX_BLOCK_SIZE
+
+        # First Guess
+        if not self.parse_tree:
+            self.parse_tree = self._fill_out_parse_tree(self.ip_row, self.cp_length, self.target_level)
+            if not self.parse_tree:
+                return None
+
+            self.changed = 0
+
+        elif not self._increment_parse_tree():
+            self.done = True
+            return None
+
+        guesses = []
+        while True:
+            self._format_guesses(guesses, max_guesses)
+            if len(guesses) >= max_guesses:
+                return guesses
+
+            if not self._increment_parse_tree():
+                self.done = True
+                return guesses
+
+    def _increment_parse_tree(self):
+        """
+        Moves the parse tree to the next guess
+
+        If there are no guesses left the parse tree is left pointing to the
+        last guess, so it can still be saved if the session exits
+
+        Inputs:
+            None
+
+        Returns:
+            True: The parse tree was updated
+
+            False: There are no guesses left
+        """
+
+        cp_start = self.cp_start
+        num_levels = self.num_levels
+        parse_tree = self.parse_tree
+
+        # Shortcut deal with the last item
+        last_item = parse_tree[-1]
+        position = last_item[0] * num_levels + last_item[1]
+        if cp_start[position] + last_item[2] + 1 < cp_start[position + 1]:
+            last_item[2] += 1
+            return True
+
+        # Pop the last element off
+        element = parse_tree.pop()
+
+        # Quick bail out since there is nothing else to increment,
+        # (the parse tree was only one cp long)
+        if not parse_tree:
+            parse_tree.append(element)
+            return False
+
+        # The items that were popped off, and their level and index before
+        # they were changed. Used to put the parse tree back if there are no
+        # guesses left
+        popped = [(element, element[1], element[2])]
+
+        # The number of CP we need to fill in after this depth
+        req_length = 1
+
+        # The number of levels we have to fill for the final password from this depth
+        req_level = element[1] + parse_tree[-1][1]
+
+        # Now loop through all the possible items at this depth
+        while parse_tree:
+
+            last_item = parse_tree[-1]
+            last_level = last_item[1]
+            last_index = last_item[2]
+
+            # Everything after this item will need to be rebuilt
+            if len(parse_tree) - 1 < self.changed:
+                self.changed = len(parse_tree) - 1
+
+            # Start it out by incrementing the index of the last item
+            last_item[2] += 1
+
+            # The level we are workng from for this current depth
+            depth_level = last_item[1]
+
+            # Levels for depth start off at the max and go down to 0
+            while True:
+
+                start = cp_start[last_item[0] * num_levels + depth_level]
+                end = cp_start[last_item[0] * num_levels + depth_level + 1]
+
+                while start + last_item[2] < end:
+                    new_row = self.cp_next[start + last_item[2]]
+                    new_elements = self._fill_out_parse_tree(new_row, req_length, req_level - depth_level)
+
+                    # Found a match!!
+                    if new_elements is not None:
+                        parse_tree += new_elements
+                        return True
+
+                    # Otherwise, increase the index and try again at this depth level
+                    last_item[2] += 1
+
+                # No lower level, exit out of this
+                if depth_level == 0:
+                    break
+
+                # Try a lower level
+                depth_level = self._find_cp(last_item[0], depth_level - 1, 0)
+
+                # No lower level, exit
+                if depth_level < 0:
+                    break
+
+                last_item[1] = depth_level
+
+                # Reset the index to the start
+                last_item[2] = 0
+
+            # No match, go deeper
+            element = parse_tree.pop()
+            popped.append((element, last_level, last_index))
+            req_length += 1
+
+            if parse_tree:
+                req_level += parse_tree[-1][1]
+
+        # Put the parse tree back the way it was
+        for element, level, index in reversed(popped):
+            element[1] = level
+            element[2] = index
+            parse_tree.append(element)
+
+        return False
+
+    def _format_guesses(self, guesses, max_guesses):
+        """
+        Creates the guesses for all the remaining values of the last item in
+        the parse tree
+
+        The last item is left pointing to the last guess that was created
+
+        Inputs:
+            guesses: The list to add the guesses to
+
+            max_guesses: The maximum size of the guesses list
+
+        Returns:
+            None
+        """
+
+        cp_start = self.cp_start
+        cp_chars = self.cp_chars
+        num_levels = self.num_levels
+        parse_tree = self.parse_tree
+        prefixes = self.prefixes
+
+        # Rebuild the part of the guess that changed
+        last_pos = len(parse_tree) - 1
+        del prefixes[self.changed + 1:]
+        for item in parse_tree[self.changed:last_pos]:
+            prefixes.append(prefixes[-1] + cp_chars[cp_start[item[0] * num_levels + item[1]] + item[2]])
+        self.changed = last_pos
+
+        last_item = parse_tree[-1]
+        position = last_item[0] * num_levels + last_item[1]
+        start = cp_start[position] + last_item[2]
+        end = cp_start[position + 1]
+        if end - start > max_guesses - len(guesses):
+            end = start + max_guesses - len(guesses)
+
+        last_item[2] += end - start - 1
+
+        prefix = prefixes[last_pos]
+        guesses += [prefix + char for char in cp_chars[start:end]]
+
+    def _fill_out_parse_tree(self, row, length, target_level):
+        """
+        Fills out a parse tree for OME given an IP, length and
+        target level.
+
+        Inputs:
+            row: The row of the initial probability Ngram to start with
+
+            length: The length of the guess to generate
+
+            target_level: The target level to generate OMEN strings for
+
+        Returns:
+            result: the parse tree for this OMEN generation
+
+            None: If no valid parse tree exists for the IP/length/target level
+        """
+
+        if length == 1:
+            cp_level = self._find_cp(row, target_level, target_level)
+            if cp_level < 0:
+                return None
+            return [[row, cp_level, 0]]
+
+        optimize = length <= self.optimizer.max_length
+
+        ###--Check to see if the optimizer has an answer
+        if optimize:
+            found, result = self.optimizer.lookup(row, length, target_level)
+
+            # If a previous result was stored in the optimizer, return it
+            if found:
+                return result
+
+        cur_level = target_level
+
+        while cur_level >= 0:
+            # Find the top level CP for the current level
+            cp_level = self._find_cp(row, cur_level, 0)
+            if cp_level < 0:
+                break
+
+            start = self.cp_start[row * self.num_levels + cp_level]
+            end = self.cp_start[row * self.num_levels + cp_level + 1]
+            for position in range(start, end):
+                working_parse_tree = self._fill_out_parse_tree(
+                    row = self.cp_next[position],
+                    length = length - 1,
+                    target_level = target_level - cp_level
+                    )
+
+                if working_parse_tree is not None:
+                    result = [[row, cp_level, position - start]] + working_parse_tree
+                    if optimize:
+                        self.optimizer.update(row, length, target_level, result)
+                    return result
+
+            # Need to go one less than the returned cp level so we don't loop forever
+            cur_level = cp_level - 1
+
+        if optimize:
+            self.optimizer.update(row, length, target_level, None)
+        return None
+
+    def _find_cp(self, row, top_level, bottom_level):
+        """
+        Finds the highest level with transitions for a context ngram
+
+        Inputs:
+            row: The row of the context ngram. -1 if the ngram has no transitions
+
+            top_level: The highest OMEN level the CP can be
+
+            bottom_level: The lowest OMEN level the CP can be. Useful
+            for identifying the last CP in a string.
+
+        Returns:
+            level: The highest level, or -1 if there isn't one
+        """
+
+        if row < 0:
+            return -1
+
+        # Set the maximum level we're going to check
+        if self.max_level < top_level:
+            top_level = self.max_level
+
+        if top_level < bottom_level or top_level < 0:
+            return -1
+
+        level = self.best_level[row * self.num_levels + top_level]
+        if level < bottom_level:
+            return -1
+
+        return level
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+
+"""
+Counts how many guesses OMEN creates for a (IP, length, level)
+
+The counts are calculated the same way as the trainer does in
+lib_trainer/omen/evaluate_password._rec_calc_keyspace(). They are used to
+jump to a guess number in an OMEN level without creating all the guesses
+before it, (see MarkovCracker.seek)
+
+Works with both the grammar loaded by input_file_io.load_rules() and the
+compiled grammar used by IndexedMarkovCracker. With the original grammar a
+node of the Markov chain is its context ngram. With the compiled grammar it
+is the row of the context ngram, or -1 if the ngram has no transitions
+"""
+
+
+class Keyspace:
+    """
+    Calculates and caches OMEN keyspace counts
+    """
+
+    def __init__(self, grammar):
+        """
+        Initializes the keyspace counts
+
+        Inputs:
+            grammar: The OMEN grammar, either compiled or not
+
+        Returns:
+            Keyspace
+        """
+
+        self.grammar = grammar
+        self.max_level = grammar['max_level']
+
+        # If this is the compiled grammar used by IndexedMarkovCracker
+        self.compiled = 'cp_start' in grammar
+
+        # Cached counts. A dictionary of {(length, level): {node: count}}
+        self.cache = {}
+
+    def node(self, ip):
+        """
+        Returns the node of the Markov chain for an IP
+
+        Inputs:
+            ip: The initial probability ngram
+
+        Returns:
+            node: The context ngram or row
+        """
+
+        if self.compiled:
+            return self.grammar['rows'].get(ip, -1)
+
+        return ip
+
+    def transitions(self, node, level):
+        """
+        Returns the nodes that can follow a node at a given level
+
+        Inputs:
+            node: The context ngram or row
+
+            level: The level of the transition
+
+        Returns:
+            nodes: A list of the next nodes, in the order the guesses are
+            created in
+        """
+
+        if self.compiled:
+            if node < 0:
+                return []
+
+            position = node * (self.max_level + 1) + level
+            cp_start = self.grammar['cp_start']
+            return self.grammar['cp_next'][cp_start[position]:cp_start[position + 1]]
+
+        chars = self.grammar['cp'].get(node, {}).get(level, [])
+        return [node[1:] + char for char in chars]
+
+    def count(self, node, length, level):
+        """
+        Returns the number of guesses for a node, length and level
+
+        Inputs:
+            node: The context ngram or row to start from
+
+            length: The number of conditional probabilities to add
+
+            level: The OMEN level all the transitions must add up to
+
+        Returns:
+            count: (Int) The number of guesses
+        """
+
+        if level < 0:
+            return 0
+
+        # The last transition must use up the rest of the level. This is
+        # quick to look up so it isn't cached
+        if length == 1:
+            if level > self.max_level:
+                return 0
+
+            if self.compiled:
+                if node < 0:
+                    return 0
+                position = node * (self.max_level + 1) + level
+                return self.grammar['cp_start'][position + 1] - self.grammar['cp_start'][position]
+
+            return len(self.grammar['cp'].get(node, {}).get(level, []))
+
+        cache = self.cache.setdefault((length, level), {})
+        if node in cache:
+            return cache[node]
+
+        count = 0
+        for cp_level in range(min(level, self.max_level) + 1):
+            for next_node in self.transitions(node, cp_level):
+                count += self.count(next_node, length - 1, level - cp_level)
+
+        cache[node] = count
+        return count
+
+    def unrank(self, node, length, level, index):
+        """
+        Returns the parse tree of the guess at an index
+
+        Guesses are counted in the same order as they are created by a guess
+        structure, highest level transitions first
+
+        Inputs:
+            node: The context ngram or row to start from
+
+            length: The number of conditional probabilities to add
+
+            level: The OMEN level all the transitions must add up to
+
+            index: The index of the guess. Must be less than
+            count(node, length, level)
+
+        Returns:
+            parse_tree: A list of [node, level, index] for each conditional
+            probability of the guess
+        """
+
+        parse_tree = []
+
+        while length > 1:
+            for cp_level in range(min(level, self.max_level), -1, -1):
+                found = False
+                for cp_index, next_node in enumerate(self.transitions(node, cp_level)):
+                    count = self.count(next_node, length - 1, level - cp_level)
+                    if index < count:
+                        found = True
+                        break
+                    index -= count
+
+                if found:
+                    break
+
+            parse_tree.append([node, cp_level, cp_index])
+            node = next_node
+            length -= 1
+            level -= cp_level
+
+        parse_tree.append([node, level, index])
+        return parse_tree
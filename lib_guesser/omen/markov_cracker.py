@@ -14,6 +14,7 @@ import pickle # Used for saving sessions
 
 # Local imports
 from .guess_structure import GuessStructure
+from .keyspace import Keyspace
 
 
 class MarkovCracker:
@@ -23,7 +24,7 @@ class MarkovCracker:
     Based on OMEN
     """
 
-    def __init__(self, grammar, target_level = 1, optimizer = None):
+    def __init__(self, grammar, target_level = 1, optimizer = None, keyspace = None):
         """
         Initializes the cracker
 
@@ -37,6 +38,9 @@ class MarkovCracker:
             optimizer: A TMTO option to cache words to make guess generation
             faster over time.
 
+            keyspace: (None/Keyspace) Keyspace counts for the grammar, used by
+            seek(). Can be shared between crackers. Created when needed if None
+
         """
 
         # Store the ruleset
@@ -70,6 +74,29 @@ class MarkovCracker:
         # The current guess structure
         self.cur_guess = None
 
+        # Keyspace counts for seeking to a guess number
+        self.keyspace = keyspace
+
+    def _create_guess_structure(self):
+        """
+        Creates the guess structure for the current IP and length pointers
+
+        Inputs:
+            None
+
+        Returns:
+            GuessStructure
+        """
+
+        return GuessStructure(
+            cp = self.grammar['cp'],
+            max_level = self.max_level,
+            ip = self.grammar['ip'][self.cur_ip[0]][self.cur_ip[1]],
+            cp_length = self.grammar['ln'][self.cur_len[0]][self.cur_len[1]],
+            target_level = self.target_level - self.cur_len[0] - self.cur_ip[0],
+            optimizer = self.optimizer,
+            )
+
     def _find_first_object(self, lookup_table):
         """
         Finds the first valid IP or Length object
@@ -112,14 +139,7 @@ class MarkovCracker:
             self.cur_ip  = [self.start_ip, 0]
 
             # Create the guess structure
-            self.cur_guess = GuessStructure(
-                max_level = self.max_level,
-                cp = self.grammar['cp'],
-                ip = self.grammar['ip'][self.cur_ip[0]][self.cur_ip[1]],
-                cp_length = self.grammar['ln'][self.cur_len[0]][self.cur_len[1]],
-                target_level = self.target_level  - self.cur_len[0] - self.cur_ip[0],
-                optimizer = self.optimizer,
-                )
+            self.cur_guess = self._create_guess_structure()
 
         # Grab the next guess for the current length and current target
         guess =  self.cur_guess.next_guess()
@@ -176,14 +196,7 @@ class MarkovCracker:
                 self.cur_ip  = [self.start_ip, 0]
 
                 # Reset the current guess
-                self.cur_guess = GuessStructure(
-                    cp = self.grammar['cp'],
-                    max_level = self.max_level,
-                    ip = self.grammar['ip'][self.cur_ip[0]][self.cur_ip[1]],
-                    cp_length = self.grammar['ln'][self.cur_len[0]][self.cur_len[1]],
-                    target_level = self.target_level  - self.cur_len[0] - self.cur_ip[0],
-                    optimizer = self.optimizer,
-                    )
+                self.cur_guess = self._create_guess_structure()
                 return True
 
             # No valid items at this level, check if we can go up a level
@@ -223,14 +236,7 @@ class MarkovCracker:
                 self.cur_ip = [level, index]
 
                 # Reset the current guess
-                self.cur_guess = GuessStructure(
-                    cp = self.grammar['cp'],
-                    max_level = self.max_level,
-                    ip = self.grammar['ip'][self.cur_ip[0]][self.cur_ip[1]],
-                    cp_length = self.grammar['ln'][self.cur_len[0]][self.cur_len[1]],
-                    target_level = self.target_level - self.cur_len[0] - self.cur_ip[0],
-                    optimizer = self.optimizer,
-                    )
+                self.cur_guess = self._create_guess_structure()
                 return True
 
             # No valid items at this level, check if we can go up a level
@@ -241,6 +247,106 @@ class MarkovCracker:
             elif level > working_target:
                 return False
 
+    def count_guesses(self):
+        """
+        Returns the exact number of guesses for the target level
+
+        Inputs:
+            None
+
+        Returns:
+            num_guesses: (Int) The number of guesses
+        """
+
+        # Walking the cells moves the pointers, so put them back after
+        saved = (self.cur_len, self.cur_ip, self.cur_guess)
+        num_guesses = sum(size for _, _, _, size in self._walk_cells())
+        self.cur_len, self.cur_ip, self.cur_guess = saved
+
+        return num_guesses
+
+    def seek(self, guess_num):
+        """
+        Moves to a guess number in the target level without creating any of
+        the guesses before it
+
+        The next guess returned by next_guess() will be guess_num, (counting
+        from 0), so a level can be split up by index ranges
+
+        Inputs:
+            guess_num: The number of guesses to skip
+
+        Returns:
+            True: If the cracker was moved to guess_num
+
+            False: If the level has fewer than guess_num guesses. The cracker
+            is moved to the end of the level
+        """
+
+        # Start from the beginning of the level
+        self.cur_guess = None
+        if guess_num <= 0:
+            return True
+
+        # The cracker is left pointing to the guess before guess_num, since
+        # that's what the guess structures expect when they are restored
+        index = guess_num - 1
+
+        # The last (length, IP) with guesses, in case guess_num is past the end
+        last = None
+
+        for node, cp_length, level, size in self._walk_cells():
+            if index < size:
+                self.cur_guess.parse_tree = self.keyspace.unrank(node, cp_length, level, index)
+                return True
+
+            index -= size
+            if size:
+                last = (self.cur_len, self.cur_ip, node, cp_length, level, size)
+
+        # Point to the very last guess of the level
+        if last is not None:
+            self.cur_len, self.cur_ip, node, cp_length, level, size = last
+            self.cur_guess = self._create_guess_structure()
+            self.cur_guess.parse_tree = self.keyspace.unrank(node, cp_length, level, size - 1)
+
+        return False
+
+    def _walk_cells(self):
+        """
+        Moves through every (length, IP) of the target level, in the order
+        guesses are created for them
+
+        The cracker's pointers and guess structure are updated for each one
+
+        Inputs:
+            None
+
+        Returns:
+            A generator of (node, cp_length, level, size) where size is the
+            number of guesses for the current length and IP
+        """
+
+        if self.keyspace is None:
+            self.keyspace = Keyspace(self.grammar)
+
+        self.cur_len = [self.start_length, 0]
+        self.cur_ip  = [self.start_ip, 0]
+        self.cur_guess = self._create_guess_structure()
+
+        while True:
+            node = self.keyspace.node(self.cur_guess.ip)
+            cp_length = self.cur_guess.cp_length
+            level = self.cur_guess.target_level
+
+            yield node, cp_length, level, self.keyspace.count(node, cp_length, level)
+
+            # Attempt to increase the IP for the curent target level + length
+            if not self._increase_ip_for_target(working_target = self.target_level - self.cur_len[0]):
+                # Attempt to increase the length for the current target level
+                if not self._increase_len_for_target():
+                    return
+
     def save_session(self, file_name):
         """
         Saves a cracking session to disk
@@ -264,7 +370,7 @@ class MarkovCracker:
 
             # Save the guess structure variables here, not saving the full guess structure since it
             # includes a link to the grammar itself.
-            pickle.dump(self.cur_guess.parse_tree, file)
+            pickle.dump(self._save_parse_tree(), file)
             pickle.dump(self.cur_guess.first_guess, file)
 
     def load_session(self, file_name, pt_item):
@@ -290,18 +396,38 @@ class MarkovCracker:
             parse_tree = pickle.load(file)
             first_guess = pickle.load(file)
 
-            self.cur_guess = GuessStructure(
-                cp = self.grammar['cp'],
-                max_level = self.max_level,
-                ip = self.grammar['ip'][self.cur_ip[0]][self.cur_ip[1]],
-                cp_length = self.grammar['ln'][self.cur_len[0]][self.cur_len[1]],
-                target_level = self.target_level - self.cur_len[0] - self.cur_ip[0],
-                optimizer = self.optimizer
-                )
+            self.cur_guess = self._create_guess_structure()
 
             # Update the status report item with the real level
             pt_item['pt'][0][1] = self.target_level -1
             pt_item['pt'][0][2] = self.target_level -1
 
-            self.cur_guess.parse_tree = parse_tree
+            self._load_parse_tree(parse_tree)
             self.cur_guess.first_guess = first_guess
+
+    def _save_parse_tree(self):
+        """
+        Returns the parse tree of the current guess in the format it is saved to disk
+
+        Inputs:
+            None
+
+        Returns:
+            parse_tree: A list of [ip, level, index] for each CP of the guess
+        """
+
+        return self.cur_guess.parse_tree
+
+    def _load_parse_tree(self, parse_tree):
+        """
+        Restores the parse tree of the current guess from the format it is
+        saved to disk in
+
+        Inputs:
+            parse_tree: A list of [ip, level, index] for each CP of the guess
+
+        Returns:
+            None
+        """
+
+        self.cur_guess.parse_tree = parse_tree
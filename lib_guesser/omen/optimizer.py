@@ -9,51 +9,58 @@ filling out guesses for level + length + starting string combinations
 """
 
 
+import collections
+
+
+# The default maximum number of results to cache
+DEFAULT_MAX_SIZE = 100000
+
+
 class Optimizer:
     """
     Contains all the logic to speed up guess generation by using tmto tricks
 
     Creating this as a class so I can easily pass it around
+
+    The cache is bounded. Once it is full, the result that was used the
+    longest time ago is thrown out to make room for new ones
     """
 
-    def __init__(self, max_length):
+    def __init__(self, max_length, max_size = DEFAULT_MAX_SIZE):
         """
         Initializes the optimizer
 
         Inputs:
             max_length: The maximum length of strings to optimize. Increasing this
             increases memory requirements
+
+            max_size: The maximum number of results to cache
         """
 
         self.max_length = max_length
+        self.max_size = max_size
 
         # The grammar lookup
         #
-        # Will be a list indexed on the length
-        # so length 1 will be at position 1
-        # dictionary lookups will be of the format
-        # {
-        #    'ip_ngram':{
-        #         'level': 'first result',
-        #         'level2': 'first result',
-        #         ...
-        #    },
-        #   'ip_ngram2':{
-        #         'level':'first result',
-        #    }
-        #    ...,
-        # }
+        # Keys are (length, ip_ngram, target_level), and the values are the
+        # first parse tree found for them, (or None if there isn't one)
         #
         # Example (assuming length = 4):
         # {
-        #   'abc':{
-        #       '0':[[abc, 0],[bcd,0], [cde, 0], [def, 0]],
-        #       '5[[abc, 1],[bc1,1], [c12, 2], [123, 1]],
-        #   },
+        #   (4, 'abc', 0): [[abc, 0],[bcd,0], [cde, 0], [def, 0]],
+        #   (4, 'abc', 5): [[abc, 1],[bc1,1], [c12, 2], [123, 1]],
         # }
-        self.tmto_lookup = []
-        for i in range(self.max_length + 1):
-            self.tmto_lookup.append({})
+        #
+        # Kept in the order the results were last used in so the least
+        # recently used result can be found quickly
+        self.tmto_lookup = collections.OrderedDict()
+
+        # Statistics for the status report
+        self.hits = 0
+        self.misses = 0
+
+        # If results have been added since the optimizer was created or loaded
+        self.modified = False
 
     def lookup(self, ip_ngram, length, target_level):
         """
@@ -74,11 +81,18 @@ class Optimizer:
             parse_tree: The first parse tree to match the lookup criteria.
             Returns None if no parse tree matches it
         """
+
+        key = (length, ip_ngram, target_level)
         try:
-            return True, self.custom_copy( self.tmto_lookup[length][ip_ngram][target_level] )
+            result = self.tmto_lookup[key]
         except KeyError:
+            self.misses += 1
             return False, None
 
+        self.hits += 1
+        self.tmto_lookup.move_to_end(key)
+        return True, self.custom_copy(result)
+
     def update(self, ip_ngram, length, target_level, parse_tree):
         """
         Updates the optimizer with a found result
@@ -93,11 +107,50 @@ class Optimizer:
             parse_tree: The parse tree of the found result
         """
 
-        ##--If we haven't seen this ip_ngram for this length before
-        if ip_ngram not in self.tmto_lookup[length]:
-            self.tmto_lookup[length][ip_ngram] = {}
+        key = (length, ip_ngram, target_level)
+        self.tmto_lookup[key] = self.custom_copy(parse_tree)
+        self.tmto_lookup.move_to_end(key)
+        self.modified = True
+
+        ##--Throw out the least recently used result if the cache is full
+        if len(self.tmto_lookup) > self.max_size:
+            self.tmto_lookup.popitem(last = False)
+
+    def save_state(self):
+        """
+        Returns the cached results so they can be saved to disk
+
+        Inputs:
+            None
+
+        Returns:
+            state: A list of (key, parse_tree) from least to most recently used
+        """
+
+        self.modified = False
+        return list(self.tmto_lookup.items())
+
+    def load_state(self, state):
+        """
+        Loads results previously returned by save_state
+
+        Results for strings longer than max_length are skipped, and if there
+        are more than max_size, only the most recently used ones are kept
+
+        Inputs:
+            state: A list of (key, parse_tree) from least to most recently used
+
+        Returns:
+            None
+        """
+
+        for key, parse_tree in state:
+            if key[0] <= self.max_length:
+                self.tmto_lookup[key] = parse_tree
+                self.tmto_lookup.move_to_end(key)
 
-        self.tmto_lookup[length][ip_ngram][target_level] = self.custom_copy(parse_tree)
+        while len(self.tmto_lookup) > self.max_size:
+            self.tmto_lookup.popitem(last = False)
 
     def custom_copy(self, input_list):
         """
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+
+"""
+Splits up the guesses for an OMEN level so they can be created in parallel
+
+MarkovCracker walks through every (length, IP) combination for a level one
+after the other. The guesses for each (length, IP) cell don't depend on any
+of the other cells, so the cells are split into partitions of consecutive
+cells which can be handed out to different worker processes.
+
+The position reached in each partition is tracked seperately, so a session
+can be saved while multiple partitions are still being worked on and
+restored later, even with a different number of workers.
+
+When the partitions are written out in order the guesses are the same, and in
+the same order, as MarkovCracker creates for the level
+"""
+
+
+import pickle # Used for saving sessions
+
+# Local imports
+from .indexed_cracker import IndexedMarkovCracker
+
+
+# The number of (length, IP) cells in each partition
+DEFAULT_PARTITION_SIZE = 64
+
+
+def list_cells(grammar, target_level):
+    """
+    Lists the (length, IP) cells of an OMEN level
+
+    Inputs:
+        grammar: The compiled OMEN grammar
+
+        target_level: The OMEN level
+
+    Returns:
+        cells: A list of (length pointer, IP pointer) in the order
+        MarkovCracker creates guesses for them
+    """
+
+    cracker = IndexedMarkovCracker(grammar, target_level)
+    cracker.cur_len = [cracker.start_length, 0]
+    cracker.cur_ip = [cracker.start_ip, 0]
+
+    cells = []
+    while True:
+        cells.append((tuple(cracker.cur_len), tuple(cracker.cur_ip)))
+
+        if not cracker._increase_ip_for_target(working_target = target_level - cracker.cur_len[0]):
+            if not cracker._increase_len_for_target():
+                return cells
+
+
+def generate_guesses(grammar, target_level, cells, parse_tree, max_guesses, optimizer):
+    """
+    Creates the guesses for a list of (length, IP) cells
+
+    Inputs:
+        grammar: The compiled OMEN grammar
+
+        target_level: The OMEN level
+
+        cells: The list of (length pointer, IP pointer) to create guesses for
+
+        parse_tree: The saved parse tree of the last guess created for the
+        first cell. If None, starts at the beginning of the first cell
+
+        max_guesses: The maximum number of guesses to create
+
+        optimizer: A TMTO optimizer to cache OMEN generated results
+
+    Returns:
+        (guesses, num_finished, parse_tree):
+
+            guesses: The list of guesses
+
+            num_finished: The number of cells all the guesses were created for
+
+            parse_tree: The saved parse tree of the last guess created for the
+            cell it stopped in. None if it stopped at the start of a cell
+    """
+
+    cracker = IndexedMarkovCracker(grammar, target_level, optimizer)
+    guesses = []
+
+    for num_finished, (cur_len, cur_ip) in enumerate(cells):
+
+        if len(guesses) >= max_guesses:
+            return guesses, num_finished, None
+
+        cracker.cur_len = list(cur_len)
+        cracker.cur_ip = list(cur_ip)
+        cracker.cur_guess = cracker._create_guess_structure()
+
+        if parse_tree is not None:
+            cracker._load_parse_tree(parse_tree)
+            parse_tree = None
+
+        while len(guesses) < max_guesses:
+            block = cracker.cur_guess.next_guesses(max_guesses - len(guesses))
+            if block is None:
+                break
+            guesses += block
+
+        # Hit the limit in the middle of the cell
+        else:
+            return guesses, num_finished, cracker._save_parse_tree()
+
+    return guesses, len(cells), None
+
+
+class PartitionedMarkovCracker:
+    """
+    Tracks the guesses created for an OMEN level split up into partitions
+    """
+
+    def __init__(self, grammar, target_level = 1, optimizer = None,
+        partition_size = DEFAULT_PARTITION_SIZE):
+        """
+        Initializes the cracker
+
+        Inputs:
+            grammar: The compiled OMEN grammar
+
+            target_level: The target OMEN level to generate guesses for
+
+            optimizer: A TMTO option to cache words to make guess generation
+            faster over time.
+
+            partition_size: The number of (length, IP) cells in each partition
+
+        Returns:
+            PartitionedMarkovCracker
+        """
+
+        self.grammar = grammar
+        self.optimizer = optimizer
+        self.partition_size = partition_size
+
+        self._set_target_level(target_level)
+
+    def _set_target_level(self, target_level):
+        """
+        Splits up the cells for a level and resets all the partitions to
+        the start
+
+        Inputs:
+            target_level: The OMEN level
+
+        Returns:
+            None
+        """
+
+        self.target_level = target_level
+        self.cells = list_cells(self.grammar, target_level)
+
+        # For each partition, [the cell it is at, the saved parse tree of the
+        # last guess created in that cell]. The parse trees use the context
+        # ngrams vs. rows so they don't depend on how the grammar was compiled
+        self.positions = [
+            [start, None] for start in range(0, len(self.cells), self.partition_size)
+        ]
+
+    def num_partitions(self):
+        """
+        Returns the number of partitions the level is split into
+        """
+
+        return len(self.positions)
+
+    def is_done(self, partition):
+        """
+        Returns True if all the guesses for a partition have been created
+
+        Inputs:
+            partition: The index of the partition
+
+        Returns:
+            Boolean
+        """
+
+        return self.positions[partition][0] >= self._end(partition)
+
+    def task(self, partition, max_guesses):
+        """
+        Returns the arguments to pass to generate_guesses() to create the
+        next guesses for a partition
+
+        Inputs:
+            partition: The index of the partition
+
+            max_guesses: The maximum number of guesses to create
+
+        Returns:
+            (target_level, cells, parse_tree, max_guesses)
+        """
+
+        cell, parse_tree = self.positions[partition]
+        return (
+            self.target_level,
+            self.cells[cell:self._end(partition)],
+            parse_tree,
+            max_guesses
+            )
+
+    def update(self, partition, num_finished, parse_tree):
+        """
+        Moves a partition forward after its guesses have been written out
+
+        Inputs:
+            partition: The index of the partition
+
+            num_finished, parse_tree: As returned by generate_guesses()
+
+        Returns:
+            None
+        """
+
+        position = self.positions[partition]
+        position[0] += num_finished
+        position[1] = parse_tree
+
+    def next_guesses(self, partition, max_guesses):
+        """
+        Creates the next guesses for a partition in this process
+
+        Inputs:
+            partition: The index of the partition
+
+            max_guesses: The maximum number of guesses to return
+
+        Returns:
+            guesses: A list of guesses. Empty if the partition is done
+        """
+
+        target_level, cells, parse_tree, max_guesses = self.task(partition, max_guesses)
+        guesses, num_finished, parse_tree = generate_guesses(
+            self.grammar,
+            target_level,
+            cells,
+            parse_tree,
+            max_guesses,
+            self.optimizer
+            )
+
+        self.update(partition, num_finished, parse_tree)
+        return guesses
+
+    def save_session(self, file_name):
+        """
+        Saves the position of every partition to disk
+
+        Inputs:
+            file_name: The file to save the cracking session to
+
+        Returns:
+            None
+        """
+
+        with open(file_name, 'wb') as file:
+            pickle.dump(self.target_level, file)
+            pickle.dump(self.partition_size, file)
+            pickle.dump(self.positions, file)
+
+    def load_session(self, file_name, pt_item):
+        """
+        Restores a session from disk
+
+        Inputs:
+            file_name: The name of the file to load the session from
+
+            pt_item: Status report item that needs to be re-initialized
+
+        Returns:
+            None
+        """
+
+        with open(file_name, 'rb') as file:
+            target_level = pickle.load(file)
+            self.partition_size = pickle.load(file)
+            positions = pickle.load(file)
+
+        self._set_target_level(target_level)
+        self.positions = positions
+
+        # Update the status report item with the real level
+        pt_item['pt'][0][1] = self.target_level -1
+        pt_item['pt'][0][2] = self.target_level -1
+
+    def _end(self, partition):
+        """
+        Returns the index of the cell after the last one in a partition
+        """
+
+        return min((partition + 1) * self.partition_size, len(self.cells))
@@ -0,0 +1,544 @@
+#!/usr/bin/env python3
+
+
+"""
+
+Name: PCFG_Guesser Password Policy
+
+Description: Skips creating guesses that don't meet a password policy, such
+as "at least 12 characters with a digit and an uppercase letter"
+
+Most of a policy can be checked on the parse tree itself, without creating
+any guesses. The length of a guess is the length of its terminals, (A8 is 8
+letters, D4 is 4 digits), and the character classes come from the terminal
+values and capitalization masks. Checks are done at three levels:
+
+    Base structures: Dropped when starting a session if no parse tree of the
+        base structure can meet the policy
+
+    Parse trees: Children are not added to the priority queue if neither
+        they nor any of their children can meet the policy, (the later
+        values of a terminal can still add a character class, for example
+        a capitalization mask with an uppercase letter)
+
+    Terminal values: When creating guesses for a parse tree, values that
+        can't be part of a compliant guess are skipped, such as the all
+        lowercase masks when only the mask can add an uppercase letter
+
+If a parse tree can still create guesses that don't meet the policy, (for
+example two keyboard walks where only some of the values have digits), or
+the guesses come from OMEN, each guess is checked before it is written out.
+
+The case of the letters in an alpha string comes from its capitalization
+mask. Parse trees with alpha strings that have letters without a case, (or
+that change length when uppercased), are checked one by one.
+
+"""
+
+
+import functools
+import operator
+
+
+# Character classes, stored as bit flags
+LOWER = 1
+UPPER = 2
+DIGIT = 4
+SPECIAL = 8
+
+# Not a character class. Marks alpha strings where the capitalization mask
+# doesn't tell which classes the letters end up in
+UNCASED = 16
+
+ALL_FLAGS = LOWER | UPPER | DIGIT | SPECIAL | UNCASED
+
+# The names of the character classes, as used on the command line
+CHARACTER_CLASSES = {
+    'lower': LOWER,
+    'upper': UPPER,
+    'digit': DIGIT,
+    'special': SPECIAL,
+}
+
+
+def find_classes(value):
+    """
+    Returns the character classes in a string
+
+    Inputs:
+        value: The string to check
+
+    Returns:
+        classes: The character class flags that are in the string. Letters
+        without a case aren't in any class
+    """
+
+    classes = 0
+    for char in value:
+        if char.isdigit():
+            classes |= DIGIT
+        elif char.islower():
+            classes |= LOWER
+        elif char.isupper():
+            classes |= UPPER
+        elif not char.isalnum():
+            classes |= SPECIAL
+
+    return classes
+
+
+def _word_classes(word):
+    """
+    Returns the character classes of an alpha string, not counting the case
+    of its letters, which comes from the capitalization mask
+    """
+
+    # The common case, every character is a lowercase letter that uppercases
+    # to a single letter
+    upper = word.upper()
+    if len(upper) == len(word) and not any(map(operator.eq, upper, word)):
+        return 0
+
+    classes = find_classes(word) & (DIGIT | SPECIAL)
+    for char in word:
+        if char.isalpha() and not (char.islower() and len(char.upper()) == 1):
+            classes |= UNCASED
+            break
+
+    return classes
+
+
+def _mask_classes(mask):
+    """
+    Returns the character classes a capitalization mask adds to a word
+    """
+
+    classes = 0
+    if 'L' in mask:
+        classes |= LOWER
+    if 'U' in mask:
+        classes |= UPPER
+
+    return classes
+
+
+def _summarize(infos):
+    """
+    Sums up a list of (length, classes) for the values of a terminal
+
+    Inputs:
+        infos: A list of (length, classes)
+
+    Returns:
+        summary: (min_length, max_length, always, possible) where always
+        are the classes in every value, and possible are the classes in any
+        value
+    """
+
+    min_length = min(length for length, _ in infos)
+    max_length = max(length for length, _ in infos)
+
+    always = ALL_FLAGS
+    possible = 0
+    for _, classes in infos:
+        always &= classes
+        possible |= classes
+
+    return min_length, max_length, always, possible
+
+
+def _combine(summaries):
+    """
+    Combines the summaries of several terminals that can be used in the same
+    position into one summary
+    """
+
+    return (
+        min(summary[0] for summary in summaries),
+        max(summary[1] for summary in summaries),
+        _and_all(summary[2] for summary in summaries),
+        _or_all(summary[3] for summary in summaries),
+    )
+
+
+def _and_all(flags):
+    result = ALL_FLAGS
+    for flag in flags:
+        result &= flag
+    return result
+
+
+def _or_all(flags):
+    result = 0
+    for flag in flags:
+        result |= flag
+    return result
+
+
+class PasswordPolicy:
+    """
+    A minimum/maximum length and the character classes a guess must have
+    """
+
+    def __init__(self, min_length = 0, max_length = None, required = ()):
+        """
+        Basic initialization function
+
+        Inputs:
+            min_length: The minimum length of a guess
+
+            max_length: The maximum length of a guess. None if there is no
+            maximum
+
+            required: A list of the names of the character classes every
+            guess needs, (see CHARACTER_CLASSES)
+
+        Returns:
+            PasswordPolicy
+
+            If a character class isn't known will pass back ValueError
+        """
+
+        self.min_length = min_length
+        self.max_length = max_length
+
+        self.required = 0
+        for name in required:
+            if name not in CHARACTER_CLASSES:
+                raise ValueError(f"Unknown character class: {name}")
+            self.required |= CHARACTER_CLASSES[name]
+
+        # The (length, classes) of every value of a terminal, and the summary
+        # of them. Keyed by (type, index, is_cased)
+        self.value_cache = {}
+        self.summary_cache = {}
+
+        # Keyed by (type, is_cased). The summary of a terminal's values from
+        # each index to the end
+        self.suffix_cache = {}
+
+        # Keyed by the replacements of a base structure, (see _base_info)
+        self.base_cache = {}
+
+        # The (pt, result) of the last filter_pt() call, since it is called
+        # for the same parse tree to count and then create its guesses
+        self.last_pt = None
+
+    def check(self, guess):
+        """
+        Checks if a guess meets the policy
+
+        Inputs:
+            guess: The guess as a string
+
+        Returns:
+            is_valid: True if the guess meets the policy
+        """
+
+        if len(guess) < self.min_length:
+            return False
+
+        if self.max_length is not None and len(guess) > self.max_length:
+            return False
+
+        required = self.required
+        if not required:
+            return True
+
+        return find_classes(guess) & required == required
+
+    def filter_guesses(self, guesses):
+        """
+        Returns the guesses that meet the policy, in the same order
+        """
+
+        check = self.check
+        return [guess for guess in guesses if check(guess)]
+
+    def base_can_comply(self, grammar, replacements):
+        """
+        Checks if any parse tree of a base structure can meet the policy
+
+        Needs to load every terminal used by the base structure
+
+        Inputs:
+            grammar: The PcfgGrammar's grammar
+
+            replacements: The replacements of the base structure
+
+        Returns:
+            can_comply: False if none of its guesses can meet the policy
+        """
+
+        # OMEN guesses are checked one by one
+        if replacements[0][0] == 'M':
+            return True
+
+        return self.subtree_can_comply(grammar, tuple(replacements), (0,) * len(replacements))
+
+    def subtree_can_comply(self, grammar, replacements, indices):
+        """
+        Checks if a parse tree, or any of its children, can meet the policy
+
+        Children only ever move to later values of a terminal, so this only
+        needs to look at the values from the current indices on
+
+        Inputs:
+            grammar: The PcfgGrammar's grammar
+
+            replacements: A tuple of the replacements of the base structure
+
+            indices: The grammar index for each replacement
+
+        Returns:
+            can_comply: False if none of the guesses of the parse tree or
+            its children can meet the policy
+        """
+
+        info = self.base_cache.get(replacements)
+        if info is None:
+            info = self._base_info(grammar, replacements)
+
+        # OMEN
+        if info is True:
+            return True
+
+        _, max_lengths, min_lengths, possibles = info
+        getitem = operator.getitem
+
+        if sum(map(getitem, max_lengths, indices)) < self.min_length:
+            return False
+
+        if self.max_length is not None and sum(map(getitem, min_lengths, indices)) > self.max_length:
+            return False
+
+        required = self.required
+        return functools.reduce(operator.or_, map(getitem, possibles, indices), 0) & required == required
+
+    def filter_pt(self, grammar, pt):
+        """
+        Finds the terminal values of a parse tree that can be part of a
+        guess that meets the policy
+
+        Inputs:
+            grammar: The PcfgGrammar's grammar
+
+            pt: The parse tree, which is a list of (type, index)
+
+        Returns:
+            (keep, is_checked): keep has an item for each replacement, which
+            is None if every value can be used, or a list of the indices of
+            the values to use. is_checked is True if the guesses still need
+            to be checked one by one
+
+            None: If no guess of the parse tree can meet the policy
+        """
+
+        pt_key = tuple(pt)
+        if self.last_pt is not None and self.last_pt[0] == pt_key:
+            return self.last_pt[1]
+
+        result = self._filter_pt(grammar, pt)
+        self.last_pt = (pt_key, result)
+
+        return result
+
+    def _filter_pt(self, grammar, pt):
+        """
+        Does the work for filter_pt()
+        """
+
+        # OMEN parse trees can't be checked ahead of time
+        if pt[0][0][0] == 'M':
+            return [None], True
+
+        replacements = tuple([pt_type for pt_type, _ in pt])
+        info = self.base_cache.get(replacements)
+        if info is None:
+            info = self._base_info(grammar, replacements)
+        cased = info[0]
+
+        keys = []
+        summaries = []
+        for position, (pt_type, index) in enumerate(pt):
+            key = (pt_type, index, cased[position])
+            keys.append(key)
+            summaries.append(self._summary(grammar, key))
+
+        if not self._can_comply(summaries):
+            return None
+
+        total_min = sum(summary[0] for summary in summaries)
+        total_max = sum(summary[1] for summary in summaries)
+
+        keep = [None] * len(pt)
+        for position, summary in enumerate(summaries):
+
+            # What the values at this position need, given the best the
+            # other positions could do
+            other_possible = _or_all(other[3] for i, other in enumerate(summaries) if i != position)
+            need = self.required & ~other_possible
+            shortest = self.min_length - (total_max - summary[1])
+            longest = None
+            if self.max_length is not None:
+                longest = self.max_length - (total_min - summary[0])
+
+            if summary[2] & need == need and summary[0] >= shortest and (longest is None or summary[1] <= longest):
+                continue
+
+            keep[position] = [
+                value_index for value_index, (length, classes) in enumerate(self._values(grammar, keys[position]))
+                if classes & need == need and length >= shortest and (longest is None or length <= longest)
+            ]
+
+            if not keep[position]:
+                return None
+
+        # Check if every guess that is left meets the policy
+        for position, indices in enumerate(keep):
+            if indices is not None:
+                infos = self._values(grammar, keys[position])
+                summaries[position] = _summarize([infos[value_index] for value_index in indices])
+
+        is_checked = not (
+            not _or_all(summary[3] for summary in summaries) & UNCASED and
+            sum(summary[0] for summary in summaries) >= self.min_length and
+            (self.max_length is None or sum(summary[1] for summary in summaries) <= self.max_length) and
+            _or_all(summary[2] for summary in summaries) & self.required == self.required
+            )
+
+        return keep, is_checked
+
+    def _can_comply(self, summaries):
+        """
+        Checks if the best case of a list of summaries meets the policy
+        """
+
+        if sum(summary[1] for summary in summaries) < self.min_length:
+            return False
+
+        if self.max_length is not None and sum(summary[0] for summary in summaries) > self.max_length:
+            return False
+
+        return _or_all(summary[3] for summary in summaries) & self.required == self.required
+
+    def _base_info(self, grammar, replacements):
+        """
+        Sets up the lookup tables for the parse trees of a base structure
+
+        Inputs:
+            grammar: The PcfgGrammar's grammar
+
+            replacements: A tuple of the replacements of the base structure
+
+        Returns:
+            (cased, max_lengths, min_lengths, possibles): cased is True for
+            each replacement that is an alpha string followed by a mask. The
+            others have a list for each replacement, where item i is for the
+            values from index i on, (see _suffix)
+
+            True: For OMEN, which can't be checked ahead of time
+        """
+
+        if replacements[0][0] == 'M':
+            self.base_cache[replacements] = True
+            return True
+
+        cased = [
+            pt_type[0] == 'A' and position + 1 < len(replacements) and replacements[position + 1][0] == 'C'
+            for position, pt_type in enumerate(replacements)
+        ]
+
+        suffixes = [self._suffix(grammar, pt_type, is_cased) for pt_type, is_cased in zip(replacements, cased)]
+
+        info = (
+            cased,
+            [[summary[1] for summary in suffix] for suffix in suffixes],
+            [[summary[0] for summary in suffix] for suffix in suffixes],
+            [[summary[3] for summary in suffix] for suffix in suffixes],
+        )
+
+        self.base_cache[replacements] = info
+
+        return info
+
+    def _values(self, grammar, key):
+        """
+        Returns the (length, classes) of each value of a terminal
+
+        Inputs:
+            grammar: The PcfgGrammar's grammar
+
+            key: (type, index, is_cased)
+
+        Returns:
+            infos: A list of (length, classes)
+        """
+
+        infos = self.value_cache.get(key)
+        if infos is not None:
+            return infos
+
+        pt_type, index, is_cased = key
+        values = grammar[pt_type][index]['values']
+
+        # A mask doesn't add any characters, just changes the case of the
+        # alpha string before it
+        if pt_type[0] == 'C':
+            infos = [(0, _mask_classes(mask)) for mask in values]
+
+        # The case of the letters comes from the mask
+        elif is_cased:
+            infos = [(len(word), _word_classes(word)) for word in values]
+
+        else:
+            infos = [(len(value), find_classes(value)) for value in values]
+
+        self.value_cache[key] = infos
+
+        return infos
+
+    def _summary(self, grammar, key):
+        """
+        Returns the summary of the values of a terminal, (see _summarize)
+        """
+
+        summary = self.summary_cache.get(key)
+        if summary is None:
+            summary = _summarize(self._values(grammar, key))
+            self.summary_cache[key] = summary
+
+        return summary
+
+    def _suffix(self, grammar, pt_type, is_cased):
+        """
+        Returns a list of the summary of all the values of a type from each
+        index to the end
+
+        Inputs:
+            grammar: The PcfgGrammar's grammar
+
+            pt_type: The type of the replacement, (such as A8)
+
+            is_cased: If the replacement is an alpha string followed by a mask
+
+        Returns:
+            suffix: suffix[i] combines the summaries of the terminals from
+            index i on
+        """
+
+        suffix = self.suffix_cache.get((pt_type, is_cased))
+        if suffix is not None:
+            return suffix
+
+        suffix = [
+            self._summary(grammar, (pt_type, index, is_cased))
+            for index in range(len(grammar[pt_type]))
+        ]
+
+        for index in range(len(suffix) - 2, -1, -1):
+            suffix[index] = _combine([suffix[index], suffix[index + 1]])
+
+        self.suffix_cache[(pt_type, is_cased)] = suffix
+
+        return suffix
@@ -13,15 +13,229 @@ process one password at at time that is sent to it
 # Global imports
 import sys
 import os
-import copy
-import codecs
 import random
+import functools
 
 # Local imports
 from .grammar_io import load_grammar, load_omen_keyspace
-from .omen.optimizer import Optimizer
+from .grammar_cache import load_cached, GrammarCache
+from .guess_output import create_output, NullOutput, ListOutput, MemoryOutput, DEFAULT_BATCH_SIZE
+from .omen.optimizer import Optimizer, DEFAULT_MAX_SIZE as DEFAULT_OPTIMIZER_SIZE
 from .omen.input_file_io import load_rules
-from .omen.markov_cracker import MarkovCracker
+from .omen.indexed_cracker import IndexedMarkovCracker, compile_grammar, MAX_BLOCK_SIZE
+from .omen.partitioned_cracker import PartitionedMarkovCracker
+from .omen.keyspace import Keyspace
+
+
+# The maximum number of guesses to create at one time when generating the
+# right-most positions of a parse tree
+BLOCK_SIZE = 65536
+
+# How close the probability ratios of two parents need to be before the
+# Deadbeat Dad check falls back to multiplying out the full probabilities
+RATIO_TOLERANCE = 1e-9
+
+# Parse trees with a lower probability than this always use the full
+# probabilities since floats lose precision close to underflowing
+MIN_RATIO_PROB = 1e-250
+
+
+@functools.lru_cache(maxsize=None)
+def create_mask_function(plan):
+    """
+    Creates a function that applies a precompiled capitalization mask to a word
+
+    Inputs:
+        plan: A tuple of (start, end) runs of characters to uppercase, as
+        created by grammar_io.compile_capitalization_masks
+
+    Returns:
+        mask_function: A function that takes a word and returns it with the
+        mask applied
+
+        None: If the mask doesn't change the word, (aka all lowercase)
+    """
+
+    if not plan:
+        return None
+
+    # The most common masks get their own fast path
+    if len(plan) == 1:
+        start, end = plan[0]
+        if start == 0:
+            return lambda word: word[:end].upper() + word[end:]
+
+        return lambda word: word[:start] + word[start:end].upper() + word[end:]
+
+    def mask_function(word):
+        new_word = []
+        prev_end = 0
+        for start, end in plan:
+            new_word.append(word[prev_end:start])
+            new_word.append(word[start:end].upper())
+            prev_end = end
+        new_word.append(word[prev_end:])
+        return ''.join(new_word)
+
+    return mask_function
+
+
+def _create_suffix_mask_function(plan, mask_len):
+    """
+    Creates a function that applies a precompiled capitalization mask to the
+    end of a guess
+
+    Inputs:
+        plan: The precompiled capitalization mask
+
+        mask_len: The length of the mask. It is applied to the last mask_len
+        characters of the guess
+
+    Returns:
+        mask_function: A function that takes a guess and returns it with the
+        mask applied
+    """
+
+    mask_function = create_mask_function(plan)
+    if mask_function is None:
+        return _no_mask
+
+    return lambda guess: guess[:-mask_len] + mask_function(guess[-mask_len:])
+
+
+def _load_omen_rules(omen_directory):
+    """
+    Loads the OMEN rules from disk and compiles them for IndexedMarkovCracker
+
+    Inputs:
+        omen_directory: The directory of the OMEN ruleset
+
+    Returns:
+        omen_grammar: The compiled OMEN grammar
+
+        None: If an error occured loading the OMEN rules
+    """
+
+    omen_grammar = {}
+    if not load_rules(omen_directory, omen_grammar):
+        return None
+
+    return compile_grammar(omen_grammar)
+
+
+def _no_mask(word):
+    """
+    Capitalization mask function for a mask that doesn't change the word
+
+    Inputs:
+        word: The word to apply the mask to
+
+    Returns:
+        word: The same word
+    """
+    return word
+
+
+class CapitalizedWords:
+    """
+    All the combinations of a list of words and capitalization masks
+
+    Acts like a read only list of the capitalized words, in the same order as
+    applying each mask to the first word, then each mask to the second word,
+    etc. The words are only capitalized when they are looked up
+    """
+
+    __slots__ = ('words', 'mask_functions')
+
+    def __init__(self, words, mask_functions):
+        """
+        Basic initialization function
+
+        Inputs:
+            words: The list of lowercase words
+
+            mask_functions: The list of functions to apply each mask
+
+        Returns:
+            CapitalizedWords
+        """
+
+        self.words = words
+        self.mask_functions = mask_functions
+
+    def __len__(self):
+        return len(self.words) * len(self.mask_functions)
+
+    def __getitem__(self, index):
+        """
+        Looks up a capitalized word, or a list of them if index is a slice
+
+        Only slices with a step of 1 are supported
+        """
+
+        num_masks = len(self.mask_functions)
+
+        if not isinstance(index, slice):
+            if index < 0:
+                index += len(self)
+            word_index, mask_index = divmod(index, num_masks)
+            return self.mask_functions[mask_index](self.words[word_index])
+
+        start, stop, _ = index.indices(len(self))
+
+        capitalized = []
+        for word_index in range(start // num_masks, (stop + num_masks - 1) // num_masks):
+            word = self.words[word_index]
+            first = max(start - word_index * num_masks, 0)
+            last = min(stop - word_index * num_masks, num_masks)
+            capitalized.extend([mask_function(word) for mask_function in self.mask_functions[first:last]])
+
+        return capitalized
+
+
+class PtNode:
+    """
+    Compact representation of a parse tree used in the priority queue
+
+    Rather than storing the replacement types for every parse tree, a node
+    only stores which base structure it came from and the index into the
+    grammar for each replacement. Use PcfgGrammar.create_pt_item() to turn
+    it back into a full parse tree item
+
+    Nodes are stored in the priority queue as (-prob, node) tuples. Nodes
+    never sort before each other so parse trees with the same probability
+    keep the same order they would have as QueueItems
+    """
+
+    __slots__ = ('base_id', 'indices')
+
+    def __init__(self, base_id, indices):
+        """
+        Initialization function
+
+        Inputs:
+            base_id: The index of the base structure in PcfgGrammar.base
+
+            indices: A tuple of the grammar index for each replacement
+
+        Returns:
+            PtNode
+        """
+
+        self.base_id = base_id
+        self.indices = indices
+
+    def __lt__(self, other):
+        """
+        Ties in the priority queue are broken by the probability alone
+
+        Inputs:
+            other: Item to compare against
+
+        Outputs:
+            False
+        """
+        return False
 
 
 class PcfgGrammar:
@@ -37,7 +251,9 @@ class PcfgGrammar:
         skip_brute = False,
         skip_case = False,
         debug = False,
-        base_structure_folder = "Grammar"):
+        base_structure_folder = "Grammar",
+        omen_optimizer_length = 4,
+        omen_optimizer_size = DEFAULT_OPTIMIZER_SIZE):
         """
         Initializes the class and all the data structures
 
@@ -64,6 +280,12 @@ class PcfgGrammar:
                     different base structure folders for a given ruleset to target
                     specific password complexity requirements
 
+            omen_optimizer_length: The maximum length of OMEN strings the
+                    optimizer caches results for
+
+            omen_optimizer_size: The maximum number of results the OMEN
+                    optimizer caches
+
         Returns:
             PcfgGrammar
         """
@@ -74,6 +296,8 @@ class PcfgGrammar:
         self.ruleset_info = None
 
         # If an exception occurs below, don't catch it here, pass it back up the stack
+        #
+        # The terminals in the grammar are loaded the first time they are used
         self.grammar, self.base, self.ruleset_info = load_grammar(
             rule_name,
             base_directory,
@@ -87,21 +311,40 @@ class PcfgGrammar:
 
         # Initailize and load the OMEN grammar and settings
 
-        # Dictionary that will contain the OMEN Grammar
-        self.omen_grammar = {}
-
         omen_directory = os.path.join(base_directory, "Omen")
 
-        # Load the OMEN rules from disk
-        if not load_rules(omen_directory, self.omen_grammar):
+        # Dictionary that will contain the compiled OMEN Grammar
+        self.omen_grammar = load_cached(
+            base_directory,
+            'omen_indexed',
+            None,
+            lambda: _load_omen_rules(omen_directory)
+            )
+
+        if self.omen_grammar is None:
             print("Error reading the OMEN ruleset", file=sys.stderr)
             raise Exception
 
         # Initialize the OMEN TMTO optimizer
-        self.omen_optimizer = Optimizer(max_length = 4)
+        #
+        # Results from previous sessions are saved in the grammar cache so
+        # they don't need to be worked out again
+        self.base_directory = base_directory
+        self.omen_optimizer = Optimizer(
+            max_length = omen_optimizer_length,
+            max_size = omen_optimizer_size
+            )
+
+        found, optimizer_state = GrammarCache(base_directory).load('omen_optimizer', None)
+        if found:
+            self.omen_optimizer.load_state(optimizer_state)
 
         self.omen_keyspace = load_omen_keyspace(base_directory)
 
+        # Keyspace counts by (IP, length, level), used to start an OMEN level
+        # part way through. Calculated as needed
+        self.omen_counts = Keyspace(self.omen_grammar)
+
         # Used to track status during an OMEN guessing session
         self.omen_guess_num = 0
 
@@ -112,22 +355,44 @@ class PcfgGrammar:
         # If this exited in the middle of an OMEN guessing session
         self.omen_exit = False
 
+        # If the OMEN session was saved as partitions, (see omen/partitioned_cracker.py)
+        self.omen_partitioned = False
+
         # Base filename for save files
         self.save_file = save_file
 
         # Filename to save guesses to if not outputting to stdout
         self.output_filename = None
-        
-        # The file handler for saving guesses to a file if desired
-        self.output_file = None
 
+        # The (pt, slots) of the last parse tree guesses were created for, so
+        # creating the guesses for a parse tree in multiple index ranges,
+        # (like the worker processes do), doesn't re-create the slots each time
+        self.slot_cache = None
+
+        # Statistics for the metrics export. The number of children found by
+        # find_children(), and the number of possible children rejected since
+        # the Deadbeat Dad algorithm made another parent responsible for them
+        self.num_children = 0
+        self.num_rejected_children = 0
+
+        # The PasswordPolicy guesses need to meet, (see password_policy.py).
+        # None if every guess is created
+        self.policy = None
+
+        # Where guesses are written to. Defaults to stdout. Debugging runs
+        # don't output guesses
+        if self.debug:
+            self.output = NullOutput(self.encoding)
+        else:
+            self.output = create_output(None, self.encoding)
 
-    def create_guesses(self, pt, is_honeyword=False, limit=None):
+
+    def create_guesses(self, pt, is_honeyword=False, limit=None, start=0):
         """
         Generates Guesses From a Parse Tree
 
-        This is mostly a wrapper to hide the recursive calls from the calling
-        function. Will print guesses to stdout.
+        This is mostly a wrapper to hide the guess generation engine from the
+        calling function. Will print guesses to stdout.
 
         Inputs:
             pt: The parse tree, which is a list of tuples
@@ -138,17 +403,112 @@ class PcfgGrammar:
             limit: (None/Int) If it is not None, limit is a number that decrements
             which specifies how many guesses remain to be generated. Ignored if None
 
+            start: (Int) The index of the first guess to generate. Combined
+            with limit this allows generating a sub-range of the guesses for
+            a parse tree. Not supported for honeywords
+
         Returns:
             num_guesses: The number of guesses generated
         """
 
         if not is_honeyword:
-            return self._recursive_guesses('', pt, limit)
+            return self._iterative_guesses(pt, limit, start)
         
         else:
             return self._honeyword_recursive_guess('', pt, limit)
 
 
+    def iter_guesses(self, pt, batch_size=DEFAULT_BATCH_SIZE, limit=None, start=0, encoded=False):
+        """
+        Generates the guesses for a parse tree in batches, for Python code
+        using the guesser in the same process
+
+        Guesses are created in the same order as create_guesses(), but are
+        returned rather than written to the output. Each batch is created
+        only when it is asked for, so the parse tree doesn't need to be
+        finished before the first batch is used
+
+        Inputs:
+            pt: The parse tree, which is a list of tuples
+
+            batch_size: The maximum number of guesses in each batch
+
+            limit: (None/Int) The maximum number of guesses to create.
+            Ignored if None
+
+            start: (Int) The index of the first guess to generate
+
+            encoded: (bool) If True, each batch is the newline seperated
+            guesses encoded in the ruleset's encoding, (the same bytes that
+            would have been written to the output). Otherwise each batch is
+            a list of strings
+
+        Returns:
+            A generator that yields batches of guesses
+        """
+
+        if encoded:
+            capture = MemoryOutput(self.encoding, batch_size + 1)
+        else:
+            capture = ListOutput(self.encoding)
+
+        # The OMEN cracker keeps track of where it is, so the same one is
+        # used for every batch vs. seeking to the start of each batch
+        if pt[0][0][0] == 'M':
+            level = int(self.grammar[pt[0][0]][pt[0][1]]['values'][0])
+            markov_cracker = IndexedMarkovCracker(
+                self.omen_grammar,
+                level,
+                self.omen_optimizer,
+                self.omen_counts
+                )
+
+            if start:
+                markov_cracker.seek(start)
+            self.omen_guess_num = start
+
+        while limit is None or limit > 0:
+            size = batch_size
+            if limit is not None and limit < size:
+                size = limit
+
+            if pt[0][0][0] == 'M':
+                guesses = markov_cracker.next_guesses(size)
+                if guesses is None:
+                    return
+
+                num_guesses = len(guesses)
+                self.omen_guess_num += num_guesses
+                if self.policy is not None:
+                    guesses = self.policy.filter_guesses(guesses)
+                capture.write_batch(guesses)
+                yield capture.getvalue()
+
+            # Otherwise create the batch as an index range of the parse tree,
+            # the same way the worker processes split up parse trees. The
+            # output is only swapped while the batch is created, so the grammar
+            # can still be used for other things between batches
+            else:
+                output = self.output
+                self.output = capture
+                try:
+                    num_guesses = self._iterative_guesses(pt, size, start)
+                finally:
+                    self.output = output
+
+                if num_guesses:
+                    yield capture.getvalue()
+
+                # Every guess for the parse tree has been created
+                if num_guesses < size:
+                    return
+
+                start += num_guesses
+
+            if limit is not None:
+                limit -= num_guesses
+
+
     def initalize_base_structures(self):
         """
         Initalizes and returns a set of parse trees from the base structures
@@ -159,154 +519,520 @@ class PcfgGrammar:
         Note, these will *NOT* be in true probability order. That will be up
         to whatever makes use of this list to sort them as desired
 
+        Also sets up the lookup tables used by the PtNode functions, so this
+        needs to be called before any of them
+
         Inputs:
             None
 
         Returns:
-            pt_list: A list of the parse tree items. This is a dictionary with
-            the following keys:
+            node_list: A list of (prob, node) for each base structure where
+            prob is the probability of the parse tree and node is a PtNode.
+            Base structures that can't meet the password policy are left out
+        """
+
+        # The replacement types for each base structure
+        self.base_types = []
+
+        # The list of probabilities for each replacement of each base
+        # structure. Lists are shared between base structures
+        self.base_probs = []
+
+        # The ratio of each probability to the one before it, in the same
+        # layout as base_probs. Used by the Deadbeat Dad check
+        self.base_ratios = []
+
+        type_probs = {}
+        type_ratios = {}
+
+        node_list = []
+
+        # Loop through all of the base structures to initalize them
+        for base_id, item in enumerate(self.base):
+
+            probs = []
+            ratios = []
+            for replacement in item['replacements']:
+                if replacement not in type_probs:
+                    type_probs[replacement] = self.grammar.get_probabilities(replacement)
+                    type_ratios[replacement] = self._find_ratios(type_probs[replacement])
+                probs.append(type_probs[replacement])
+                ratios.append(type_ratios[replacement])
+
+            self.base_types.append(tuple(item['replacements']))
+            self.base_probs.append(probs)
+            self.base_ratios.append(ratios)
+
+            # Skip base structures that can't create a guess that meets the
+            # password policy
+            if self.policy is not None and not self.policy.base_can_comply(self.grammar, item['replacements']):
+                continue
+
+            node_list.append(self.create_base_node(base_id))
+
+        return node_list
+
+
+    def create_base_node(self, base_id):
+        """
+        Creates the most probable parse tree for a base structure
+
+        initalize_base_structures needs to be called before this
+
+        Inputs:
+            base_id: The index of the base structure
+
+        Returns:
+            (prob, node): The probability of the parse tree and its PtNode
+        """
+
+        node = PtNode(base_id, (0,) * len(self.base_types[base_id]))
+
+        return self._find_prob(base_id, node.indices), node
+
+
+    def _find_ratios(self, probs):
+        """
+        Finds how much the probability drops moving from one item to the next
+        for a replacement
+
+        Inputs:
+            probs: The list of probabilities for a replacement
+
+        Returns:
+            ratios: A list where ratios[i] = probs[i-1] / probs[i]. ratios[0] is
+            unused. If a probability is 0 the ratio is NaN, which makes the
+            Deadbeat Dad check use the full probabilities instead
+        """
+
+        ratios = [float('nan')]
+        for index in range(1, len(probs)):
+            if probs[index] == 0:
+                ratios.append(float('nan'))
+            else:
+                ratios.append(probs[index - 1] / probs[index])
+
+        return ratios
+
+
+    def create_pt_item(self, node, prob):
+        """
+        Creates a full parse tree item from a PtNode
+
+        Inputs:
+            node: The PtNode
+
+            prob: The probability of the parse tree
+
+        Returns:
+            pt_item: A dictionary with the following keys
 
             .. code-block:: python
-            
+
                 {
                     'prob': The probability of the parse tree (float),
                     'pt': The parse tree, which is a list of tuples indexed into the grammar,
                     'base_prob': The probability of the base structure,
                 }
+        """
+
+        return {
+            'pt': list(zip(self.base_types[node.base_id], node.indices)),
+            'prob': prob,
+            'base_prob': self.base[node.base_id]['prob'],
+        }
+
 
+    def count_guesses(self, pt):
         """
+        Returns the number of guesses a parse tree will generate
 
-        pt_list = []
+        Inputs:
+            pt: The parse tree, which is a list of tuples
 
-        # Loop through all of the base structures to initalize them
-        for item in self.base:
-            pt_item = {
-                'base_prob': item['prob'],
-                'pt': []
-            }
+        Returns:
+            num_guesses: The number of guesses. For OMEN parse trees this is
+            the keyspace of the OMEN level. With a password policy, this is
+            the number of guesses left after skipping the terminal values
+            that can't meet it
+        """
 
-            # Create the pt from the base structure
-            for replacement in item['replacements']:
-                pt_item['pt'].append((replacement,0))
+        if pt[0][0][0] == 'M':
+            level = int(self.grammar[pt[0][0]][pt[0][1]]['values'][0])
+            return self.omen_keyspace[level]
+
+        keep = [None] * len(pt)
+        if self.policy is not None:
+            result = self.policy.filter_pt(self.grammar, pt)
+            if result is None:
+                return 0
+            keep = result[0]
+
+        num_guesses = 1
+        for (pt_type, index), indices in zip(pt, keep):
+            if indices is None:
+                num_guesses *= len(self.grammar[pt_type][index]['values'])
+            else:
+                num_guesses *= len(indices)
+
+        return num_guesses
+
+
+    def count_omen_guesses(self, pt):
+        """
+        Returns the exact number of guesses an OMEN parse tree will generate
+
+        count_guesses() returns the keyspace calculated by the trainer, which
+        is quick but doesn't include every length. This counts every
+        (length, IP) of the level, which can take a few seconds for the
+        higher levels
 
-            # Calculate the probability
-            pt_item['prob'] = self._find_prob(pt_item['pt'], pt_item['base_prob'])
+        Inputs:
+            pt: The OMEN parse tree
 
-            pt_list.append(pt_item)
+        Returns:
+            num_guesses: The number of guesses
+        """
+
+        level = int(self.grammar[pt[0][0]][pt[0][1]]['values'][0])
+        markov_cracker = IndexedMarkovCracker(
+            self.omen_grammar,
+            level,
+            self.omen_optimizer,
+            self.omen_counts
+            )
 
-        return pt_list
+        return markov_cracker.count_guesses()
 
 
-    def _recursive_guesses(self, cur_guess, pt, limit=None):
+    def _iterative_guesses(self, pt, limit=None, start=0):
         """
-        Recursivly generates guesses from a parse tree
+        Generates guesses from a parse tree without using recursion
         Will print out guesses to stdout
 
-        Inputs:
-            cur_guess: The current guess being generated
+        Treats the parse tree as an odometer. Each position holds an index
+        into the values for its transition, and the right-most position spins
+        the fastest. The guess built from all the positions to the left of a
+        given position is saved off, so when the odometer rolls over only the
+        positions that actually changed need to be rebuilt. This generates
+        guesses in the exact same order as the original recursive engine
 
-            pt: The parse tree, which is a list of tuples. Will recursivly work though the pt to
-            fill out parts to cur_guess.
+        An alpha transition and the capitalization mask that follows it are
+        treated as a single position, using the masks precompiled when the
+        grammar was loaded, so case mangling is done once per word for the whole
+        parse tree vs. once per guess. The last two positions are then generated
+        together in large blocks
+
+        Inputs:
+            pt: The parse tree, which is a list of tuples
 
             limit: (None/Int) If it is not None, limit is a number that decrements
             which specifies how many guesses remain to be generated. Ignored if None
 
+            start: (Int) The index of the first guess to generate
+
         Returns:
             num_guesses: The number of guesses generated
         """
 
+        # If it is a Markov guess. OMEN transitions are never combined with
+        # other transitions in a base structure
+        if pt[0][0][0] == 'M':
+            # Get the level
+            level = int(self.grammar[pt[0][0]][pt[0][1]]['values'][0])
+
+            markov_cracker = IndexedMarkovCracker(
+                self.omen_grammar,
+                level,
+                self.omen_optimizer,
+                self.omen_counts
+                )
+
+            # Skip to the first guess without creating the ones before it
+            if start:
+                markov_cracker.seek(start)
+
+            # Initalize counter used for status reports and save files
+            self.omen_guess_num = start
+
+            return self.omen_generate_guesses(markov_cracker, limit)
+
+        pt_key = tuple(pt)
+        if self.slot_cache is None or self.slot_cache[0] != pt_key:
+            self.slot_cache = (pt_key, self._create_slots(pt))
+        slots = self.slot_cache[1]
+
+        # None of the guesses meet the password policy
+        if slots is None:
+            return 0
+
+        write_batch = self.output.write_batch
+
+        # Some of the guesses might not meet the password policy, so check
+        # each of them
+        if self.policy is not None and self.policy.filter_pt(self.grammar, pt)[1]:
+            output = self.output
+            filter_guesses = self.policy.filter_guesses
+            write_batch = lambda guesses: output.write_batch(filter_guesses(guesses))
+
+        # The last two positions are generated together as one block, unless
+        # one of them is a capitalization mask that depends on what came
+        # before it
+        block_start = len(slots) - 1
+        if block_start > 0 and slots[block_start - 1][0] != 'C' and slots[block_start][0] != 'C':
+            block_start -= 1
+
+        block = slots[block_start:]
+        block_size = 1
+        for category, values in block:
+            block_size *= len(values)
+
+        # The current index into the values for every position before the block
+        #
+        # If not starting at the first guess, set the odometer to the block
+        # the start index is in
+        counters = [0] * block_start
+        offset = start % block_size
+        start = start // block_size
+        for i in range(block_start - 1, -1, -1):
+            start, counters[i] = divmod(start, len(slots[i][1]))
+
+        # The start index is past the last guess
+        if start:
+            return 0
+
+        # prefixes[i] is the guess built from all the positions left of i
+        prefixes = [''] * (block_start + 1)
+
         num_guesses = 0
 
-        # Get the transistion category for the current rule, aka 'A' for alpha
-        category = pt[0][0][0]
+        # The left-most position that changed since the last pass
+        pos = 0
 
-        # Get the type for the transistion, Aka A10 for 10 letter long alpha
-        pt_type = pt[0][0]
+        while True:
 
-        # Get he index into the transition, aka the 2nd most probable A10
-        index = pt[0][1]
+            # Rebuild the prefixes for everything right of the change
+            for i in range(pos, block_start):
+                category, values = slots[i]
+                if category == 'C':
+                    prefixes[i + 1] = values[counters[i]](prefixes[i])
+                else:
+                    prefixes[i + 1] = prefixes[i] + values[counters[i]]
 
-        # If it is a Markov guess
-        if category == 'M':
-            # Get the level
-            level = int(self.grammar[pt_type][index]['values'][0])
+            # Check the limit
+            remaining = None
+            if limit:
+                remaining = limit - num_guesses
 
-            markov_cracker = MarkovCracker(self.omen_grammar, level, self.omen_optimizer)
+            num_guesses += self._block_guesses(block, prefixes[block_start], remaining, offset, write_batch)
+            offset = 0
 
-            # Initalize counter used for status reports and save files
-            self.omen_guess_num = 0
+            # Check the limit
+            if limit and num_guesses >= limit:
+                return num_guesses
 
-            return self.omen_generate_guesses(markov_cracker, limit)
+            # Advance the odometer, rolling over positions that are exhausted
+            pos = block_start - 1
+            while pos >= 0:
+                counters[pos] += 1
+                if counters[pos] < len(slots[pos][1]):
+                    break
+                counters[pos] = 0
+                pos -= 1
 
-        # If it is a capitalization mask
-        elif category == 'C':
+            # Every position rolled over, so all the guesses were generated
+            if pos < 0:
+                return num_guesses
 
-            mask_len = len(self.grammar[pt_type][index]['values'][0])
 
-            # Split off the part of the word we need to modify with the mask
-            start_word = [cur_guess[:- mask_len]]
-            end_word = cur_guess[- mask_len:]
+    def _create_slots(self, pt):
+        """
+        Splits a parse tree up into the positions used by _iterative_guesses
+
+        Alpha transitions are fused with the capitalization mask that follows
+        them. If there are at most BLOCK_SIZE capitalized words they are all
+        created up front so they don't need to be re-created every time the
+        odometer rolls over. Otherwise they are created as they are needed so
+        a parse tree with a huge number of words and masks doesn't use up a
+        lot of time and memory before the first guess is output.
+
+        Inputs:
+            pt: The parse tree, which is a list of tuples
+
+        Returns:
+            slots: A list of (category, values) tuples. Category is 'C' for a
+            capitalization mask that isn't after an alpha string. Its values
+            are functions that apply the mask to the guess built so far.
+            Otherwise it is '' and the values can be added directly to the guess
+
+            None: If none of the guesses meet the password policy
+        """
+
+        # Skip the values that can't be part of a guess that meets the
+        # password policy
+        keep = [None] * len(pt)
+        if self.policy is not None:
+            result = self.policy.filter_pt(self.grammar, pt)
+            if result is None:
+                return None
+            keep = result[0]
 
-            for mask in self.grammar[pt_type][index]['values']:
-
-                # Apply the capitalization mask
-                new_end = []
-                index = 0
-                for item in mask:
-                    if item == 'L':
-                        new_end.append(end_word[index])
-                    else:
-                        new_end.append(end_word[index].upper())
-                    index += 1
-
-                # Recombine the capitalization mask with what came before
-                new_guess = ''.join(start_word + new_end)
-
-                # Figure out if the guess is ready to be printed out or if
-                # there is more to do
-                if len(pt) == 1:
-                    num_guesses += 1
-                    self.print_guess(new_guess)
-
-                    # Check the limit
-                    if limit:
-                        limit = limit - 1
-                        if limit <= 0:
-                            return num_guesses
+        slots = []
+
+        index = 0
+        while index < len(pt):
+            pt_type, pt_index = pt[index]
+            values = self.grammar[pt_type][pt_index]['values']
+            if keep[index] is not None:
+                values = [values[value_index] for value_index in keep[index]]
+
+            # Alpha string followed by its capitalization mask
+            if pt_type[0] == 'A' and index + 1 < len(pt) and pt[index + 1][0][0] == 'C':
+                mask_type, mask_index = pt[index + 1]
+                plans = self.grammar[mask_type][mask_index]['plans']
+                if keep[index + 1] is not None:
+                    plans = [plans[value_index] for value_index in keep[index + 1]]
+
+                mask_functions = [create_mask_function(plan) or _no_mask for plan in plans]
+
+                # Most of the time this is the all lowercase mask
+                if len(mask_functions) == 1 and mask_functions[0] is _no_mask:
+                    pass
+
+                elif len(values) * len(mask_functions) > BLOCK_SIZE:
+                    values = CapitalizedWords(values, mask_functions)
+
+                elif len(mask_functions) == 1:
+                    values = [mask_functions[0](word) for word in values]
 
                 else:
-                    num_recursive_guesses = self._recursive_guesses(new_guess, pt[1:], limit)
-                    num_guesses += num_recursive_guesses
-                    if limit:
-                        limit = limit - num_recursive_guesses
-                        if limit <= 0:
-                            return num_guesses
+                    values = [mask_function(word)
+                        for word in values
+                        for mask_function in mask_functions]
 
-        # If it is any striaght replacement, (digits, letters, etc)
-        else:
-            for item in self.grammar[pt_type][index]['values']:
-                new_guess = cur_guess + item
+                slots.append(('', values))
+                index += 2
+                continue
+
+            # Capitalization mask on its own
+            if pt_type[0] == 'C':
+                plans = self.grammar[pt_type][pt_index]['plans']
+                if keep[index] is not None:
+                    plans = [plans[value_index] for value_index in keep[index]]
+                mask_len = len(values[0])
+                values = [_create_suffix_mask_function(plan, mask_len) for plan in plans]
+                slots.append(('C', values))
+                index += 1
+                continue
+
+            slots.append(('', values))
+            index += 1
+
+        return slots
+
+
+    def _block_guesses(self, block, prefix, remaining = None, offset = 0, write_batch = None):
+        """
+        Creates and outputs all the guesses for the right-most positions
+
+        Guesses are created at most BLOCK_SIZE at a time
+
+        Inputs:
+            block: A list of the last one or two slots, as created by _create_slots
+
+            prefix: The guess built from all the positions to the left
 
-                # Figure out if the guess is ready to be printed out or if
-                # there is more to do
-                if len(pt) == 1:
-                    num_guesses += 1
-                    self.print_guess(new_guess)
+            remaining: (None/Int) The maximum number of guesses to create.
+            Ignored if None
 
-                    # Check the limit
-                    if limit:
-                        limit = limit - 1
-                        if limit == 0:
-                            return num_guesses
+            offset: The number of guesses at the start of the block to skip
 
+            write_batch: The function to write the guesses with. Defaults to
+            the output's write_batch()
+
+        Returns:
+            num_guesses: The number of guesses generated
+        """
+
+        if write_batch is None:
+            write_batch = self.output.write_batch
+
+        # Only one position
+        if len(block) == 1:
+            category, values = block[0]
+
+            end = len(values)
+            if remaining is not None:
+                end = min(end, offset + remaining)
+
+            for start in range(offset, end, BLOCK_SIZE):
+                chunk = values[start:min(end, start + BLOCK_SIZE)]
+                if category == 'C':
+                    write_batch([mask_function(prefix) for mask_function in chunk])
                 else:
-                    num_recursive_guesses = self._recursive_guesses(new_guess, pt[1:], limit)
-                    num_guesses += num_recursive_guesses
-                    
-                    if limit:
-                        limit = limit - num_recursive_guesses
-                        if limit <= 0:
-                            return num_guesses
+                    write_batch([prefix + item for item in chunk])
+
+            return max(0, end - offset)
+
+        first = block[0][1]
+        second = block[1][1]
+
+        # Skip to the item in the first position the offset is in
+        first_index, offset = divmod(offset, len(second))
+
+        # Two positions where the second one is too big to create all at once,
+        # (only happens with capitalized words that weren't created up front).
+        # Walk through the second position in chunks
+        if len(second) > BLOCK_SIZE:
+            num_guesses = 0
+            for index in range(first_index, len(first)):
+                item_prefix = prefix + first[index]
+
+                for start in range(offset, len(second), BLOCK_SIZE):
+                    stop = start + BLOCK_SIZE
+                    if remaining is not None:
+                        stop = min(stop, start + remaining - num_guesses)
+
+                    guesses = [item_prefix + end for end in second[start:stop]]
+
+                    if remaining is not None and len(guesses) >= remaining - num_guesses:
+                        guesses = guesses[:remaining - num_guesses]
+                        write_batch(guesses)
+                        return num_guesses + len(guesses)
+
+                    write_batch(guesses)
+                    num_guesses += len(guesses)
+
+                offset = 0
+
+            return num_guesses
+
+        # Two positions. Walk through the first one in chunks so a huge block
+        # doesn't get created all at once
+        step = max(1, BLOCK_SIZE // len(second))
+
+        # Don't create more than needed to reach the limit
+        if remaining is not None:
+            step = max(1, min(step, (offset + remaining + len(second) - 1) // len(second)))
+
+        num_guesses = 0
+        for start in range(first_index, len(first), step):
+            if prefix:
+                guesses = [prefix + item + end for item in first[start:start + step] for end in second]
+            else:
+                guesses = [item + end for item in first[start:start + step] for end in second]
+
+            if offset:
+                guesses = guesses[offset:]
+                offset = 0
+
+            if remaining is not None and len(guesses) >= remaining - num_guesses:
+                guesses = guesses[:remaining - num_guesses]
+                write_batch(guesses)
+                return num_guesses + len(guesses)
+
+            write_batch(guesses)
+            num_guesses += len(guesses)
 
         return num_guesses
 
@@ -433,27 +1159,31 @@ class PcfgGrammar:
         which specifies how many guesses remain to be generated. Ignored if None
 
         Inputs:
-            markov_cracker: An OMEN MarkovCracker instance
+            markov_cracker: An OMEN IndexedMarkovCracker instance
 
         Returns:
             num_guesses: The number of guesses generated for this OMEN session
         """
 
         num_guesses = 0
-        guess = markov_cracker.next_guess()
-        while guess is not None:
-            num_guesses += 1
-
-            # Output the results
-            self.print_guess(guess)
+        guesses = markov_cracker.next_guesses(limit)
+        while guesses is not None:
+            num_guesses += len(guesses)
+
+            # Output the results. OMEN guesses are checked against the
+            # password policy one by one
+            if self.policy is not None:
+                self.output.write_batch(self.policy.filter_guesses(guesses))
+            else:
+                self.output.write_batch(guesses)
             # Check the limit
             if limit:
-                limit = limit - 1
+                limit = limit - len(guesses)
                 if limit <= 0:
                     return num_guesses
 
             # Update counter used for status reports and save files
-            self.omen_guess_num += 1
+            self.omen_guess_num += len(guesses)
 
             # Check to see if the user wanted to exit the program
             if self.should_exit:
@@ -465,44 +1195,102 @@ class PcfgGrammar:
                 markov_cracker.save_session(self.save_file[:-4] + ".omn")
                 return num_guesses
 
-            # Get next guess
-            guess = markov_cracker.next_guess()
+            # Get the next guesses
+            guesses = markov_cracker.next_guesses(limit)
 
         return num_guesses
 
 
+    def omen_generate_partitions(self, markov_cracker, limit=None):
+        """
+        Generates the remaining OMEN guesses for a session saved as partitions
+        in this process
+
+        Used when a session saved by multiple workers is restored with a
+        single process
+
+        Inputs:
+            markov_cracker: A PartitionedMarkovCracker instance
+
+            limit: (None/Int) If it is not None, limit is a number that decrements
+            which specifies how many guesses remain to be generated. Ignored if None
+
+        Returns:
+            num_guesses: The number of guesses generated for this OMEN session
+        """
+
+        num_guesses = 0
+        for partition in range(markov_cracker.num_partitions()):
+            while not markov_cracker.is_done(partition):
+
+                max_guesses = MAX_BLOCK_SIZE
+                if limit:
+                    max_guesses = min(max_guesses, limit - num_guesses)
+
+                guesses = markov_cracker.next_guesses(partition, max_guesses)
+                num_guesses += len(guesses)
+
+                # Output the results
+                if self.policy is not None:
+                    self.output.write_batch(self.policy.filter_guesses(guesses))
+                else:
+                    self.output.write_batch(guesses)
+
+                # Check the limit
+                if limit and num_guesses >= limit:
+                    return num_guesses
+
+                # Update counter used for status reports and save files
+                self.omen_guess_num += len(guesses)
+
+                # Check to see if the user wanted to exit the program
+                if self.should_exit:
+                    self.save_omen_partitions(markov_cracker)
+                    return num_guesses
+
+        return num_guesses
+
+
+    def save_omen_partitions(self, markov_cracker):
+        """
+        Saves the position of every partition of an OMEN session so it can
+        be restored later
+
+        Inputs:
+            markov_cracker: A PartitionedMarkovCracker instance
+
+        Returns:
+            None
+        """
+
+        self.omen_exit = True
+        self.omen_partitioned = True
+        print("Saving OMEN guess generation status",file=sys.stderr)
+
+        markov_cracker.save_session(self.save_file[:-4] + ".omp")
+
+
     def print_guess(self, guess):
         """
-        General code to print out a guess to stdout
+        General code to output a guess
 
         If an error occurs will pass back OSError
 
         Need to have error handling and want to centerlize all the calls to this so I don't
-        accidently forget some printout somewhere else
+        accidently forget some printout somewhere else. Guesses are buffered by
+        self.output, so they may not be written out until it is flushed
 
         Inputs:
-            guess: The string to print out to stdout
+            guess: The string to print out
 
         Returns:
             None
         """
 
-        if not self.debug:
-            try:
-                print(guess)
-            # While I could silently replace/ignore the Unicode character for now I
-            # want to provide a good spot to debug if this is happening
-            except UnicodeEncodeError:
-                pass
-            except:
-                print('',file=sys.stderr)
-                print("The consumer, probably the password cracker, has stopped",file=sys.stderr)
-                print("accepting input.",file=sys.stderr)
-                print("Halting guess generation and exiting",file=sys.stderr)
-                raise OSError
+        self.output.write(guess)
 
 
-    def find_children(self, pt_item):
+    def find_children(self, node, prob):
         """
         Finds the children for a given parse tree
 
@@ -510,53 +1298,57 @@ class PcfgGrammar:
         be taken care of by the current parent node
 
         Inputs:
-            pt_item: A parse tree item. It is a dictionary with the following keys
-                'prob': The probability of the parse tree (float)
-
-                'pt': The parse tree, which is a list of tuples indexed into the
-                 grammar
+            node: The PtNode of the parent parse tree
 
-                'base_prob': The probability of the base structure
+            prob: The probability of the parent parse tree
 
         Returns:
-            children_list: A list of all the children, formated as pt_item(s)
+            children_list: A list of (prob, node) for all the children
         """
 
-        parent_prob = pt_item['prob']
-        parent_pt = pt_item['pt']
+        base_id = node.base_id
+        parent_indices = node.indices
+        base_probs = self.base_probs[base_id]
 
         # The return values
         children_list = []
 
-        # Go through all the possible children
-        for pos, item in enumerate(parent_pt):
+        # The number of possible children checked
+        num_checked = 0
 
-            parent_type = item[0]
-            parent_index = item[1]
+        policy = self.policy
+
+        # Go through all the possible children
+        for pos, index in enumerate(parent_indices):
 
             # If true, there are no children at this level
-            if len(self.grammar[parent_type]) == parent_index +1:
+            if len(base_probs[pos]) == index + 1:
                 continue
 
             # Create the child node
-            child = copy.copy(parent_pt)
-            child[pos] = (child[pos][0], child[pos][1]+1)
+            child = parent_indices[:pos] + (index + 1,) + parent_indices[pos + 1:]
+            num_checked += 1
 
             # Check to see if the child belongs to this parent
-            if self._are_you_my_child(child, pt_item['base_prob'], pos, parent_prob):
+            if not self._are_you_my_child(child, base_id, pos, prob):
+                continue
 
-                # Testing, just add the child back
-                child_item = {
-                    'pt':child,
-                    'base_prob': pt_item['base_prob'],
-                    'prob': self._find_prob(child, pt_item['base_prob'])
-                }
-                children_list.append(child_item)
+            # Skip the child if neither it or its own children can meet the
+            # password policy. None of its children can either, so nothing
+            # is lost if another parent was responsible for them
+            if policy is not None and not policy.subtree_can_comply(self.grammar, self.base_types[base_id], child):
+                num_checked -= 1
+                continue
+
+            children_list.append((self._find_prob(base_id, child), PtNode(base_id, child)))
+
+        self.num_children += len(children_list)
+        self.num_rejected_children += num_checked - len(children_list)
 
         return children_list
 
 
-    def _are_you_my_child(self, child, base_prob, parent_pos, parent_prob):
+    def _are_you_my_child(self, child, base_id, parent_pos, parent_prob):
         """
         Given a child and a potential parent, returns if that child is the
         responsibility of the parent
@@ -565,10 +1357,9 @@ class PcfgGrammar:
         be taken care of by the current parent node
 
         Inputs:
-            child: The child's parse tree, which is a list of tuples indexed
-            into the grammar
+            child: The child's grammar indices, (tuple)
 
-            base_prob: The probaiblity of the base structure
+            base_id: The base structure the child belongs to
 
             parent_pos: The edit position of the calling parent
 
@@ -593,24 +1384,53 @@ class PcfgGrammar:
         # 2b) In the case of a tie between parents probability, the parent with
         #     the lowest 'parent_pos' will be responsible for child
         #
+        # Every parent only differs from the child in one position, so rather
+        # than multiplying out each parent's probability this compares how
+        # much the probability drops at each position. The potential parent
+        # at pos has a lower probability than the calling parent if:
+        #
+        #     ratios[pos][child[pos]] < ratios[parent_pos][child[parent_pos]]
+        #
+        # The full probabilities are still used when the ratios are too close
+        # to call, so the result always matches multiplying them out
+        #
+
+        ratios = self.base_ratios[base_id]
+
+        if parent_prob < MIN_RATIO_PROB:
+            # Comparisons with NaN are always False, which forces the full
+            # probabilities to be used below
+            parent_ratio = float('nan')
+        else:
+            parent_ratio = ratios[parent_pos][child[parent_pos]]
+
+        low_ratio = parent_ratio * (1 - RATIO_TOLERANCE)
+        high_ratio = parent_ratio * (1 + RATIO_TOLERANCE)
 
         # Go through all the possible parents
-        for pos, item in enumerate(child):
+        for pos, index in enumerate(child):
 
             # No sense calculating the calling parent
             if pos == parent_pos:
                 continue
 
             # Skip if there is no parent at this position
-            if item[1] == 0:
+            if index == 0:
                 continue
 
-            # Create the new parent
-            new_parent = copy.copy(child)
-            new_parent[pos] = (new_parent[pos][0], new_parent[pos][1]-1)
+            ratio = ratios[pos][index]
 
-            # Calculate new parent's probability
-            new_parent_prob = self._find_prob(new_parent, base_prob)
+            # The new parent is more probable, so it isn't responsible
+            if ratio > high_ratio:
+                continue
+
+            # The new parent is less probable, so it will take care of the child
+            if ratio < low_ratio:
+                return False
+
+            # Too close to call, so calculate the new parent's probability
+            new_parent = child[:pos] + (index - 1,) + child[pos + 1:]
+            new_parent_prob = self._find_prob(base_id, new_parent)
 
             # Check if the new parent should take care of the child
             if new_parent_prob < parent_prob:
@@ -622,15 +1442,14 @@ class PcfgGrammar:
         return True
 
 
-    def _find_prob(self, pt, base_prob):
+    def _find_prob(self, base_id, indices):
         """
         Finds the probability of a parse tree
 
         Inputs:
-            pt: The parse tree, which is a list of tuples indexed into the
-            grammar
+            base_id: The base structure of the parse tree
 
-            base_prob: The probability of the base structure
+            indices: The grammar index of each replacement, (tuple)
 
         Returns:
             prob: The probability of the parse tree according to the grammar
@@ -638,12 +1457,10 @@ class PcfgGrammar:
 
         # Initialize the final probabilty as that of the base_probability
         # This will be updated later with all of the individual transistion probs
-        prob = base_prob
+        prob = self.base[base_id]['prob']
 
-        for item in pt:
-            pt_type = item[0]
-            index = item[1]
-            prob *= self.grammar[pt_type][index]['prob']
+        for probs, index in zip(self.base_probs[base_id], indices):
+            prob *= probs[index]
 
         return prob
 
@@ -739,19 +1556,27 @@ class PcfgGrammar:
             return self.get_status(pt[1:],cur_guess = new_guess)
 
 
-    def restore_prob_order(self, pt_item, max_prob, min_prob, save_function):
+    def restore_prob_order(self, node, prob, max_prob, min_prob, save_function, max_inclusive=True):
         """
-        Walks through the pt_item restoring children using save_function
+        Walks through the node restoring children using save_function
 
-        This is currently a launch function that initializes and then
-        kicks off the recursive restore. I eventually need to come back to this
-        and create a non-recursive version of this since it's caused some problems
-        when restoring longer sessions from large grammars. The problem is
-        it will hit Python's recursion limit and crash. I'm minimizing this by
-        increasing Python's recursion limit but that fix does not bring me joy.
+        The parse trees of a base structure are walked depth first using an
+        explicit stack, so long sessions from large grammars can't run into
+        Python's recursion limit. Parse trees that were already popped off
+        the queue, (higher probability than max_prob), are walked through to
+        find their children. Parse trees at or below max_prob are restored if
+        none of their parents are still in the queue.
+
+        Rather than multiplying out the full probability of every parse tree
+        walked, the probability is updated from its parent using the same
+        ratios as the Deadbeat Dad check. The full probability is only
+        calculated for parse trees that are restored or too close to max_prob
+        to call, so the restored probabilities are exact
 
         Inputs:
-            pt_item: A pt_item to parse
+            node: The PtNode of a base structure to parse
+
+            prob: The probability of the node
 
             max_prob: (float): The maximum probability of an item to restore. Items
             with a higher probability will not be restored. This is to avoid
@@ -762,141 +1587,191 @@ class PcfgGrammar:
             the size of the saved/restored values by not adding items that will
             likely never be guessed
 
-            save_function: The function to call to save valid children
+            save_function: The function to call to save valid children. It is
+            called as save_function(prob, node)
+
+            max_inclusive: If True, items with a probability equal to max_prob
+            are restored. If False, only items with a lower probability are
 
         Returns:
-            True: It was successful
-
-            False: An error was encountered
-        """
-        recursion_depth = 10**6
-        try:
-            sys.setrecursionlimit(recursion_depth)
-            self._recursive_restore_prob_order(pt_item, max_prob, min_prob, save_function)
-        except RecursionError:
-            print ("Recursion error with restorting the save file",file=sys.stderr)
-            print (f"Max recusion depth of {recursion_depth} exceeded",file=sys.stderr)
-            print (f"Please open a bug/issue on the project github page since the",file=sys.stderr)
-            print (f"programmer obviously made some bad assumptions. That might",file=sys.stderr)
-            print (f"give them incentive to program a non-recursive restore...",file=sys.stderr)
-            return False
+            None
+        """
 
-        return True
+        base_id = node.base_id
+        base_probs = self.base_probs[base_id]
+        ratios = self.base_ratios[base_id]
+
+        # Estimated probabilities outside of these are far enough from
+        # max_prob that rounding errors can't change which side they are on
+        low_prob = max_prob * (1 - RATIO_TOLERANCE)
+        high_prob = max_prob * (1 + RATIO_TOLERANCE)
+
+        # Each item is (indices, prob, is_exact, left_index). Children are
+        # only created at left_index and to the right of it, so every parse
+        # tree is only walked once. Items are pushed in reverse so they are
+        # popped in the same order a recursive walk would visit them
+        stack = [(node.indices, prob, True, 0)]
+
+        while stack:
+            indices, prob, is_exact, left_index = stack.pop()
+
+            # The same as find_children(), nothing below this can meet the
+            # password policy
+            if self.policy is not None and not self.policy.subtree_can_comply(self.grammar, self.base_types[base_id], indices):
+                continue
+
+            # Too close to call, (or NaN), so calculate the full probability
+            if not is_exact and (prob < MIN_RATIO_PROB or not (prob > high_prob or prob < low_prob)):
+                prob = self._find_prob(base_id, indices)
+                is_exact = True
+
+            # If this node might be inserted into the queue
+            if prob < max_prob or (max_inclusive and prob == max_prob):
+
+                # Too low probability, stop this parsing
+                if not is_exact and prob < min_prob * (1 + RATIO_TOLERANCE):
+                    prob = self._find_prob(base_id, indices)
+                    is_exact = True
+
+                if prob < min_prob:
+                    continue
+
+                # Check to make sure none of this child's parents are in
+                # the queue
+                if not self._is_parent_around(base_id, indices, prob, max_prob, max_inclusive):
+                    if not is_exact:
+                        prob = self._find_prob(base_id, indices)
+
+                    # Save the node, we don't need to check its children
+                    save_function(prob, PtNode(base_id, indices))
+
+                continue
+
+            # Find the children to the right of left_index + left_index itself
+            for pos in range(len(indices) - 1, left_index - 1, -1):
 
+                index = indices[pos] + 1
 
-    def _recursive_restore_prob_order(self, pt_item, max_prob, min_prob, save_function, left_index=0):
+                # If true, there are no children at this level
+                if len(base_probs[pos]) == index:
+                    continue
+
+                # Create the child node
+                child = indices[:pos] + (index,) + indices[pos + 1:]
+
+                # A ratio of NaN, (or 0), means the probability has to be
+                # calculated in full
+                ratio = ratios[pos][index]
+                if ratio > 0:
+                    stack.append((child, prob / ratio, False, pos))
+                else:
+                    stack.append((child, self._find_prob(base_id, child), True, pos))
+
+
+    def _is_parent_around(self, base_id, child, prob, max_prob, max_inclusive):
         """
-        Walks through the pt_item restoring children using save_function
+        Faster version of is_parent_around() used when restoring sessions
 
-        Note: This works recursivly with the first call being passed the base_item
-        which is the most probable pt parsing
+        The probability of each parent is estimated from the child's using
+        the Deadbeat Dad ratios. The full probability is only calculated if
+        it is too close to max_prob to call
 
         Inputs:
-            pt_item: A pt_item to parse
+            base_id: The base structure of the child
 
-            max_prob: (float): The maximum probability of an item to restore. Items
-            with a higher probability will not be restored. This is to avoid
-            re-guessing passwords that have already been guessed
+            child: The child's grammar indices, (tuple)
 
-            min_prob: (float): The minimum probability of an item to restore. Items
-            with a lower probability will not be restored. This is to minimize
-            the size of the saved/restored values by not adding items that will
-            likely never be guessed
+            prob: The probability of the child
 
-            save_function: The function to call to save valid children
+            max_prob: The maximum probabilty of the parse tree
 
-            left_index: The index to find children at. The orig calling function should
-            not use this
+            max_inclusive: If a parent with a probability equal to max_prob
+            is still around
 
         Returns:
-            None
-        """    
-
-        parent_prob = pt_item['prob']
-        parent_pt = pt_item['pt']
-        parent_len = len(parent_pt)
+            True: There is a parent node still in the pqueue
 
-        # Too low probability, stop this parsing
-        if parent_prob < min_prob:
-            return
+            False: There is no parent tree in the pqueue
+        """
 
-        # If this node might be inserted into the queue
-        elif parent_prob <= max_prob:
-            # Check to make sure none of this child's parents are in the queue
-            if not self.is_parent_around(pt_item, max_prob):
-                # Save the node and exit, since we don't need to check its
-                # children
-                save_function(pt_item)
+        if prob < MIN_RATIO_PROB:
+            return self.is_parent_around(PtNode(base_id, child), max_prob, max_inclusive)
 
-            return
+        ratios = self.base_ratios[base_id]
+        low_prob = max_prob * (1 - RATIO_TOLERANCE)
+        high_prob = max_prob * (1 + RATIO_TOLERANCE)
 
-        # Only find children the left of left_index + left_index itself
-        for pos in range(left_index, parent_len):
+        for pos, index in enumerate(child):
 
-            item = parent_pt[pos]
+            # Skip if there is no parent at this position
+            if index == 0:
+                continue
 
-            parent_type = item[0]
-            parent_index = item[1]
+            parent_prob = prob * ratios[pos][index]
 
-            # If true, there are no children at this level
-            if len(self.grammar[parent_type]) == parent_index +1:
+            # The parent has already been popped off the queue
+            if parent_prob > high_prob:
                 continue
 
-            # Create the child node
-            child = copy.copy(parent_pt)
-            child[pos] = (child[pos][0], child[pos][1]+1)
+            # The parent is still in the queue
+            if parent_prob < low_prob:
+                return True
 
-            child_item = {
-                    'pt':child,
-                    'base_prob': pt_item['base_prob'],
-                    'prob': self._find_prob(child, pt_item['base_prob'])
-                }
+            # Too close to call, so calculate the parent's full probability
+            new_parent = child[:pos] + (index - 1,) + child[pos + 1:]
+            new_parent_prob = self._find_prob(base_id, new_parent)
 
-            # Call the function again for the child
-            self._recursive_restore_prob_order(child_item, max_prob, min_prob, save_function, left_index = pos)
+            if new_parent_prob < max_prob or (max_inclusive and new_parent_prob == max_prob):
+                return True
+
+        return False
 
 
-    def is_parent_around(self, pt_item, max_prob):
+    def is_parent_around(self, node, max_prob, max_inclusive=True):
         """
         Used as part of the Deadbeat Dad algorithm to identify if a child's parent
         node is currently in the pqueue or not. If so, this child does not need
         to be inserted into the pqueue.
 
         Inputs:
-            pt_item: The parse tree of the child
+            node: The PtNode of the child
 
             max_prob: The maximum probabilty of the parse tree. If the parent is still around
             it needs to be of a lower probability than max_prob.
 
+            max_inclusive: If True, a parent with a probability equal to
+            max_prob is also still around. This needs to match how the
+            parents are restored, otherwise a child can be restored along
+            with the parent that will create it again
+
         Returns:
             True: There is a parent node still in the pqueue
 
             False: There is no parent tree in the pqueue
         """
 
-        child = pt_item['pt']
+        child = node.indices
 
-        for pos, item in enumerate(child):
+        for pos, index in enumerate(child):
 
             # Skip if there is no parent at this position
-            if item[1] == 0:
+            if index == 0:
                 continue
 
             # Create the new parent
-            new_parent = copy.copy(child)
-            new_parent[pos] = (new_parent[pos][0], new_parent[pos][1]-1)
+            new_parent = child[:pos] + (index - 1,) + child[pos + 1:]
 
             # Calculate new parent's probability
-            new_parent_prob = self._find_prob(new_parent, pt_item['base_prob'])
+            new_parent_prob = self._find_prob(node.base_id, new_parent)
 
             # Check if the new parent should take care of the child
-            if new_parent_prob < max_prob:
+            if new_parent_prob < max_prob or (max_inclusive and new_parent_prob == max_prob):
                 return True
 
         return False
 
 
-    def restore_omen(self, omen_guess_num, pt_item):
+    def restore_omen(self, omen_guess_num, pt_item, partitioned=False, worker_pool=None, limit=None):
         """
         Restores an OMEN guessing session and starts generating OMEN guesses.
 
@@ -908,20 +1783,38 @@ class PcfgGrammar:
 
             pt_item: The parse tree that specifies the OMEN level
 
+            partitioned: If True the session was saved as partitions by
+            multiple workers
+
+            worker_pool: (None/GuessWorkerPool) The workers to hand the
+            partitions out to. If None, the guesses are generated in this process
+
+            limit: (None/Int) The maximum number of guesses to generate.
+            Ignored if None
+
         Returns:
             Int: The number of guesses generated
 
 
         """
 
-        # Initialize, then restore the markovcracker
-        markov_cracker = MarkovCracker(self.omen_grammar, 1, self.omen_optimizer)
-        markov_cracker.load_session(self.save_file[:-4]+'.omn', pt_item)
-
         # Initalize counter used for status reports and save files
         self.omen_guess_num = omen_guess_num
 
-        return self.omen_generate_guesses(markov_cracker)
+        if partitioned:
+            markov_cracker = PartitionedMarkovCracker(self.omen_grammar, 1, self.omen_optimizer)
+            markov_cracker.load_session(self.save_file[:-4]+'.omp', pt_item)
+
+            if worker_pool is not None:
+                return worker_pool.submit_omen(markov_cracker, limit)
+
+            return self.omen_generate_partitions(markov_cracker, limit)
+
+        # Initialize, then restore the markovcracker
+        markov_cracker = IndexedMarkovCracker(self.omen_grammar, 1, self.omen_optimizer)
+        markov_cracker.load_session(self.save_file[:-4]+'.omn', pt_item)
+
+        return self.omen_generate_guesses(markov_cracker, limit)
 
 
     def save_to_file(self, filename):
@@ -932,8 +1825,7 @@ class PcfgGrammar:
         option for guess generation, which is nice when parsing inputs
         from the command line
 
-        Additional Note: Not currently using this in the main pcfg cracker
-        but leaving this in for other tool use.
+        Additional Note: The filename can also be a named pipe, (FIFO)
 
         Inputs:
             filename: The name of the file to save guesses to
@@ -946,44 +1838,49 @@ class PcfgGrammar:
 
         # If a file was specified to write the data to, open it for writing
         if self.output_filename:
-            self.output_file = codecs.open(
-                self.output_filename,
-                'w',
-                encoding= self.encoding,
-            )
+            self.output.close()
+            self.output = create_output(self.output_filename, self.encoding)
 
-            # Overload the print_guess function
-            self.print_guess = self.write_guess_to_file
 
-
-    def write_guess_to_file(self, guess):
+    def shutdown(self):
         """
-        Saves the actual guess to file. Used to overload the normal print_guess to stdout function
+        Cleanup function when shutting down to ensure that any buffered
+        guesses are written out and output files are properly closed
 
         Inputs:
-            guess: The password guess to save to file
+            None
 
         Returns:
             None
+
         """
-        self.output_file.write(guess)
-        self.output_file.write('\n')
+        self.output.close()
 
+        self.save_omen_optimizer()
 
-    def shutdown(self):
+
+    def save_omen_optimizer(self):
         """
-        Cleanup function when shutting down to ensure that any output files
-        are properly closed
+        Saves the results cached by the OMEN optimizer to the grammar cache
+        so later sessions can start with them
+
+        Nothing is saved if no new results were found
 
         Inputs:
             None
 
         Returns:
             None
-
         """
-        if self.output_filename:
-            self.output_file.close()
+
+        if not self.omen_optimizer.modified:
+            return
+
+        GrammarCache(self.base_directory).save(
+            'omen_optimizer',
+            None,
+            self.omen_optimizer.save_state()
+            )
 
 
     def random_walk(self):
@@ -1031,6 +1928,8 @@ class PcfgGrammar:
                     break
         
         # Calculate the probability
-        pt_item['prob'] = self._find_prob(pt_item['pt'], pt_item['base_prob'])
+        pt_item['prob'] = pt_item['base_prob']
+        for pt_type, index in pt_item['pt']:
+            pt_item['prob'] *= self.grammar[pt_type][index]['prob']
 
         return pt_item
\ No newline at end of file
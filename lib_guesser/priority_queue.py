@@ -13,133 +13,14 @@ generation session
 """
 
 
+import sys
+import os
 import heapq
+import pickle # Used for saving snapshots
+from array import array
 
-
-class QueueItem:
-    """
-    Wrapper for a parse tree item
-
-    This is so the Priority Queue can determine where to place a parse tree item
-    Aka it holds all the "less than", "greater than", "equal to", logic for abs
-    parse tree
-
-    Need to have a custom compare functions for use in the priority queue
-
-    I have to do this the reverse of what I'd normally expect
-    since the priority queue will output stuff of lower values first.
-    Aka if there are two items with probabilities of 0.7 and 0.4, the PQueue
-    will by default output 0.4
-    """
-
-    def __init__(self, pt_item):
-        """
-        Initialization function
-
-        Inputs:
-            pt_item: A parse tree item, (List)
-
-        Returns:
-            QueueItem
-        """
-
-        self.pt_item = pt_item
-
-    def __lt__(self, other):
-        """
-        Reverse of what you'd expect since the priority queue needs to output
-        the highest probability guess first. Therefore while this checkes the
-        "less then" for this item, it really checks if the item is higher probability
-        than what it is being compared against
-
-        Inputs:
-            other: Item to compare against
-
-        Outputs:
-            True: If the item is higher probability than the other
-
-            False: If the item is lower probability than the other
-        """
-        return self.pt_item['prob'] > other.pt_item['prob']
-
-    def __le__(self, other):
-        """
-        Reverse of what you'd expect since the priority queue needs to output
-        the highest probability guess first. Therefore while this checkes the
-        "less then or equal" for this item, it really checks if the item is higher probability
-        or equal than what it is being compared against
-
-        Inputs:
-            other: Item to compare against
-
-        Outputs:
-            True: If the item is higher probability than the other or equal
-
-            False: If the item is lower probability than the other
-        """
-        return self.pt_item['prob'] >= other.pt_item['prob']
-
-    def __eq__(self, other):
-        """
-        Checks if this item is equal to the other item.
-
-        Inputs:
-            other: Item to compare against
-
-        Outputs:
-            True: If the item and the other are equal probability
-
-            False: If this item and the other item have different probabilities
-        """
-        return self.pt_item['prob'] == other.pt_item['prob']
-
-    def __ne__(self, other):
-        """
-        Checks if this item is not equal to the other item.
-
-        Inputs:
-            other: Item to compare against
-
-        Outputs:
-            True: If this item and the other item have different probabilities
-
-            False: If the item and the other are equal probability
-        """
-        return self.pt_item['prob'] != other.pt_item['prob']
-
-    def __gt__(self, other):
-        """
-        Reverse of what you'd expect since the priority queue needs to output
-        the highest probability guess first. Therefore while this checkes the
-        "greater then" for this item, it really checks if the item is lower probability
-        than what it is being compared against
-
-        Inputs:
-            other: Item to compare against
-
-        Outputs:
-            True: If the item is lower probability than the other
-
-            False: If the item is higher probability than the other
-        """
-        return self.pt_item['prob'] < other.pt_item['prob']
-
-    def __ge__(self, other):
-        """
-        Reverse of what you'd expect since the priority queue needs to output
-        the highest probability guess first. Therefore while this checkes the
-        "greater then or equal" for this item, it really checks if the item is lower probability
-        or equal to what it is being compared against
-
-        Inputs:
-            other: Item to compare against
-
-        Outputs:
-            True: If the item is lower probability or equal to the other
-
-            False: If the item is higher probability than the other
-        """
-        return self.pt_item['prob'] <= other.pt_item['prob']
+# Local imports
+from .pcfg_grammar import PtNode
 
 
 class PcfgQueue:
@@ -153,9 +34,14 @@ class PcfgQueue:
     better support removing low probability items from it when it grows too
     large. Therefore I felt it would be best to treat it as a class. Right now
     though it uses the standared python queue HeapQ as its backend
+
+    To save memory the queue holds (-prob, node) tuples where node is a
+    PtNode. The probability is negated since HeapQ outputs the lowest value
+    first. Items are only turned into full parse tree items when popped
     """
 
-    def __init__(self, pcfg, save_config = None):
+    def __init__(self, pcfg, save_config = None, max_queue_size = 50000, worker_pool = None,
+        snapshot_file = None):
         """
         Basic initialization function
 
@@ -167,6 +53,17 @@ class PcfgQueue:
                 min_probability: float
                 max_probability: float
 
+            max_queue_size: The maximum number of items in the queue before
+            the lowest probability items are dropped to save memory
+
+            worker_pool: (None/GuessWorkerPool) The workers to split up
+            restoring a saved session between. If None, the session is
+            restored in this process
+
+            snapshot_file: (None/String) A snapshot written by save_snapshot()
+            to restore the queue from. If it is missing or doesn't match
+            save_config, the queue is rebuilt from the grammar instead
+
         Returns:
             PcfgQueue
         """
@@ -174,7 +71,7 @@ class PcfgQueue:
         # Holds the grammar
         self.pcfg = pcfg
 
-        # The actual priority queue
+        # The actual priority queue of (-prob, node) tuples
         self.p_queue = []
 
         # The current highest priority item in the queue. Used for memory
@@ -188,14 +85,36 @@ class PcfgQueue:
         # Used for memory management. The maximum number of items before
         # triming the queue.
         # Note: the queue can temporarially be larger than this
-        self.max_queue_size = 50000
+        self.max_queue_size = max_queue_size
+
+        # The lowest probability of an item that was dropped from the queue.
+        # Set to None if nothing has been dropped. Used to regenerate the
+        # dropped items once the queue empties
+        self.lowest_dropped = None
+
+        # The base structures that items were dropped from. Only these need
+        # to be walked to regenerate the dropped items
+        self.dropped_bases = set()
+
+        # The last item popped off the queue, the children it added, and
+        # max_probability before it was popped. Used to put it back when
+        # saving a snapshot, since the session is saved before its guesses
+        # are generated
+        self.last_item = None
+        self.last_children = []
+        self.last_probability = self.max_probability
+
+        # Statistics for the metrics export. The number of items popped off
+        # the queue, and the number dropped to save memory
+        self.num_popped = 0
+        self.num_dropped = 0
 
         # New Guessing Session
         if save_config is None:
             # Initalize the priority queue with all of the initial base
             # structures from the pcfg
-            for base_item in self.pcfg.initalize_base_structures():
-                heapq.heappush(self.p_queue, QueueItem(base_item))
+            for prob, node in self.pcfg.initalize_base_structures():
+                heapq.heappush(self.p_queue, (-prob, node))
 
             return
 
@@ -203,8 +122,26 @@ class PcfgQueue:
         self.min_probability = save_config.getfloat('guessing_info', 'min_probability')
         self.max_probability = save_config.getfloat('guessing_info', 'max_probability')
 
-        for base_item in self.pcfg.initalize_base_structures():
-            self.restore_base_item(base_item)
+        base_nodes = self.pcfg.initalize_base_structures()
+
+        if snapshot_file is not None and save_config.has_option('guessing_info', 'snapshot_id'):
+            if self.load_snapshot(snapshot_file, save_config.getint('guessing_info', 'snapshot_id')):
+                return
+
+            print("Could not restore the priority queue snapshot. " +
+                "Rebuilding the queue from the grammar instead",file=sys.stderr)
+
+        if worker_pool is not None:
+            worker_pool.restore(
+                [node.base_id for _, node in base_nodes],
+                self.max_probability,
+                self.min_probability,
+                self.insert_queue
+                )
+            return
+
+        for prob, node in base_nodes:
+            self.restore_base_item(prob, node)
 
     def next(self):
         """
@@ -221,11 +158,20 @@ class PcfgQueue:
 
         # Check if the queue is empty
         if len(self.p_queue) == 0:
-            return None
+
+            # Items were dropped to save memory, so add them back in
+            if self.lowest_dropped is not None:
+                self._regenerate_dropped()
+
+            if len(self.p_queue) == 0:
+                return None
 
         # Pop the top value off the queue
-        queue_item = heapq.heappop(self.p_queue)
-        self.max_probability = queue_item.pt_item['prob']
+        self.last_probability = self.max_probability
+        self.last_item = heapq.heappop(self.p_queue)
+        neg_prob, node = self.last_item
+        self.max_probability = -neg_prob
+        self.num_popped += 1
 
         # Push the children back on the stack
         #
@@ -233,40 +179,155 @@ class PcfgQueue:
         # in my dissertation:
         # http://diginole.lib.fsu.edu/cgi/viewcontent.cgi?article=5135
         #
-        for child in self.pcfg.find_children(queue_item.pt_item):
-            self.insert_queue(child)
+        self.last_children = self.pcfg.find_children(node, self.max_probability)
+        for child_prob, child in self.last_children:
+            self.insert_queue(child_prob, child)
 
-        return queue_item.pt_item
+        return self.pcfg.create_pt_item(node, self.max_probability)
 
-    def insert_queue(self, queue_item):
+    def insert_queue(self, prob, node):
         """
         Inserts an item into the pqueue
 
         Making this its own function in case I decide to change how the pqueue
         operates in the future
 
+        Items with a lower probability than min_probability are not inserted.
+        They will be regenerated once the queue empties
+
+        Inputs:
+            prob: The probability of the parse tree
+
+            node: The PtNode to save in the pqueue
+
+        Returns:
+            None
+        """
+        if prob < self.min_probability:
+            self._record_dropped(prob, node)
+            return
+
+        heapq.heappush(self.p_queue, (-prob, node))
+
+        if len(self.p_queue) > self.max_queue_size:
+            self._trim_queue()
+
+    def _trim_queue(self):
+        """
+        Drops the lowest probability half of the queue to save memory
+
+        min_probability is raised to the lowest probability item that is kept
+        so children below it will not be inserted. Items with the same
+        probability as the lowest kept item are always kept so that
+        min_probability cleanly splits what is in the queue from what was
+        dropped
+
         Inputs:
-            queue_item: The value to save in the pqueue
+            None
 
         Returns:
             None
         """
-        heapq.heappush(self.p_queue, QueueItem(queue_item))
 
-    def restore_base_item(self, base_item):
+        # Items sort highest probability first, and a sorted list is still
+        # a valid heap
+        items = sorted(self.p_queue)
+
+        keep = self.max_queue_size // 2
+        while keep < len(items) and items[keep][0] == items[keep - 1][0]:
+            keep += 1
+
+        # Everything has the same probability so there is nothing to drop
+        if keep == len(items):
+            return
+
+        for neg_prob, node in items[keep:]:
+            self._record_dropped(-neg_prob, node)
+
+        self.min_probability = -items[keep - 1][0]
+        self.p_queue = items[:keep]
+
+    def _record_dropped(self, prob, node):
+        """
+        Keeps track of the lowest probability item that was dropped, and
+        which base structure it came from
+
+        Inputs:
+            prob: The probability of the dropped item
+
+            node: The PtNode of the dropped item
+
+        Returns:
+            None
+        """
+        if self.lowest_dropped is None or prob < self.lowest_dropped:
+            self.lowest_dropped = prob
+
+        self.dropped_bases.add(node.base_id)
+        self.num_dropped += 1
+
+    def _regenerate_dropped(self):
+        """
+        Adds back the items that were dropped from the queue
+
+        Called once every item at or above min_probability has been popped.
+        This walks the base structures items were dropped from the same way
+        restoring a session does, inserting every item below min_probability
+        whose parents have all been popped already. If there are too many the
+        queue will be trimmed again as they are inserted
+
+        Inputs:
+            None
+
+        Returns:
+            None
+        """
+
+        # Everything at min_probability has already been popped, so only
+        # items with a lower probability are restored
+        max_prob = self.min_probability
+        min_prob = self.lowest_dropped
+        base_ids = sorted(self.dropped_bases)
+
+        self.min_probability = min_prob
+        self.lowest_dropped = None
+        self.dropped_bases = set()
+
+        for base_id in base_ids:
+            prob, node = self.pcfg.create_base_node(base_id)
+            self.pcfg.restore_prob_order(
+                node,
+                prob,
+                max_prob,
+                self.min_probability,
+                self.insert_queue,
+                max_inclusive = False
+            )
+
+            # If the queue was trimmed while doing this, min_probability was
+            # raised and items below it were skipped without being inserted.
+            # Make sure they are regenerated next time
+            if self.min_probability > min_prob:
+                self._record_dropped(min_prob, node)
+
+    def restore_base_item(self, prob, node):
         """
         Restores all the items from the base_item to the pqueue
 
         This is used to restore a previous guessing session
 
         Inputs:
-            base_item: A pt of the most probable pre-terminal for a base_item
+            prob: The probability of the node
+
+            node: The PtNode of the most probable pre-terminal for a base
+            structure
 
         Returns:
             None
         """
-        load_success = self.pcfg.restore_prob_order(
-            base_item,
+        self.pcfg.restore_prob_order(
+            node,
+            prob,
             self.max_probability,
             self.min_probability,
             self.insert_queue
@@ -282,5 +343,152 @@ class PcfgQueue:
         Returns:
             None
         """
-        save_config.set('guessing_info', 'min_probability', str(self.min_probability))
+        # Items below min_probability may have been dropped, so make sure
+        # they will be restored if the session is loaded
+        min_probability = self.min_probability
+        if self.lowest_dropped is not None:
+            min_probability = self.lowest_dropped
+
+        save_config.set('guessing_info', 'min_probability', str(min_probability))
         save_config.set('guessing_info', 'max_probability', str(self.max_probability))
+
+    def create_snapshot(self, snapshot_id):
+        """
+        Creates a snapshot of the contents of the queue
+
+        Restoring from a snapshot only needs to read the queue back in vs.
+        walking through every parse tree the session has already popped. The
+        last item popped is put back, along with the probability before it
+        was popped, since the session is saved before its guesses are
+        generated
+
+        Inputs:
+            snapshot_id: (Int) Saved in both the snapshot and the save config
+            so a snapshot is only restored along with the config it belongs to
+
+        Returns:
+            data: (bytes) The snapshot to write to disk
+        """
+
+        items = self.p_queue
+        max_probability = self.max_probability
+
+        if self.last_item is not None:
+            children = {id(child) for _, child in self.last_children}
+            items = [item for item in items if id(item[1]) not in children]
+            items.append(self.last_item)
+
+            max_probability = self.last_probability
+
+        # Nodes are saved as flat arrays rather than pickling every PtNode.
+        # The number of indices for each node comes from its base structure
+        probs = array('d')
+        base_ids = array('I')
+        indices = array('I')
+        for neg_prob, node in items:
+            probs.append(-neg_prob)
+            base_ids.append(node.base_id)
+            indices.extend(node.indices)
+
+        snapshot = {
+            'snapshot_id': snapshot_id,
+            'num_bases': len(self.pcfg.base),
+            'max_probability': max_probability,
+            'min_probability': self.min_probability,
+            'lowest_dropped': self.lowest_dropped,
+            'dropped_bases': array('I', sorted(self.dropped_bases)),
+            'probs': probs,
+            'base_ids': base_ids,
+            'indices': indices,
+        }
+
+        return pickle.dumps(snapshot, protocol = pickle.HIGHEST_PROTOCOL)
+
+    def save_snapshot(self, file_name, snapshot_id):
+        """
+        Saves a snapshot of the contents of the queue to disk
+
+        The snapshot is written to a temporary file first and then renamed,
+        so an interrupted save never leaves a partial snapshot behind
+
+        Inputs:
+            file_name: The file to save the snapshot to
+
+            snapshot_id: (Int) The id to save with the snapshot, (see
+            create_snapshot)
+
+        Returns:
+            True: The snapshot was saved
+
+            False: An error occurred writing the file
+        """
+
+        temp_file = file_name + '.tmp'
+        try:
+            with open(temp_file, 'wb') as file:
+                file.write(self.create_snapshot(snapshot_id))
+            os.replace(temp_file, file_name)
+
+        except OSError as msg:
+            print(f"Error writing the priority queue snapshot: {msg}",file=sys.stderr)
+            return False
+
+        return True
+
+    def load_snapshot(self, file_name, snapshot_id):
+        """
+        Restores the contents of the queue from a snapshot
+
+        Inputs:
+            file_name: The file the snapshot was saved to
+
+            snapshot_id: (Int) The id saved in the save config. The snapshot
+            is only restored if it has the same id
+
+        Returns:
+            True: The queue was restored
+
+            False: The snapshot is missing, invalid, or from a different save
+        """
+
+        try:
+            with open(file_name, 'rb') as file:
+                snapshot = pickle.load(file)
+
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return False
+
+        if not isinstance(snapshot, dict) or snapshot.get('snapshot_id') != snapshot_id:
+            return False
+
+        if snapshot['num_bases'] != len(self.pcfg.base):
+            return False
+
+        base_types = self.pcfg.base_types
+        indices = snapshot['indices']
+
+        p_queue = []
+        pos = 0
+        try:
+            for prob, base_id in zip(snapshot['probs'], snapshot['base_ids']):
+                length = len(base_types[base_id])
+                p_queue.append((-prob, PtNode(base_id, tuple(indices[pos:pos + length]))))
+                pos += length
+
+        except IndexError:
+            return False
+
+        if pos != len(indices):
+            return False
+
+        # The items were saved in heap order, except for the last item
+        # popped which was added to the end
+        heapq.heapify(p_queue)
+
+        self.p_queue = p_queue
+        self.max_probability = snapshot['max_probability']
+        self.min_probability = snapshot['min_probability']
+        self.lowest_dropped = snapshot['lowest_dropped']
+        self.dropped_bases = set(snapshot['dropped_bases'])
+
+        return True
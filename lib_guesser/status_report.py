@@ -11,6 +11,11 @@ import sys
 import datetime
 import time
 
+# Local imports
+from .guess_output import find_output
+from .hash_output import HashOutput
+from .filter_output import DedupOutput, ExcludeOutput
+
 
 class StatusReport:
     """
@@ -47,6 +52,10 @@ class StatusReport:
         # The start time of the current run
         self.start_time = time.perf_counter()
 
+        # The number of guesses made before the current run. Used to find
+        # the guessing rate for this run
+        self.start_guesses = 0
+
     def print_status(self, pcfg):
         """
         Prints a status report to stderr
@@ -104,11 +113,34 @@ class StatusReport:
             print("OMEN Level: " + str(status_item['level']),file=sys.stderr)
             print("Keyspace for Level:           " + "{:,}".format(status_item['keyspace']),file=sys.stderr)
             print("Current Position in Keyspace: " + "{:,}".format(status_item['guess_num']),file=sys.stderr)
+            print("OMEN Optimizer Hits:          " + "{:,}".format(pcfg.omen_optimizer.hits),file=sys.stderr)
+            print("OMEN Optimizer Misses:        " + "{:,}".format(pcfg.omen_optimizer.misses),file=sys.stderr)
 
         # Print out info for non-OMEN guess generation
         else:
             self._print_guess(status_item['first_guess'])
 
+        # Prints out duplicate guess info
+        dedup_output = find_output(pcfg.output, DedupOutput)
+        if dedup_output is not None:
+            print("Duplicate Guesses Suppressed: " + "{:,}".format(dedup_output.num_duplicates),file=sys.stderr)
+            print("Duplicate Filter False Positive Rate: " + "{:.4%}".format(dedup_output.false_positive_rate()),file=sys.stderr)
+
+        # Prints out the number of known passwords skipped
+        exclude_output = find_output(pcfg.output, ExcludeOutput)
+        if exclude_output is not None:
+            print("Excluded Guesses Skipped: " + "{:,}".format(exclude_output.num_excluded),file=sys.stderr)
+
+        # Prints out hash cracking info
+        hash_output = find_output(pcfg.output, HashOutput)
+        if hash_output is not None:
+            guess_rate = (self.num_guesses - self.start_guesses) / max(current_session_time, 1)
+            print("Hash Type: " + hash_output.hash_type,file=sys.stderr)
+            print("Hashes Cracked: " + "{:,}".format(hash_output.num_cracked) + " of " +
+                "{:,}".format(hash_output.num_targets),file=sys.stderr)
+            print("Hashes Remaining: " + "{:,}".format(len(hash_output.targets)),file=sys.stderr)
+            print("Guesses Hashed Per Second: " + "{:,.0f}".format(guess_rate),file=sys.stderr)
+
     def _print_guess(self, guess):
         """
         Prints out an example guess from the current pre-terminal to stderr for status report
@@ -296,6 +328,29 @@ class StatusReport:
         print("", file=sys.stderr)
         print("                  Other OMEN status outputs can be useful for debugging", file=sys.stderr)
         print("                  and research purposes.", file=sys.stderr)
+        print("", file=sys.stderr)
+        print("                  The OMEN Optimizer caches parts of previous guesses.", file=sys.stderr)
+        print("                  Its results are saved between sessions, so hits", file=sys.stderr)
+        print("                  should go up when guessing with the same ruleset again.", file=sys.stderr)
+        print("", file=sys.stderr)
+        print("    Duplicate Guesses Suppressed:", file=sys.stderr)
+        print("        Overview: Only displayed with --dedup. The number of guesses", file=sys.stderr)
+        print("                  that were not written out since an earlier", file=sys.stderr)
+        print("                  pre-terminal already created them", file=sys.stderr)
+        print("        Misc: The filter uses a fixed amount of memory, so a small", file=sys.stderr)
+        print("              number of new guesses are dropped too. The false", file=sys.stderr)
+        print("              positive rate is the estimated chance of that", file=sys.stderr)
+        print("", file=sys.stderr)
+        print("    Excluded Guesses Skipped:", file=sys.stderr)
+        print("        Overview: Only displayed with --exclude. The number of guesses", file=sys.stderr)
+        print("                  that were not written out since they are in the", file=sys.stderr)
+        print("                  exclude file", file=sys.stderr)
+        print("", file=sys.stderr)
+        print("    Hash Cracking Status Outputs:", file=sys.stderr)
+        print("        Overview: Only displayed when checking guesses against a list", file=sys.stderr)
+        print("                  of hashes with --hashes. Every guess is hashed, so", file=sys.stderr)
+        print("                  guesses hashed per second is the guessing rate for", file=sys.stderr)
+        print("                  this session.", file=sys.stderr)
 
     def update_save_config(self, save_config):
         """
@@ -327,6 +382,7 @@ class StatusReport:
             None
         """
         self.num_guesses = save_config.getint('session_info', 'num_guesses')
+        self.start_guesses = self.num_guesses
         self.num_parse_trees = save_config.getint('session_info', 'num_parse_trees')
         self.probability_coverage = save_config.getfloat('session_info', 'probability_coverage')
         self.past_guessing_time = save_config.getint('session_info','running_time')
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+
+#######################################################
+# Helper code for the guesser unit tests
+#
+# Builds a small PCFG grammar in memory so the tests
+# don't have to load a full ruleset from disk
+#
+#######################################################
+
+
+## Functions and classes to tests
+#
+from ..pcfg_grammar import PcfgGrammar
+from ..grammar_io import compile_capitalization_masks, LazyGrammar
+from ..guess_output import MemoryOutput
+
+
+## Output that saves guesses to a list vs. writing them out
+#
+class GuessCapture:
+
+    def __init__(self):
+        self.guesses = []
+
+    def write(self, guess):
+        self.guesses.append(guess)
+
+    def write_batch(self, guesses):
+        self.guesses.extend(guesses)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def create_worker_output(self):
+        return MemoryOutput('utf-8')
+
+
+## Creates a PcfgGrammar with a small hand built grammar
+#
+# Note: All of the probabilities are powers of two so that
+# multiplying/dividing them is exact in floating point
+#
+def create_test_grammar():
+
+    pcfg = PcfgGrammar.__new__(PcfgGrammar)
+
+    pcfg.rulename = "unit_test"
+    pcfg.debug = False
+    pcfg.encoding = 'utf-8'
+    pcfg.ruleset_info = {'encoding':'utf-8', 'uuid':'unit_test'}
+
+    pcfg.grammar = LazyGrammar({})
+    pcfg.grammar.update({
+        'A3': [
+            {'values':['cat','dog'], 'prob':0.25},
+            {'values':['pig'], 'prob':0.125},
+            {'values':['cow','emu'], 'prob':0.0625},
+        ],
+        'C3': [
+            {'values':['LLL'], 'prob':0.5},
+            {'values':['ULL','UUU'], 'prob':0.125},
+            {'values':['LLU'], 'prob':0.0625},
+        ],
+        'D2': [
+            {'values':['12','99','00'], 'prob':0.125},
+            {'values':['01'], 'prob':0.0625},
+            {'values':['69','77'], 'prob':0.03125},
+        ],
+        'O1': [
+            {'values':['!'], 'prob':0.5},
+            {'values':['#','$'], 'prob':0.125},
+        ],
+    })
+
+    compile_capitalization_masks(pcfg.grammar['C3'])
+
+    pcfg.base = [
+        {'prob':0.5, 'replacements':['A3','C3','D2']},
+        {'prob':0.25, 'replacements':['D2','A3','C3','O1']},
+        {'prob':0.125, 'replacements':['D2']},
+        {'prob':0.125, 'replacements':['A3','C3','O1','A3','C3']},
+    ]
+
+    pcfg.omen_guess_num = 0
+    pcfg.should_exit = False
+    pcfg.omen_exit = False
+    pcfg.save_file = None
+    pcfg.output_filename = None
+    pcfg.slot_cache = None
+    pcfg.policy = None
+    pcfg.num_children = 0
+    pcfg.num_rejected_children = 0
+    pcfg.output = GuessCapture()
+
+    return pcfg
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+
+#######################################################
+# Reference guess generation engine
+#
+# This is the original recursive guess generation code
+# from PcfgGrammar. It's slow, but simple enough that it
+# is used to check the output of the current engine in
+# the unit tests, and as the baseline in the benchmarks
+#
+#######################################################
+
+
+## Applies a capitalization mask to the end of a guess
+#
+# The mask is applied to the last len(mask) characters of the guess
+#
+def apply_mask(guess, mask):
+
+    mask_len = len(mask)
+    end_word = guess[-mask_len:]
+
+    new_end = []
+    for index, item in enumerate(mask):
+        if item == 'L':
+            new_end.append(end_word[index])
+        else:
+            new_end.append(end_word[index].upper())
+
+    return guess[:-mask_len] + ''.join(new_end)
+
+
+## Recursivly generates guesses from a parse tree
+#
+# Guesses are written using pcfg.print_guess
+#
+# Returns the number of guesses generated
+#
+def recursive_guesses(pcfg, cur_guess, pt, limit=None):
+
+    num_guesses = 0
+
+    # Get the type for the transistion, Aka A10 for 10 letter long alpha
+    pt_type, index = pt[0]
+
+    # If it is a Markov guess
+    if pt_type[0] == 'M':
+        raise ValueError("The reference engine doesn't support OMEN parse trees")
+
+    for item in pcfg.grammar[pt_type][index]['values']:
+
+        # If it is a capitalization mask
+        if pt_type[0] == 'C':
+            new_guess = apply_mask(cur_guess, item)
+
+        # If it is any striaght replacement, (digits, letters, etc)
+        else:
+            new_guess = cur_guess + item
+
+        # Figure out if the guess is ready to be printed out or if
+        # there is more to do
+        if len(pt) == 1:
+            num_guesses += 1
+            pcfg.print_guess(new_guess)
+
+            # Check the limit
+            if limit:
+                limit = limit - 1
+                if limit <= 0:
+                    return num_guesses
+
+        else:
+            num_recursive_guesses = recursive_guesses(pcfg, new_guess, pt[1:], limit)
+            num_guesses += num_recursive_guesses
+
+            if limit:
+                limit = limit - num_recursive_guesses
+                if limit <= 0:
+                    return num_guesses
+
+    return num_guesses
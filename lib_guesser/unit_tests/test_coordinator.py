@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+
+#######################################################
+# Unit tests for handing out work to other guesser
+# processes
+#
+#######################################################
+
+
+import unittest
+import os
+import json
+import socket
+import tempfile
+import threading
+
+
+## Functions and classes to tests
+#
+from ..coordinator import Coordinator, create_server, run_worker, parse_address
+from ..priority_queue import PcfgQueue
+from .grammar_helper import create_test_grammar, GuessCapture
+
+
+## Generates all the guesses for the test grammar in this process
+#
+def generate_all():
+
+    pcfg = create_test_grammar()
+    pqueue = PcfgQueue(pcfg)
+
+    pt_item = pqueue.next()
+    while pt_item is not None:
+        pcfg.create_guesses(pt_item['pt'])
+        pt_item = pqueue.next()
+
+    return pcfg.output.guesses
+
+
+## Responsible for testing the coordinator and workers
+#
+# Note:
+# + = positive test, (valid input handling)
+# - = stress test, (invalid input handling)
+#
+# ==Current Tests==
+# + Addresses are parsed as TCP or Unix sockets
+# + Workers on the same host create every guess exactly once
+# - Work leased to a worker that disconnects is handed out again
+#
+class Test_Coordinator(unittest.TestCase):
+
+
+    ## Test parsing the coordinator address
+    #
+    def test_parse_address(self):
+
+        assert parse_address("localhost:5000") == (socket.AF_INET, ('localhost', 5000))
+        assert parse_address(":5000") == (socket.AF_INET, ('localhost', 5000))
+        assert parse_address("/tmp/pcfg.sock") == (socket.AF_UNIX, "/tmp/pcfg.sock")
+
+
+    ## Test running workers against a coordinator
+    #
+    def test_workers(self):
+
+        expected = generate_all()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            address = os.path.join(temp_dir, "coordinator.sock")
+
+            coordinator = Coordinator(create_test_grammar(), unit_size = 5)
+            server = create_server(coordinator, address)
+            server_thread = threading.Thread(target = server.serve_forever, args = (0.1,))
+            server_thread.daemon = True
+            server_thread.start()
+
+            try:
+                # A worker that takes a work unit and then disconnects
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+                    connection.connect(address)
+                    connection.sendall(b'{"type": "request"}\n')
+                    message = json.loads(connection.makefile('rb').readline())
+                    assert message['type'] == 'work'
+
+                # Run the real workers
+                outputs = []
+                threads = []
+                for _ in range(2):
+                    pcfg = create_test_grammar()
+                    pcfg.output = GuessCapture()
+                    outputs.append(pcfg.output)
+                    thread = threading.Thread(target = run_worker, args = (pcfg, address))
+                    thread.start()
+                    threads.append(thread)
+
+                for thread in threads:
+                    thread.join(timeout = 30)
+                    assert not thread.is_alive()
+
+            finally:
+                server.shutdown()
+                server.server_close()
+
+        assert coordinator.is_done()
+
+        status = coordinator.get_status()
+        assert status['num_reissued'] == 1
+        assert status['num_guesses'] == len(expected)
+
+        found = []
+        for output in outputs:
+            found.extend(output.guesses)
+        assert sorted(found) == sorted(expected)
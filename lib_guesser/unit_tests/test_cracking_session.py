@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+
+#######################################################
+# Unit tests for managing a cracking session
+#
+#######################################################
+
+
+import unittest
+import unittest.mock
+import os
+import configparser
+import tempfile
+
+
+## Functions and classes to tests
+#
+from .. import cracking_session
+from ..cracking_session import CrackingSession
+from ..priority_queue import PcfgQueue
+from ..omen.indexed_cracker import compile_grammar
+from ..omen.keyspace import Keyspace
+from ..omen.optimizer import Optimizer
+from .grammar_helper import create_test_grammar, GuessCapture
+from .test_omen_cracker import create_omen_grammar
+
+
+## The parse trees to generate guesses for
+#
+PARSE_TREES = [
+    [('D2',0)],
+    [('A3',0),('C3',1),('O1',1)],
+    [('M',0)],
+    [('D2',0),('A3',0),('C3',1),('O1',1)],
+    [('O1',0),('D2',1)],
+    [('A3',2),('C3',0)],
+]
+
+
+## Generates the guesses for all the parse trees on one node
+#
+def generate(pcfg, node, nodes):
+
+    session = CrackingSession(pcfg, None, None, node = node, nodes = nodes)
+    pcfg.output = GuessCapture()
+    for pt in PARSE_TREES:
+        session._create_guesses({'pt': pt, 'prob': 0.5}, None)
+
+    return pcfg.output.guesses
+
+
+## Responsible for testing cracking sessions
+#
+# Note:
+# + = positive test, (valid input handling)
+# - = stress test, (invalid input handling)
+#
+# ==Current Tests==
+# + Splitting a session across nodes creates every guess exactly once
+# + Automatic saves are written in the background and can be restored
+# + Iterating over the guesses of a session in batches
+#
+class Test_Cracking_Session(unittest.TestCase):
+
+
+    ## Create the grammar to generate guesses from, including an OMEN level
+    #
+    def setUp(self):
+        self.pcfg = create_test_grammar()
+        self.pcfg.grammar['M'] = [{'values':['6'], 'prob':1.0}]
+        self.pcfg.omen_grammar = compile_grammar(create_omen_grammar())
+        self.pcfg.omen_optimizer = Optimizer(max_length = 4)
+        self.pcfg.omen_counts = Keyspace(self.pcfg.omen_grammar)
+
+
+    ## Test the nodes cover every guess once between them
+    #
+    def test_nodes(self):
+
+        expected = generate(self.pcfg, 0, 1)
+
+        # Split up everything but the smallest parse trees by index range
+        with unittest.mock.patch.object(cracking_session, 'NODE_SPLIT_SIZE', 5):
+            for nodes in [2, 3, 7]:
+                found = []
+                for node in range(nodes):
+                    guesses = generate(self.pcfg, node, nodes)
+
+                    # Every node should get some of the work
+                    assert guesses
+                    found.extend(guesses)
+
+                assert sorted(found) == sorted(expected), nodes
+
+
+    ## Test automatically saving the session in the background
+    #
+    def test_checkpoint(self):
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            save_filename = os.path.join(temp_dir, "session.sav")
+
+            save_config = configparser.ConfigParser()
+            save_config.add_section('session_info')
+            save_config.add_section('guessing_info')
+
+            session = CrackingSession(
+                self.pcfg,
+                save_config,
+                save_filename,
+                snapshot = True,
+                checkpoint_interval = None,
+                checkpoint_guesses = 10
+                )
+            session.pqueue = PcfgQueue(self.pcfg)
+            session._schedule_checkpoint()
+            assert session.next_checkpoint_guesses == 10
+            assert session.next_checkpoint_time is None
+
+            for _ in range(5):
+                session.pqueue.next()
+            session.report.num_guesses = 12
+
+            session._checkpoint()
+            session._wait_for_save()
+            assert session.next_checkpoint_guesses == 22
+
+            # Only the finished files should be left
+            assert sorted(os.listdir(temp_dir)) == ["session.pqs", "session.sav"]
+
+            restored_config = configparser.ConfigParser()
+            restored_config.read(save_filename)
+            assert restored_config.getint('guessing_info', 'snapshot_id') == 1
+            assert restored_config.getint('session_info', 'num_guesses') == 12
+
+            restored = PcfgQueue(self.pcfg, restored_config, snapshot_file = session.snapshot_filename)
+            assert len(restored.p_queue) == len(session.pqueue.p_queue) + 1 - len(session.pqueue.last_children)
+
+
+    ## Test iterating over the guesses for a session
+    #
+    def test_iter_guesses(self):
+
+        # The guesses in the order run() would write them out
+        pqueue = PcfgQueue(self.pcfg)
+        self.pcfg.output = GuessCapture()
+        while True:
+            pt_item = pqueue.next()
+            if pt_item is None:
+                break
+            self.pcfg.create_guesses(pt_item['pt'])
+        expected = self.pcfg.output.guesses
+
+        session = CrackingSession(self.pcfg, None, None)
+        found = [guess for batch in session.iter_guesses(batch_size = 7) for guess in batch]
+        assert found == expected
+        assert session.report.num_guesses == len(expected)
+
+        session = CrackingSession(self.pcfg, None, None)
+        batches = list(session.iter_guesses(limit = 20, batch_size = 7, encoded = True))
+        assert b''.join(batches).decode('utf-8').split('\n')[:-1] == expected[:20]
+        assert session.report.num_guesses == 20
+
+        # Nothing was written to the output
+        assert self.pcfg.output.guesses == expected
+
+        # OMEN guesses keep using the same cracker between batches
+        self.pcfg.output = GuessCapture()
+        self.pcfg.create_guesses([('M',0)])
+        omen_guesses = self.pcfg.output.guesses
+        assert len(omen_guesses) > 3
+
+        batches = list(self.pcfg.iter_guesses([('M',0)], 3))
+        assert [guess for batch in batches for guess in batch] == omen_guesses
+        assert all(0 < len(batch) <= 3 for batch in batches)
+
+        batches = list(self.pcfg.iter_guesses([('M',0)], 2, limit = 3, start = 1))
+        assert [guess for batch in batches for guess in batch] == omen_guesses[1:4]
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+
+#######################################################
+# Unit tests for the outputs that filter guesses
+#
+#######################################################
+
+
+import unittest
+import os
+import tempfile
+
+
+## Functions and classes to tests
+#
+from ..bloom_filter import BloomFilter
+from ..filter_output import DedupOutput, ExcludeOutput, ExcludeList, load_exclude_list
+from ..hash_output import HashOutput
+from ..guess_output import MemoryOutput, find_output
+from .grammar_helper import create_test_grammar
+
+
+## Responsible for testing the Bloom filter and the outputs that filter guesses
+#
+# Note:
+# + = positive test, (valid input handling)
+# - = stress test, (invalid input handling)
+#
+# ==Current Tests==
+# + Items added to the Bloom filter are found again
+# + The filter adds layers as it grows, and stops at the memory limit
+# + Duplicate guesses from different parse trees are only written once
+# + Passwords on the exclude list are found, and others are not
+# + Loading potfiles, (including $HEX[] plaintexts), and wordlists
+# - Potfile lines without a plaintext are skipped
+# + Excluded guesses are not written out
+# + Finding a filter in a chain of outputs
+#
+class Test_Filter_Output(unittest.TestCase):
+
+
+    ## Test adding and checking items
+    #
+    def test_bloom_filter(self):
+
+        bloom = BloomFilter(2**20, initial_capacity = 1000)
+
+        assert bloom.filter_new([b'cat', b'dog', b'cat']) == [b'cat', b'dog']
+        assert not bloom.add(b'bird')
+        assert bloom.add(b'bird')
+        assert b'dog' in bloom
+        assert bloom.filter_new([b'dog', b'fish']) == [b'fish']
+
+
+    ## Test the filter grows until it hits the memory limit
+    #
+    def test_bloom_filter_growth(self):
+
+        bloom = BloomFilter(64 * 1024, initial_capacity = 1000)
+        items = [str(i).encode('ascii') for i in range(50000)]
+
+        new_items = bloom.filter_new(items)
+
+        assert len(bloom.layers) > 1
+        assert bloom.capacity is None
+        assert bloom.memory() <= 64 * 1024
+
+        # There will be a few false positives, but never false negatives
+        assert len(new_items) > len(items) * 0.9
+        assert all(item in bloom for item in items)
+
+        # Past the limit the false positive rate goes up, but is still tracked
+        assert 0.0 < bloom.false_positive_rate() < 1.0
+
+
+    ## Test duplicate guesses are dropped
+    #
+    def test_dedup(self):
+
+        pcfg = create_test_grammar()
+        output = DedupOutput(MemoryOutput('utf-8'), max_memory = 1, batch_size = 3)
+        pcfg.output = output
+
+        pcfg.create_guesses([('D2',0)])
+        pcfg.create_guesses([('A3',0),('C3',0)])
+        pcfg.create_guesses([('D2',0),('D2',1)])
+        pcfg.create_guesses([('D2',0)])
+        output.write_batch(['cat', 'emu'])
+        output.flush()
+
+        found = output.output.getvalue().decode('utf-8').split('\n')[:-1]
+        assert found == ['12', '99', '00', 'cat', 'dog', '1201', '9901', '0001', 'emu']
+        assert output.num_duplicates == 4
+
+
+    ## Test checking passwords against the exclude list
+    #
+    def test_exclude_list(self):
+
+        passwords = [str(i).encode('ascii') for i in range(0, 20000, 2)]
+        exclude_list = ExcludeList(passwords)
+
+        assert len(exclude_list) == 10000
+        assert all(password in exclude_list for password in passwords)
+        assert not any(str(i).encode('ascii') in exclude_list for i in range(1, 20000, 2))
+
+        assert exclude_list.filter([b'1', b'2', b'3', b'4', b'2']) == [b'1', b'3']
+        assert ExcludeList([]).filter([b'1']) == [b'1']
+
+
+    ## Test loading potfiles and wordlists
+    #
+    def test_load_exclude_list(self):
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            potfile = os.path.join(temp_dir, "hashcat.potfile")
+            with open(potfile, 'wb') as file:
+                file.write(b"5f4dcc3b5aa765d61d8327deb882cf99:password\r\n")
+                file.write(b"abcd:pass:word\nno plaintext\n")
+                file.write(b"1234:$HEX[636174c3a9]\n")
+
+            exclude_list = load_exclude_list(potfile)
+            assert len(exclude_list) == 3
+            for password in [b'password', b'pass:word', 'caté'.encode('utf-8')]:
+                assert password in exclude_list
+
+            wordlist = os.path.join(temp_dir, "words.txt")
+            with open(wordlist, 'wb') as file:
+                file.write(b"dog\na:b\n\n")
+
+            assert load_exclude_list(wordlist).filter([b'dog', b'a:b', b'b']) == [b'b']
+
+
+    ## Test excluded guesses are not written out
+    #
+    def test_exclude(self):
+
+        pcfg = create_test_grammar()
+        output = ExcludeOutput(MemoryOutput('utf-8'), ExcludeList([b'99', b'dog', b'01']), batch_size = 2)
+        pcfg.output = output
+
+        pcfg.create_guesses([('D2',0)])
+        pcfg.create_guesses([('A3',0),('C3',0)])
+        output.flush()
+
+        assert output.output.getvalue() == b'12\n00\ncat\n'
+        assert output.num_excluded == 2
+
+
+    ## Test finding outputs in a chain
+    #
+    def test_find_output(self):
+
+        base = MemoryOutput('utf-8')
+        hashes = HashOutput(base, {b'\x00' * 16}, 'md5')
+        output = DedupOutput(hashes)
+
+        assert find_output(output, HashOutput) is hashes
+        assert find_output(output, MemoryOutput) is base
+        assert find_output(base, DedupOutput) is None
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+
+#######################################################
+# Unit tests for finding the children of a parse tree
+# using the Deadbeat Dad algorithm
+#
+#######################################################
+
+
+import unittest
+import itertools
+import random
+
+
+## Functions and classes to tests
+#
+from ..pcfg_grammar import PtNode
+from .grammar_helper import create_test_grammar
+
+
+## Reference version of the Deadbeat Dad algorithm
+#
+# Multiplies out the full probability of every parent
+#
+def reference_find_children(pcfg, node, prob):
+
+    def find_prob(indices):
+        prob = pcfg.base[node.base_id]['prob']
+        for probs, index in zip(pcfg.base_probs[node.base_id], indices):
+            prob *= probs[index]
+        return prob
+
+    children = []
+    for parent_pos, index in enumerate(node.indices):
+        if index + 1 == len(pcfg.base_probs[node.base_id][parent_pos]):
+            continue
+
+        child = node.indices[:parent_pos] + (index + 1,) + node.indices[parent_pos + 1:]
+
+        is_my_child = True
+        for pos, child_index in enumerate(child):
+            if pos == parent_pos or child_index == 0:
+                continue
+
+            new_parent_prob = find_prob(child[:pos] + (child_index - 1,) + child[pos + 1:])
+            if new_parent_prob < prob or (new_parent_prob == prob and pos < parent_pos):
+                is_my_child = False
+                break
+
+        if is_my_child:
+            children.append((find_prob(child), child))
+
+    return children
+
+
+## Responsible for testing the Deadbeat Dad algorithm
+#
+# Note:
+# + = positive test, (valid input handling)
+# - = stress test, (invalid input handling)
+#
+# ==Current Tests==
+# + Matches the reference version with exact probabilities
+# + Matches the reference version with rounded probabilities
+# + Matches the reference version for long base structures
+# - Matches the reference version with zero probabilities
+#
+class Test_Find_Children(unittest.TestCase):
+
+
+    ## Create the grammar to find children in
+    #
+    def setUp(self):
+        self.pcfg = create_test_grammar()
+
+
+    ## Checks every node in every base structure against the reference
+    #
+    def check_all_nodes(self):
+
+        for base_prob, base_node in self.pcfg.initalize_base_structures():
+            sizes = [range(len(probs)) for probs in self.pcfg.base_probs[base_node.base_id]]
+            for indices in itertools.product(*sizes):
+                node = PtNode(base_node.base_id, indices)
+                prob = self.pcfg._find_prob(node.base_id, indices)
+
+                found = [(child_prob, child.indices) for child_prob, child in self.pcfg.find_children(node, prob)]
+                assert found == reference_find_children(self.pcfg, node, prob)
+
+
+    ## Replaces the probabilities in the test grammar
+    #
+    def set_probabilities(self, get_prob):
+
+        for items in self.pcfg.grammar.values():
+            for index, item in enumerate(items):
+                item['prob'] = get_prob(index)
+
+
+    ## Test the powers of two probabilities, which have a lot of ties
+    #
+    def test_exact_probabilities(self):
+        self.check_all_nodes()
+
+
+    ## Test probabilities that are rounded when multiplied together
+    #
+    def test_rounded_probabilities(self):
+
+        # Lots of close but not quite equal probabilities
+        self.set_probabilities(lambda index: 1 / (3 + index * 7))
+        self.check_all_nodes()
+
+        rand = random.Random(1234)
+        for _ in range(4):
+            self.set_probabilities(lambda index: rand.choice([0.1, 0.3, 0.7, 0.01, 1/3]))
+            self.check_all_nodes()
+
+
+    ## Test long base structures where many parents are checked
+    #
+    def test_long_base_structure(self):
+
+        self.pcfg.grammar['O1'].append({'values':['%'], 'prob':0.1})
+        self.pcfg.grammar['D2'][1]['prob'] = 0.1
+        self.pcfg.base = [{'prob':0.3, 'replacements':['O1', 'D2'] * 4}]
+        self.check_all_nodes()
+
+
+    ## Test zero probabilities fall back to the full calculation
+    #
+    def test_zero_probabilities(self):
+
+        self.set_probabilities(lambda index: [0.5, 0.0, 0.0][index])
+        self.check_all_nodes()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+
+#######################################################
+# Unit tests for the compiled grammar cache
+#
+#######################################################
+
+
+import unittest
+import unittest.mock
+import os
+import pickle
+import tempfile
+
+
+## Functions and classes to tests
+#
+from ..grammar_cache import load_cached, CACHE_FILENAME, KEY_FILENAME, MAGIC, HEADER_LENGTH, DIGEST_SIZE
+
+
+## Set if the malicious pickle in the tests is ever loaded
+#
+EXPLOITED = []
+
+
+def exploit():
+    EXPLOITED.append(True)
+    return {}
+
+
+## Runs exploit() when unpickled
+#
+class Malicious:
+
+    def __reduce__(self):
+        return (exploit, ())
+
+
+## Responsible for testing the grammar cache
+#
+# Note:
+# + = positive test, (valid input handling)
+# - = stress test, (invalid input handling)
+#
+# ==Current Tests==
+# + Sections are only built the first time they are loaded
+# + Sections with different options are cached seperately
+# + Changing the ruleset rebuilds the cache
+# - A corrupted cache is rebuilt
+# - Failed builds are not cached
+# - A cache signed with a different key is rebuilt
+# - A cache that wasn't signed is never unpickled
+#
+class Test_Grammar_Cache(unittest.TestCase):
+
+
+    ## Create a fake ruleset to cache
+    #
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.rule_directory = os.path.join(self.temp_dir.name, "rules")
+        self.config_file = os.path.join(self.rule_directory, "config.ini")
+        os.mkdir(self.rule_directory)
+
+        # Keep the secret key out of the real cache directory
+        self.cache_home = os.path.join(self.temp_dir.name, "cache_home")
+        self.environ = unittest.mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.cache_home})
+        self.environ.start()
+
+        with open(self.config_file, 'w') as file:
+            file.write("[TRAINING_DATASET_DETAILS]\nuuid = 1234\n")
+
+        self.num_builds = 0
+
+
+    def tearDown(self):
+        self.environ.stop()
+        self.temp_dir.cleanup()
+
+
+    ## Loads a section, keeping track of how many times it was built
+    #
+    def load(self, name = 'test', options = None, value = None):
+
+        def build():
+            self.num_builds += 1
+            return value if value is not None else {'name': name, 'options': options}
+
+        return load_cached(self.rule_directory, name, options, build)
+
+
+    ## Test the second load comes from the cache
+    #
+    def test_cached(self):
+
+        assert self.load() == {'name': 'test', 'options': None}
+        assert self.num_builds == 1
+        assert os.path.exists(os.path.join(self.rule_directory, CACHE_FILENAME))
+
+        assert self.load() == {'name': 'test', 'options': None}
+        assert self.num_builds == 1
+
+
+    ## Test different sections and options don't overwrite each other
+    #
+    def test_multiple_sections(self):
+
+        self.load('test', (True, False))
+        self.load('test', (False, False))
+        self.load('other')
+        assert self.num_builds == 3
+
+        assert self.load('test', (True, False)) == {'name': 'test', 'options': (True, False)}
+        assert self.load('test', (False, False)) == {'name': 'test', 'options': (False, False)}
+        assert self.load('other') == {'name': 'other', 'options': None}
+        assert self.num_builds == 3
+
+
+    ## Test the cache is rebuilt if any of the ruleset files change
+    #
+    def test_stale_cache(self):
+
+        self.load()
+
+        # Make sure the modification time is different
+        stats = os.stat(self.config_file)
+        with open(self.config_file, 'a') as file:
+            file.write("\n")
+        os.utime(self.config_file, ns = (stats.st_atime_ns, stats.st_mtime_ns + 10**9))
+
+        self.load()
+        assert self.num_builds == 2
+
+        self.load()
+        assert self.num_builds == 2
+
+
+    ## Test a corrupted cache file is ignored and replaced
+    #
+    def test_corrupted_cache(self):
+
+        with open(os.path.join(self.rule_directory, CACHE_FILENAME), 'wb') as file:
+            file.write(b'not a cache')
+
+        assert self.load() == {'name': 'test', 'options': None}
+        assert self.num_builds == 1
+
+        self.load()
+        assert self.num_builds == 1
+
+
+    ## Test a build that fails isn't saved
+    #
+    def test_failed_build(self):
+
+        assert load_cached(self.rule_directory, 'test', None, lambda: None) is None
+        assert not os.path.exists(os.path.join(self.rule_directory, CACHE_FILENAME))
+
+
+    ## Test a cache created with someone else's key isn't used
+    #
+    def test_different_key(self):
+
+        self.load()
+
+        with open(os.path.join(self.cache_home, KEY_FILENAME), 'wb') as file:
+            file.write(b'x' * DIGEST_SIZE)
+
+        assert self.load() == {'name': 'test', 'options': None}
+        assert self.num_builds == 2
+
+
+    ## Test a cache that wasn't signed, (for example one shipped with a
+    # downloaded ruleset), is never unpickled
+    #
+    def test_unsigned_cache(self):
+
+        raw_header = pickle.dumps(Malicious())
+        with open(os.path.join(self.rule_directory, CACHE_FILENAME), 'wb') as file:
+            file.write(MAGIC)
+            file.write(HEADER_LENGTH.pack(len(raw_header)))
+            file.write(b'\x00' * DIGEST_SIZE)
+            file.write(raw_header)
+
+        assert self.load() == {'name': 'test', 'options': None}
+        assert self.num_builds == 1
+        assert not EXPLOITED
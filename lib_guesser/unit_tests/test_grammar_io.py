@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+
+#######################################################
+# Unit tests for loading a grammar from disk
+#
+#######################################################
+
+
+import unittest
+import unittest.mock
+import os
+import tempfile
+
+
+## Functions and classes to tests
+#
+from ..grammar_io import load_grammar, LazyGrammar
+from ..grammar_cache import GrammarCache
+
+
+## The files of a small ruleset
+#
+RULESET_FILES = {
+    'config.ini': (
+        "[TRAINING_PROGRAM_DETAILS]\nversion = 4.7\n\n"
+        "[TRAINING_DATASET_DETAILS]\nencoding = utf-8\nuuid = 1234\n\n"
+        "[BASE_A]\nname = A\ndirectory = Alpha\nfilenames = [\"3.txt\"]\n\n"
+        "[CAPITALIZATION]\nname = C\ndirectory = Capitalization\nfilenames = [\"3.txt\"]\n\n"
+        "[BASE_D]\nname = D\ndirectory = Digits\nfilenames = [\"1.txt\", \"2.txt\"]\n\n"
+        "[BASE_O]\nname = O\ndirectory = Other\nfilenames = [\"1.txt\"]\n\n"
+        "[BASE_K]\nname = K\ndirectory = Keyboard\nfilenames = []\n\n"
+        "[BASE_X]\nname = X\ndirectory = Context\nfilenames = []\n\n"
+        "[BASE_Y]\nname = Y\ndirectory = Years\nfilenames = []\n"
+    ),
+    'Grammar/grammar.txt': "A3D2\t0.5\nD1\t0.3\nA3O1\t0.2\n",
+    'Alpha/3.txt': "cat\t0.5\ndog\t0.5\npig\t0.25\n",
+    'Capitalization/3.txt': "LLL\t0.75\nULL\t0.25\n",
+    'Digits/1.txt': "1\t0.5\n2\t0.25\n",
+    'Digits/2.txt': "12\t0.75\n99\t0.25\n",
+    'Other/1.txt': "!\t1.0\n",
+    'Omen/pcfg_omen_prob.txt': "1\t1.0\n",
+    'Emails/email_providers.txt': "",
+    'Websites/website_hosts.txt': "",
+}
+
+
+## Responsible for testing loading a grammar
+#
+# Note:
+# + = positive test, (valid input handling)
+# - = stress test, (invalid input handling)
+#
+# ==Current Tests==
+# + Terminals are only loaded the first time they are used
+# + Terminals loaded from the cache match the text files
+# + A read only ruleset is loaded from the text files as needed
+# - A missing terminal file is caught when the grammar is loaded
+#
+class Test_Grammar_IO(unittest.TestCase):
+
+
+    ## Create the ruleset in a temp directory
+    #
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.rule_directory = os.path.join(self.temp_dir.name, "rules")
+
+        # Keep the secret key for the cache out of the real cache directory
+        self.environ = unittest.mock.patch.dict(
+            os.environ,
+            {'XDG_CACHE_HOME': os.path.join(self.temp_dir.name, "cache_home")}
+            )
+        self.environ.start()
+
+        for filename, contents in RULESET_FILES.items():
+            full_path = os.path.join(self.rule_directory, filename)
+            os.makedirs(os.path.dirname(full_path), exist_ok = True)
+            with open(full_path, 'w') as file:
+                file.write(contents)
+
+
+    def tearDown(self):
+        self.environ.stop()
+        self.temp_dir.cleanup()
+
+
+    def load(self):
+        return load_grammar("unit_test", self.rule_directory, "4.7", False, False, "Grammar")
+
+
+    ## Test the cached grammar only loads terminals when they are used
+    #
+    def test_lazy_load(self):
+
+        # The first load builds the cache
+        grammar, base, ruleset_info = self.load()
+        assert isinstance(grammar, LazyGrammar)
+        assert [x['replacements'] for x in base] == [['A3','C3','D2'], ['D1'], ['A3','C3','O1']]
+
+        grammar, base, ruleset_info = self.load()
+        assert len(grammar) == 0
+        assert 'D2' in grammar
+        assert 'D3' not in grammar
+
+        assert grammar.get_probabilities('D2') == [0.75, 0.25]
+        assert len(grammar) == 0
+
+        assert grammar['D2'] == [
+            {'values':['12'], 'prob':0.75},
+            {'values':['99'], 'prob':0.25},
+        ]
+        assert list(grammar.keys()) == ['D2']
+
+        assert grammar['A3'] == [
+            {'values':['cat','dog'], 'prob':0.5},
+            {'values':['pig'], 'prob':0.25},
+        ]
+        assert grammar['C3'][1]['plans'] == [((0,1),)]
+
+        with self.assertRaises(KeyError):
+            grammar['D3']
+
+
+    ## Test a ruleset where the cache can't be saved
+    #
+    def test_read_only(self):
+
+        with unittest.mock.patch.object(GrammarCache, 'is_writable', return_value = False):
+            grammar, base, ruleset_info = self.load()
+
+        assert len(grammar) == 0
+        assert grammar.get_probabilities('C3') == [0.75, 0.25]
+        assert list(grammar.keys()) == ['C3']
+        assert grammar['O1'] == [{'values':['!'], 'prob':1.0}]
+
+
+    ## Test a missing file is caught up front vs. in the middle of a session
+    #
+    def test_missing_file(self):
+
+        os.remove(os.path.join(self.rule_directory, "Digits", "2.txt"))
+
+        with self.assertRaises(Exception):
+            self.load()
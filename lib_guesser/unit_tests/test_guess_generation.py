@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+
+#######################################################
+# Unit tests for generating guesses from a parse tree
+#
+#######################################################
+
+
+import unittest
+import unittest.mock
+
+
+## Functions and classes to tests
+#
+from .grammar_helper import create_test_grammar, GuessCapture
+from .reference_guesses import recursive_guesses, apply_mask
+from ..grammar_io import compile_capitalization_masks
+from ..pcfg_grammar import create_mask_function
+
+
+## Generates all the guesses for a parse tree using the requested engine
+#
+def generate(pcfg, pt, limit=None, recursive=False, start=0):
+
+    pcfg.output = GuessCapture()
+
+    if recursive:
+        num_guesses = recursive_guesses(pcfg, '', pt, limit)
+    else:
+        num_guesses = pcfg.create_guesses(pt, limit=limit, start=start)
+
+    return num_guesses, pcfg.output.guesses
+
+
+## Responsible for testing the guess generation engine
+#
+# Note:
+# + = positive test, (valid input handling)
+# - = stress test, (invalid input handling)
+#
+# ==Current Tests==
+# + Single transition parse tree
+# + Capitalization masks applied in the middle and at the end
+# + Capitalization masks that aren't after an alpha string
+# + Precompiled capitalization masks match applying the mask by character
+# + Output order matches the recursive engine for every base structure
+# + Limit matches the recursive engine
+# + Blocks of guesses split into small chunks
+# + Generating a sub-range of the guesses for a parse tree
+# + Generating guesses in batches with iter_guesses()
+#
+class Test_Guess_Generation(unittest.TestCase):
+
+
+    ## Set up the grammar
+    #
+    def setUp(self):
+        self.pcfg = create_test_grammar()
+
+
+    ## Test a parse tree with only one transition
+    #
+    def test_single_transition(self):
+
+        num_guesses, guesses = generate(self.pcfg, [('D2',0)])
+
+        assert num_guesses == 3
+        assert guesses == ['12', '99', '00']
+
+
+    ## Test capitalization masks in the middle and end of a guess
+    #
+    def test_capitalization_masks(self):
+
+        num_guesses, guesses = generate(self.pcfg, [('D2',1),('A3',1),('C3',1),('O1',0)])
+
+        assert num_guesses == 2
+        assert guesses == ['01Pig!', '01PIG!']
+
+        num_guesses, guesses = generate(self.pcfg, [('A3',0),('C3',2)])
+
+        assert guesses == ['caT', 'doG']
+
+        # Mask that isn't directly after the alpha string it applies to
+        for pt in [[('A3',1),('O1',0),('C3',1)], [('A3',1),('O1',0),('C3',1),('D2',1)]]:
+            assert generate(self.pcfg, pt) == generate(self.pcfg, pt, recursive=True)
+
+
+    ## Test precompiled capitalization masks
+    #
+    def test_precompiled_masks(self):
+
+        masks = [{'values':['LLLLL','ULLLL','UUUUU','LULLU','ULULU','LLLUU'], 'prob':1.0}]
+        compile_capitalization_masks(masks)
+
+        assert masks[0]['plans'][0] == ()
+        assert masks[0]['plans'][3] == ((1,2),(4,5))
+
+        for mask, plan in zip(masks[0]['values'], masks[0]['plans']):
+            mask_function = create_mask_function(plan)
+            if mask_function is None:
+                assert mask == 'LLLLL'
+                continue
+
+            assert mask_function('horse') == apply_mask('horse', mask)
+
+
+    ## Test the output order of every pre-terminal in the test grammar
+    #
+    def test_matches_recursive_engine(self):
+
+        for base in self.pcfg.base:
+            pts = [[]]
+            for replacement in base['replacements']:
+                pts = [pt + [(replacement, index)]
+                    for pt in pts
+                    for index in range(len(self.pcfg.grammar[replacement]))]
+
+            for pt in pts:
+                assert generate(self.pcfg, pt) == generate(self.pcfg, pt, recursive=True)
+
+
+    ## Test the limit is applied the same way as the recursive engine
+    #
+    def test_limit(self):
+
+        pt = [('A3',0),('C3',1),('O1',1),('A3',2),('C3',1)]
+
+        num_guesses, guesses = generate(self.pcfg, pt)
+        assert num_guesses == 32
+
+        for limit in [1, 2, 3, 5, 8, 31, 32, 100]:
+            num_guesses, guesses = generate(self.pcfg, pt, limit=limit)
+            assert num_guesses == min(limit, 32)
+            assert (num_guesses, guesses) == generate(self.pcfg, pt, limit=limit, recursive=True)
+
+
+    ## Test generating the last two positions in chunks smaller than them
+    #
+    # Small block sizes also mean the capitalized words are created as they
+    # are needed vs. up front
+    #
+    def test_small_blocks(self):
+
+        pts = [
+            [('A3',0),('C3',1),('D2',0)],
+            [('D2',0),('A3',0),('C3',1)],
+            [('O1',1),('A3',2),('C3',1),('D2',0)],
+            [('A3',0),('C3',1)],
+        ]
+
+        for block_size in [1, 3, 4]:
+            with unittest.mock.patch('lib_guesser.pcfg_grammar.BLOCK_SIZE', block_size):
+                self.pcfg.slot_cache = None
+                for pt in pts:
+                    num_guesses, guesses = generate(self.pcfg, pt, recursive=True)
+
+                    for limit in [None, 1, 3, 4, 5, 12]:
+                        assert generate(self.pcfg, pt, limit=limit) == generate(self.pcfg, pt, limit=limit, recursive=True)
+
+                    for start in range(num_guesses + 1):
+                        assert generate(self.pcfg, pt, limit=3, start=start)[1] == guesses[start:start + 3]
+
+
+    ## Test generating sub-ranges of guesses by starting at an index
+    #
+    def test_start_index(self):
+
+        for pt in [[('D2',0)], [('A3',0),('C3',1),('O1',1)], [('D2',0),('A3',0),('C3',1),('O1',1)]]:
+            num_guesses, guesses = generate(self.pcfg, pt)
+            assert num_guesses == self.pcfg.count_guesses(pt)
+
+            for start in range(num_guesses + 1):
+                for limit in [None, 1, 2, 5]:
+                    expected = guesses[start:]
+                    if limit:
+                        expected = expected[:limit]
+
+                    assert generate(self.pcfg, pt, limit=limit, start=start) == (len(expected), expected)
+
+
+    ## Test iter_guesses() returns the same guesses in batches
+    #
+    def test_iter_guesses(self):
+
+        pt = [('D2',0),('A3',0),('C3',1),('O1',1)]
+        num_guesses, guesses = generate(self.pcfg, pt)
+        output = self.pcfg.output
+
+        for batch_size in [1, 4, num_guesses, num_guesses + 1]:
+            batches = list(self.pcfg.iter_guesses(pt, batch_size))
+            assert [guess for batch in batches for guess in batch] == guesses
+            assert all(0 < len(batch) <= batch_size for batch in batches)
+
+        assert list(self.pcfg.iter_guesses(pt, 4, limit = 5, start = 3)) == [guesses[3:7], guesses[7:8]]
+
+        encoded = b''.join(self.pcfg.iter_guesses(pt, 5, encoded = True))
+        assert encoded == ('\n'.join(guesses) + '\n').encode('utf-8')
+
+        # The grammar's output isn't changed
+        assert self.pcfg.output is output
+        assert output.guesses == guesses
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+
+#######################################################
+# Unit tests for writing guesses out
+#
+#######################################################
+
+
+import unittest
+import unittest.mock
+import os
+import tempfile
+
+
+## Functions and classes to tests
+#
+from ..guess_output import FileOutput, create_output
+
+
+## Responsible for testing the buffered guess output
+#
+# Note:
+# + = positive test, (valid input handling)
+# - = stress test, (invalid input handling)
+#
+# ==Current Tests==
+# + Guesses are buffered until the batch size is reached
+# + Guesses are written out in the ruleset's encoding
+# - Un-encodable guesses are skipped
+# - The consumer stops accepting guesses
+#
+class Test_Guess_Output(unittest.TestCase):
+
+
+    ## Create a temp directory to write the output to
+    #
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.temp_dir.name, "guesses.txt")
+
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+
+    ## Test guesses are only written out once the batch size is reached
+    #
+    def test_batching(self):
+
+        output = create_output(self.filename, 'utf-8', batch_size = 3)
+        output.write('cat')
+        output.write_batch(['dog'])
+
+        with open(self.filename, 'rb') as file:
+            assert file.read() == b''
+
+        output.write('pig')
+
+        with open(self.filename, 'rb') as file:
+            assert file.read() == b'cat\ndog\npig\n'
+
+        output.write('cow')
+        output.close()
+
+        with open(self.filename, 'rb') as file:
+            assert file.read() == b'cat\ndog\npig\ncow\n'
+
+
+    ## Test guesses are encoded using the ruleset's encoding
+    #
+    def test_encoding(self):
+
+        output = create_output(self.filename, 'koi8-r')
+        output.write_batch(['пароль', 'password'])
+        output.close()
+
+        with open(self.filename, 'rb') as file:
+            assert file.read() == 'пароль\npassword\n'.encode('koi8-r')
+
+
+    ## Test guesses that can't be encoded are skipped
+    #
+    def test_unencodable_guess(self):
+
+        output = create_output(self.filename, 'ascii')
+        output.write_batch(['cat', 'пароль', 'dog'])
+        output.close()
+
+        with open(self.filename, 'rb') as file:
+            assert file.read() == b'cat\ndog\n'
+
+
+    ## Test OSError is raised when the consumer stops accepting guesses
+    #
+    def test_consumer_stopped(self):
+
+        output = FileOutput(self.filename, 'utf-8', batch_size = 2)
+        output.file = unittest.mock.Mock()
+        output.file.write.side_effect = BrokenPipeError
+
+        output.write('cat')
+        with unittest.mock.patch('sys.stderr'):
+            with self.assertRaises(OSError):
+                output.write('dog')
+
+        # Shouldn't try to write to the consumer again
+        output.write('pig')
+        with self.assertRaises(OSError):
+            output.write('cow')
+
+        assert output.file.write.call_count == 1
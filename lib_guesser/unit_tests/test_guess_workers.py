@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+
+#######################################################
+# Unit tests for generating guesses with worker processes
+#
+#######################################################
+
+
+import unittest
+import configparser
+
+
+## Functions and classes to tests
+#
+from ..guess_workers import GuessWorkerPool
+from ..guess_output import MemoryOutput
+from ..priority_queue import PcfgQueue
+from ..omen.indexed_cracker import IndexedMarkovCracker, compile_grammar
+from ..omen.partitioned_cracker import PartitionedMarkovCracker
+from ..omen.optimizer import Optimizer
+from .grammar_helper import create_test_grammar
+from .test_omen_cracker import create_omen_grammar, all_guesses
+
+
+## The parse trees to generate guesses for
+#
+PARSE_TREES = [
+    [('D2',0)],
+    [('A3',0),('C3',1),('O1',1)],
+    [('D2',0),('A3',0),('C3',1),('O1',1)],
+    [('O1',0),('D2',1)],
+]
+
+
+## Generates the guesses for all the parse trees in this process
+#
+def generate(pcfg, limit=None):
+
+    pcfg.output = MemoryOutput(pcfg.encoding)
+    for pt in PARSE_TREES:
+        num_guesses = pcfg.create_guesses(pt, limit = limit)
+        if limit:
+            limit -= num_guesses
+            if limit <= 0:
+                break
+
+    return pcfg.output.getvalue()
+
+
+## Generates the guesses for all the parse trees using worker processes
+#
+# Optionally saves the (num_guesses, coverage) reported as guesses are written
+#
+def generate_with_workers(pcfg, strict_order, limit=None, written=None):
+
+    def written_callback(num_guesses, coverage):
+        if written is not None:
+            written.append((num_guesses, coverage))
+
+    pcfg.output = MemoryOutput(pcfg.encoding)
+    pool = GuessWorkerPool(pcfg, 2, strict_order, chunk_size = 5, written_callback = written_callback)
+    try:
+        for pt in PARSE_TREES:
+            num_guesses = pool.submit(pt, limit, prob = 0.5)
+            if limit:
+                limit -= num_guesses
+                if limit <= 0:
+                    break
+
+        pool.drain()
+
+    finally:
+        pool.close()
+
+    return pcfg.output.getvalue()
+
+
+## Responsible for testing the worker pool
+#
+# Note:
+# + = positive test, (valid input handling)
+# - = stress test, (invalid input handling)
+#
+# ==Current Tests==
+# + Strict order gives the same guesses as a single process
+# + Relaxed order gives the same set of guesses
+# + Limits are applied across parse trees
+# + Guesses are reported once they have been written
+# + OMEN partitions give the same guesses as a single process
+# + A sub-range of a parse tree can be generated
+# + Restoring a session with the workers gives the same queue
+#
+class Test_Guess_Workers(unittest.TestCase):
+
+
+    ## Create the grammar to generate guesses from
+    #
+    def setUp(self):
+        self.pcfg = create_test_grammar()
+
+
+    ## Test strict order gives the exact same output as a single process
+    #
+    def test_strict_order(self):
+
+        expected = generate(self.pcfg)
+        assert generate_with_workers(self.pcfg, True) == expected
+
+
+    ## Test relaxed order gives the same guesses, possibly in a different order
+    #
+    def test_relaxed_order(self):
+
+        expected = generate(self.pcfg).split(b'\n')
+        found = generate_with_workers(self.pcfg, False).split(b'\n')
+        assert sorted(found) == sorted(expected)
+
+
+    ## Test the limit stops guess generation across parse trees
+    #
+    def test_limit(self):
+
+        expected = generate(self.pcfg, limit = 23)
+        assert expected.count(b'\n') == 23
+        assert generate_with_workers(self.pcfg, True, limit = 23) == expected
+
+
+    ## Test the guesses written are reported back
+    #
+    def test_written_callback(self):
+
+        written = []
+        output = generate_with_workers(self.pcfg, True, limit = 23, written = written)
+
+        assert sum(num_guesses for num_guesses, coverage in written) == output.count(b'\n') == 23
+        assert sum(coverage for num_guesses, coverage in written) == 0.5 * 23
+
+
+    ## Test handing the partitions of an OMEN level out to the workers
+    #
+    def test_omen_partitions(self):
+
+        level = 6
+        self.pcfg.omen_grammar = compile_grammar(create_omen_grammar())
+        self.pcfg.omen_optimizer = Optimizer(max_length = 4)
+
+        expected = all_guesses(IndexedMarkovCracker(self.pcfg.omen_grammar, level, Optimizer(max_length = 4)))
+
+        for strict_order, limit in [(True, None), (False, None), (True, 57)]:
+            self.pcfg.output = MemoryOutput(self.pcfg.encoding)
+            pool = GuessWorkerPool(self.pcfg, 2, strict_order, chunk_size = 5)
+            try:
+                # Small partitions so there are plenty to hand out
+                markov_cracker = PartitionedMarkovCracker(
+                    self.pcfg.omen_grammar,
+                    level,
+                    self.pcfg.omen_optimizer,
+                    partition_size = 2
+                    )
+                assert markov_cracker.num_partitions() > 2
+
+                num_guesses = pool.submit_omen(markov_cracker, limit)
+
+            finally:
+                pool.close()
+
+            found = self.pcfg.output.getvalue().decode('utf-8').split('\n')[:-1]
+            assert num_guesses == len(found)
+
+            if limit:
+                assert found == expected[:limit]
+            elif strict_order:
+                assert found == expected
+            else:
+                assert sorted(found) == sorted(expected)
+
+
+    ## Test generating a sub-range of the guesses for a parse tree
+    #
+    def test_start(self):
+
+        pt = PARSE_TREES[2]
+        self.pcfg.output = MemoryOutput(self.pcfg.encoding)
+        self.pcfg.create_guesses(pt, limit = 7, start = 4)
+        expected = self.pcfg.output.getvalue()
+
+        self.pcfg.output = MemoryOutput(self.pcfg.encoding)
+        pool = GuessWorkerPool(self.pcfg, 2, True, chunk_size = 5)
+        try:
+            assert pool.submit(pt, 7, start = 4) == 7
+            pool.drain()
+        finally:
+            pool.close()
+
+        assert self.pcfg.output.getvalue() == expected
+        assert expected.count(b'\n') == 7
+
+
+    ## Test restoring a session with the workers gives the same queue as
+    # restoring it in a single process
+    #
+    def test_restore(self):
+
+        for num_popped in [1, 5, 20]:
+            pqueue = PcfgQueue(self.pcfg)
+            for _ in range(num_popped):
+                pqueue.next()
+
+            save_config = configparser.ConfigParser()
+            save_config.add_section('guessing_info')
+            pqueue.update_save_config(save_config)
+
+            expected = PcfgQueue(self.pcfg, save_config).p_queue
+
+            # The workers are started before the queue is set up
+            pcfg = create_test_grammar()
+            pool = GuessWorkerPool(pcfg, 2, True)
+            try:
+                found = PcfgQueue(pcfg, save_config, worker_pool = pool).p_queue
+            finally:
+                pool.close()
+
+            assert [(prob, node.base_id, node.indices) for prob, node in found] == \
+                [(prob, node.base_id, node.indices) for prob, node in expected]
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+
+#######################################################
+# Unit tests for checking guesses against password hashes
+#
+#######################################################
+
+
+import unittest
+import os
+import hashlib
+import tempfile
+
+
+## Functions and classes to tests
+#
+from ..hash_output import HashOutput, load_hashes, create_hash_function, _md4
+from ..guess_output import MemoryOutput
+from ..guess_workers import GuessWorkerPool
+from .grammar_helper import create_test_grammar
+
+
+## Responsible for testing the hash verification output
+#
+# Note:
+# + = positive test, (valid input handling)
+# - = stress test, (invalid input handling)
+#
+# ==Current Tests==
+# + MD4 and NTLM match known digests
+# + Loading hashes with extra fields
+# - Loading lines without a valid hash
+# + Only guesses that crack a hash are written out, once
+# + Stops once every hash is cracked
+# + Worker processes only send back cracked guesses
+#
+class Test_Hash_Output(unittest.TestCase):
+
+
+    ## Set up the grammar
+    #
+    def setUp(self):
+        self.pcfg = create_test_grammar()
+
+
+    ## Test the hash functions against known digests
+    #
+    def test_hash_functions(self):
+
+        # From RFC 1320
+        assert _md4(b'').hex() == '31d6cfe0d16ae931b73c59d7e0c089c0'
+        assert _md4(b'abc').hex() == 'a448017aaf21d8525fc10ae87aa6729d'
+        assert _md4(b'1234567890' * 8).hex() == 'e33b4ddc9c38f2199c3e7b164fcc0536'
+
+        assert create_hash_function('ntlm', 'utf-8')(b'password').hex() == '8846f7eaee8fb117ad06bdd830b7586c'
+        assert create_hash_function('sha1', 'utf-8')(b'abc') == hashlib.sha1(b'abc').digest()
+
+
+    ## Test loading a hash file
+    #
+    def test_load_hashes(self):
+
+        md5 = hashlib.md5(b'cat').hexdigest()
+        ntlm = create_hash_function('ntlm', 'utf-8')(b'dog').hex()
+        lm = 'aad3b435b51404eeaad3b435b51404ee'
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "hashes.txt")
+            with open(filename, 'w') as file:
+                file.write(f"{md5.upper()}\n\nuser:{md5}\nnot a hash\n{md5[:-2]}zz\n")
+                file.write(f"admin:500:{lm}:{ntlm}:::\n")
+
+            assert load_hashes(filename, 'md5') == {bytes.fromhex(md5), bytes.fromhex(ntlm)}
+
+            # The NT hash is used vs. the LM hash in pwdump format
+            assert bytes.fromhex(ntlm) in load_hashes(filename, 'ntlm')
+            assert load_hashes(filename, 'sha1') == set()
+
+
+    ## Test guesses are checked against the hashes
+    #
+    def test_cracking(self):
+
+        targets = {hashlib.md5(guess).digest() for guess in [b'12', b'00', b'notfound']}
+        output = HashOutput(MemoryOutput('utf-8'), targets, 'md5', batch_size = 2)
+        self.pcfg.output = output
+
+        self.pcfg.create_guesses([('D2',0)])
+        self.pcfg.create_guesses([('D2',0)])
+        output.flush()
+
+        found = output.output.getvalue().decode('utf-8').split('\n')[:-1]
+        assert found == [hashlib.md5(b'12').hexdigest() + ':12', hashlib.md5(b'00').hexdigest() + ':00']
+        assert output.num_cracked == 2
+        assert targets == {hashlib.md5(b'notfound').digest()}
+
+
+    ## Test the session stops once everything is cracked
+    #
+    def test_all_cracked(self):
+
+        targets = {hashlib.sha256(b'99').digest()}
+        output = HashOutput(MemoryOutput('utf-8'), targets, 'sha256')
+
+        output.write_batch(['12', '99', '00'])
+        with self.assertRaises(OSError):
+            output.flush()
+
+        with self.assertRaises(OSError):
+            output.write('01')
+            output.flush()
+
+        assert output.output.getvalue() == (hashlib.sha256(b'99').hexdigest() + ':99\n').encode('utf-8')
+
+
+    ## Test the workers only send back the guesses that crack a hash
+    #
+    def test_workers(self):
+
+        pt = [('A3',0),('C3',1),('O1',1)]
+        targets = {create_hash_function('ntlm', 'utf-8')(guess) for guess in [b'CAT#', b'DOG$']}
+        output = HashOutput(MemoryOutput('utf-8'), targets, 'ntlm')
+        self.pcfg.output = output
+
+        pool = GuessWorkerPool(self.pcfg, 2, True, chunk_size = 1)
+        try:
+            assert pool.submit(pt, None, 0.5) == 8
+
+            # Every hash is cracked
+            with self.assertRaises(OSError):
+                pool.drain()
+        finally:
+            pool.close()
+
+        found = [line.split(':')[1] for line in output.output.getvalue().decode('utf-8').split('\n')[:-1]]
+        assert found == ['CAT#', 'DOG$']
+        assert not targets
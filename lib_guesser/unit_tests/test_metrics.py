@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+
+#######################################################
+# Unit tests for exporting the metrics of a cracking session
+#
+#######################################################
+
+
+import unittest
+import os
+import json
+import tempfile
+import urllib.request
+
+
+## Functions and classes to tests
+#
+from ..cracking_session import CrackingSession
+from ..priority_queue import PcfgQueue
+from ..guess_output import MemoryOutput
+from ..omen.optimizer import Optimizer
+from ..metrics import MetricsExporter, METRICS
+from .grammar_helper import create_test_grammar
+
+
+## Responsible for testing the metrics export
+#
+# Note:
+# + = positive test, (valid input handling)
+# - = stress test, (invalid input handling)
+#
+# ==Current Tests==
+# + The counters are updated as parse trees are popped and guesses written
+# + The metrics are written to a file as JSON lines
+# + The metrics are served in the Prometheus text format
+#
+class Test_Metrics(unittest.TestCase):
+
+
+    ## Create a session that has popped a few parse trees
+    #
+    def setUp(self):
+        self.pcfg = create_test_grammar()
+        self.pcfg.omen_optimizer = Optimizer(max_length = 4)
+        self.pcfg.output = MemoryOutput('utf-8')
+
+        self.session = CrackingSession(self.pcfg, None, None)
+        self.session.pqueue = PcfgQueue(self.pcfg)
+
+        for _ in range(6):
+            pt_item = self.session.pqueue.next()
+            self.session._create_guesses(pt_item, None)
+        self.pcfg.output.flush()
+
+
+    ## Test the counters kept by the queue, grammar, and output
+    #
+    def test_counters(self):
+
+        pqueue = self.session.pqueue
+        assert pqueue.num_popped == 6
+        assert self.pcfg.num_children + len(self.pcfg.base) == len(pqueue.p_queue) + 6
+
+        # The test grammar has some children with more than one parent
+        assert self.pcfg.num_rejected_children > 0
+
+        output = self.pcfg.output
+        assert output.bytes_written == len(output.getvalue())
+        assert output.bytes_written > 0
+        assert output.stall_time >= 0
+
+
+    ## Test writing the metrics to a file
+    #
+    def test_file(self):
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = os.path.join(temp_dir, "metrics.jsonl")
+            metrics = MetricsExporter(filename, interval = 60)
+            metrics.start(self.session)
+            metrics.write_line()
+            metrics.stop()
+
+            with open(filename) as file:
+                lines = [json.loads(line) for line in file]
+
+        # One line was written above, and a final one when stopped
+        assert len(lines) == 2
+        for name, _, _ in METRICS:
+            assert name in lines[0], name
+
+        assert lines[1]['guesses'] == self.session.report.num_guesses
+        assert lines[1]['queue_popped'] == 6
+        assert lines[1]['queue_size'] == len(self.session.pqueue.p_queue)
+        assert lines[0]['guesses_per_second'] > 0
+        assert lines[1]['guesses_per_second'] == 0
+
+
+    ## Test serving the metrics in the Prometheus text format
+    #
+    def test_prometheus(self):
+
+        metrics = MetricsExporter(port = 0)
+        try:
+            metrics.start(self.session)
+            with urllib.request.urlopen(f"http://127.0.0.1:{metrics.port}/metrics") as response:
+                text = response.read().decode('utf-8')
+        finally:
+            metrics.stop()
+
+        values = {}
+        for line in text.splitlines():
+            if not line.startswith('#'):
+                name, value = line.split(' ')
+                values[name] = float(value)
+
+        assert len(values) == len(METRICS)
+        assert values['pcfg_guesser_guesses_total'] == self.session.report.num_guesses
+        assert values['pcfg_guesser_queue_popped_total'] == 6
+        assert "# TYPE pcfg_guesser_queue_size gauge" in text
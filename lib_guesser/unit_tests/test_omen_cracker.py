@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+
+#######################################################
+# Unit tests for the OMEN guess generation engines
+#
+#######################################################
+
+
+import unittest
+import os
+import random
+import tempfile
+
+
+## Functions and classes to tests
+#
+from ..omen.markov_cracker import MarkovCracker
+from ..omen.indexed_cracker import IndexedMarkovCracker, compile_grammar
+from ..omen.partitioned_cracker import PartitionedMarkovCracker
+from ..omen.optimizer import Optimizer
+from ..omen.keyspace import Keyspace
+
+
+## Creates a small random OMEN grammar
+#
+# Uses a fixed seed so the tests are repeatable
+#
+def create_omen_grammar(seed = 1234):
+
+    rng = random.Random(seed)
+    alphabet = 'abcd'
+    max_level = 10
+
+    grammar = {
+        'alphabet_encoding': 'utf-8',
+        'ngram': 3,
+        'max_level': max_level,
+        'alphabet': list(alphabet),
+        'ip': {level: [] for level in range(max_level + 1)},
+        'ln': {level: [] for level in range(max_level + 1)},
+        'cp': {},
+    }
+
+    for first in alphabet:
+        for second in alphabet:
+            context = first + second
+            grammar['ip'][rng.randint(0, 4)].append(context)
+
+            # Leave a few contexts out so some transitions lead nowhere
+            if rng.random() < 0.1:
+                continue
+
+            grammar['cp'][context] = {}
+            for char in alphabet:
+                level = rng.randint(0, 5)
+                grammar['cp'][context].setdefault(level, []).append(char)
+
+    for length in range(1, 6):
+        grammar['ln'][rng.randint(0, 3)].append(length)
+
+    return grammar
+
+
+## Returns all the guesses for a level one at a time
+#
+def all_guesses(cracker):
+    guesses = []
+    guess = cracker.next_guess()
+    while guess is not None:
+        guesses.append(guess)
+        guess = cracker.next_guess()
+    return guesses
+
+
+## Responsible for testing the OMEN guess generation engines
+#
+# Note:
+# + = positive test, (valid input handling)
+# - = stress test, (invalid input handling)
+#
+# ==Current Tests==
+# + The indexed engine creates the same guesses as the original engine
+# + Sessions saved by one engine can be restored by the other
+# + Splitting a level into partitions gives the same guesses
+# + Partially finished partitions can be saved and restored
+# + Seeking to a guess number gives the rest of the guesses for the level
+# - Seeking past the end of a level leaves no guesses
+#
+class Test_Omen_Cracker(unittest.TestCase):
+
+
+    def setUp(self):
+        self.grammar = create_omen_grammar()
+        self.compiled = compile_grammar(self.grammar)
+
+
+    ## Test both engines create the same guesses in the same order
+    #
+    def test_same_guesses(self):
+
+        for level in range(1, 12):
+            expected = all_guesses(MarkovCracker(self.grammar, level, Optimizer(max_length = 4)))
+
+            # Use a block size that doesn't line up with anything
+            cracker = IndexedMarkovCracker(self.compiled, level, Optimizer(max_length = 4))
+            guesses = []
+            block = cracker.next_guesses(7)
+            while block is not None:
+                assert 0 < len(block) <= 7
+                guesses.extend(block)
+                block = cracker.next_guesses(7)
+
+            assert guesses == expected, level
+
+        # At least a few of the levels need guesses for this to test anything
+        assert len(all_guesses(MarkovCracker(self.grammar, 6, Optimizer(max_length = 4)))) > 100
+
+
+    ## Test saving a session in the middle of a level
+    #
+    def test_save_and_load(self):
+
+        level = 6
+        expected = all_guesses(MarkovCracker(self.grammar, level, Optimizer(max_length = 4)))
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            save_file = os.path.join(temp_dir, "session.omn")
+
+            for split in [1, 5, 50, len(expected) - 1, len(expected)]:
+
+                # Save from the indexed engine and restore in the original
+                cracker = IndexedMarkovCracker(self.compiled, level, Optimizer(max_length = 4))
+                guesses = []
+                while len(guesses) < split:
+                    guesses.extend(cracker.next_guesses(split - len(guesses)))
+                cracker.save_session(save_file)
+
+                restored = MarkovCracker(self.grammar, 1, Optimizer(max_length = 4))
+                restored.load_session(save_file, {'pt': [['M', 0, 0]]})
+                assert guesses + all_guesses(restored) == expected, split
+
+                # And the other way around
+                cracker = MarkovCracker(self.grammar, level, Optimizer(max_length = 4))
+                guesses = [cracker.next_guess() for _ in range(split)]
+                cracker.save_session(save_file)
+
+                restored = IndexedMarkovCracker(self.compiled, 1, Optimizer(max_length = 4))
+                restored.load_session(save_file, {'pt': [['M', 0, 0]]})
+                assert guesses + all_guesses(restored) == expected, split
+
+
+    ## Test creating the guesses for a level one partition at a time
+    #
+    def test_partitions(self):
+
+        for level in range(1, 12):
+            expected = all_guesses(MarkovCracker(self.grammar, level, Optimizer(max_length = 4)))
+
+            for partition_size in [1, 3, 64]:
+                cracker = PartitionedMarkovCracker(self.compiled, level, Optimizer(max_length = 4), partition_size)
+                guesses = []
+                for partition in range(cracker.num_partitions()):
+                    while not cracker.is_done(partition):
+                        guesses.extend(cracker.next_guesses(partition, 7))
+
+                assert guesses == expected, (level, partition_size)
+
+
+    ## Test saving a session with several partitions part way done
+    #
+    def test_partition_save_and_load(self):
+
+        level = 6
+        expected = all_guesses(MarkovCracker(self.grammar, level, Optimizer(max_length = 4)))
+
+        cracker = PartitionedMarkovCracker(self.compiled, level, Optimizer(max_length = 4), partition_size = 2)
+        num_partitions = cracker.num_partitions()
+        assert num_partitions > 2
+
+        # Work on every partition a little, out of order
+        done = [[] for _ in range(num_partitions)]
+        for partition in reversed(range(num_partitions)):
+            done[partition].extend(cracker.next_guesses(partition, 3))
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            save_file = os.path.join(temp_dir, "session.omp")
+            cracker.save_session(save_file)
+
+            pt_item = {'pt': [['M', 0, 0]]}
+            restored = PartitionedMarkovCracker(self.compiled, 1, Optimizer(max_length = 4))
+            restored.load_session(save_file, pt_item)
+
+        assert pt_item['pt'][0][1] == level - 1
+        assert restored.num_partitions() == num_partitions
+
+        guesses = []
+        for partition in range(num_partitions):
+            guesses.extend(done[partition])
+            while not restored.is_done(partition):
+                guesses.extend(restored.next_guesses(partition, 5))
+
+        assert guesses == expected
+
+
+    ## Test jumping to every guess number of a level
+    #
+    def test_seek(self):
+
+        for level in [1, 4, 6]:
+            expected = all_guesses(MarkovCracker(self.grammar, level, Optimizer(max_length = 4)))
+
+            for grammar, cracker_class in [(self.grammar, MarkovCracker), (self.compiled, IndexedMarkovCracker)]:
+                keyspace = Keyspace(grammar)
+                for guess_num in range(len(expected) + 1):
+                    cracker = cracker_class(grammar, level, Optimizer(max_length = 4), keyspace)
+                    assert cracker.seek(guess_num)
+                    assert all_guesses(cracker) == expected[guess_num:], (level, guess_num)
+
+
+    ## Test seeking past the end of a level
+    #
+    def test_seek_past_end(self):
+
+        level = 6
+        num_guesses = len(all_guesses(MarkovCracker(self.grammar, level, Optimizer(max_length = 4))))
+
+        cracker = IndexedMarkovCracker(self.compiled, level, Optimizer(max_length = 4))
+        assert not cracker.seek(num_guesses + 1)
+        assert cracker.next_guesses() is None
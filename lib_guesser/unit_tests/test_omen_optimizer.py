@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+
+#######################################################
+# Unit tests for the OMEN TMTO optimizer
+#
+#######################################################
+
+
+import unittest
+
+
+## Functions and classes to tests
+#
+from ..omen.optimizer import Optimizer
+
+
+## Responsible for testing the OMEN optimizer
+#
+# Note:
+# + = positive test, (valid input handling)
+# - = stress test, (invalid input handling)
+#
+# ==Current Tests==
+# + Results are returned as copies, and hits/misses are counted
+# + The least recently used result is thrown out when the cache is full
+# + Saved results can be loaded into a new optimizer
+# - Loaded results that don't fit the new optimizer are skipped
+#
+class Test_Omen_Optimizer(unittest.TestCase):
+
+
+    ## Test looking up results
+    #
+    def test_lookup(self):
+
+        optimizer = Optimizer(max_length = 4)
+
+        assert optimizer.lookup('ab', 3, 2) == (False, None)
+
+        parse_tree = [['ab', 1, 0], ['bc', 1, 2]]
+        optimizer.update('ab', 3, 2, parse_tree)
+        optimizer.update('ab', 3, 1, None)
+
+        found, result = optimizer.lookup('ab', 3, 2)
+        assert found
+        assert result == parse_tree
+
+        # Changing the result shouldn't change what is cached
+        result[0][1] = 5
+        assert optimizer.lookup('ab', 3, 2) == (True, parse_tree)
+
+        assert optimizer.lookup('ab', 3, 1) == (True, None)
+        assert optimizer.hits == 3
+        assert optimizer.misses == 1
+
+
+    ## Test the cache doesn't grow past max_size
+    #
+    def test_eviction(self):
+
+        optimizer = Optimizer(max_length = 4, max_size = 2)
+
+        optimizer.update('ab', 2, 1, [['ab', 1, 0]])
+        optimizer.update('cd', 2, 1, [['cd', 1, 0]])
+
+        # Using 'ab' makes 'cd' the least recently used
+        optimizer.lookup('ab', 2, 1)
+        optimizer.update('ef', 2, 1, [['ef', 1, 0]])
+
+        assert len(optimizer.tmto_lookup) == 2
+        assert optimizer.lookup('cd', 2, 1) == (False, None)
+        assert optimizer.lookup('ab', 2, 1)[0]
+        assert optimizer.lookup('ef', 2, 1)[0]
+
+
+    ## Test saving and loading the results
+    #
+    def test_save_and_load(self):
+
+        optimizer = Optimizer(max_length = 4)
+        optimizer.update('ab', 2, 1, [['ab', 1, 0]])
+        optimizer.update('ab', 4, 1, None)
+        optimizer.update('cd', 3, 1, [['cd', 1, 0]])
+        assert optimizer.modified
+
+        state = optimizer.save_state()
+        assert not optimizer.modified
+
+        same = Optimizer(max_length = 4)
+        same.load_state(state)
+        assert same.tmto_lookup == optimizer.tmto_lookup
+        assert not same.modified
+
+        # Only keep the most recent results that fit
+        smaller = Optimizer(max_length = 3, max_size = 1)
+        smaller.load_state(state)
+        assert list(smaller.tmto_lookup.keys()) == [(3, 'cd', 1)]
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+
+#######################################################
+# Unit tests for pruning parse trees with a password
+# policy
+#
+#######################################################
+
+
+import unittest
+import itertools
+import collections
+
+
+## Functions and classes to tests
+#
+from ..password_policy import PasswordPolicy, find_classes, LOWER, UPPER, DIGIT, SPECIAL
+from ..pcfg_grammar import PtNode
+from ..grammar_io import compile_capitalization_masks
+from .grammar_helper import create_test_grammar, GuessCapture
+
+
+## Returns every guess of every parse tree in the grammar
+#
+def all_guesses(pcfg):
+
+    guesses = []
+    for base in pcfg.base:
+        sizes = [range(len(pcfg.grammar[replacement])) for replacement in base['replacements']]
+        for indices in itertools.product(*sizes):
+            pcfg.output = GuessCapture()
+            pcfg.create_guesses(list(zip(base['replacements'], indices)))
+            guesses.extend(pcfg.output.guesses)
+
+    return guesses
+
+
+## Walks every parse tree that is reached from the base structures
+#
+# Returns a dictionary of {pt: (num_generated, guesses)}
+#
+def walk_parse_trees(pcfg):
+
+    results = {}
+    nodes = [node for _, node in pcfg.initalize_base_structures()]
+    while nodes:
+        node = nodes.pop()
+        pt = list(zip(pcfg.base_types[node.base_id], node.indices))
+
+        pcfg.output = GuessCapture()
+        num_generated = pcfg.create_guesses(pt)
+        assert num_generated == pcfg.count_guesses(pt)
+        results[tuple(pt)] = (num_generated, pcfg.output.guesses)
+
+        prob = pcfg._find_prob(node.base_id, node.indices)
+        nodes.extend(child for _, child in pcfg.find_children(node, prob))
+
+    return results
+
+
+## Responsible for testing the password policy
+#
+# Note:
+# + = positive test, (valid input handling)
+# - = stress test, (invalid input handling)
+#
+# ==Current Tests==
+# + Finding the character classes of a string
+# + Checking guesses against the policy
+# - Unknown character classes
+# + Base structures that can't meet the policy are skipped
+# + Capitalization masks are limited to the ones the policy needs
+# + Every guess that meets the policy is still created, and no others
+# + Children that can't meet the policy are skipped
+#
+class Test_Password_Policy(unittest.TestCase):
+
+
+    ## Set up the grammar
+    #
+    def setUp(self):
+        self.pcfg = create_test_grammar()
+
+
+    ## Test finding character classes
+    #
+    def test_find_classes(self):
+
+        assert find_classes('cat') == LOWER
+        assert find_classes('Cat1') == LOWER | UPPER | DIGIT
+        assert find_classes('12!') == DIGIT | SPECIAL
+        assert find_classes('') == 0
+
+
+    ## Test checking guesses
+    #
+    def test_check(self):
+
+        policy = PasswordPolicy(5, 8, ['digit', 'upper'])
+
+        assert policy.check('Cat12')
+        assert not policy.check('cat12')
+        assert not policy.check('Ca12')
+        assert not policy.check('Cat123456')
+        assert policy.filter_guesses(['cat', 'Dog99', 'PIG!', 'Emu1234']) == ['Dog99', 'Emu1234']
+
+        assert PasswordPolicy().check('')
+
+        with self.assertRaises(ValueError):
+            PasswordPolicy(required = ['uppercase'])
+
+
+    ## Test base structures are skipped if they can't meet the policy
+    #
+    def test_base_pruning(self):
+
+        self.pcfg.policy = PasswordPolicy(min_length = 5)
+
+        base_ids = [node.base_id for _, node in self.pcfg.initalize_base_structures()]
+
+        # The D2 base structure can only create 2 character guesses
+        assert base_ids == [0, 1, 3]
+
+        # Ids still line up with the base structures
+        assert len(self.pcfg.base_types) == len(self.pcfg.base)
+
+
+    ## Test only the capitalization masks with an uppercase letter are used
+    #
+    def test_mask_pruning(self):
+
+        self.pcfg.policy = PasswordPolicy(required = ['upper'])
+
+        pt = [('A3',0),('C3',0)]
+        assert self.pcfg.count_guesses(pt) == 0
+        assert self.pcfg.create_guesses(pt) == 0
+
+        pt = [('A3',0),('C3',1)]
+        self.pcfg.output = GuessCapture()
+        assert self.pcfg.create_guesses(pt) == self.pcfg.count_guesses(pt) == 4
+        assert self.pcfg.output.guesses == ['Cat', 'CAT', 'Dog', 'DOG']
+
+
+    ## Test the guesses match the ones from the full grammar that meet the
+    ## policy, for a mix of policies
+    #
+    def test_matches_full_grammar(self):
+
+        full_guesses = all_guesses(self.pcfg)
+
+        policies = [
+            PasswordPolicy(),
+            PasswordPolicy(min_length = 6),
+            PasswordPolicy(max_length = 6),
+            PasswordPolicy(6, 7, ['special']),
+            PasswordPolicy(required = ['upper', 'digit']),
+            PasswordPolicy(9, None, ['upper', 'special']),
+            PasswordPolicy(required = ['lower', 'upper', 'digit', 'special']),
+        ]
+
+        for policy in policies:
+            self.pcfg.policy = policy
+            results = walk_parse_trees(self.pcfg)
+
+            guesses = []
+            for num_generated, pt_guesses in results.values():
+                assert len(pt_guesses) <= num_generated
+                guesses.extend(pt_guesses)
+
+            assert collections.Counter(guesses) == collections.Counter(policy.filter_guesses(full_guesses))
+
+
+    ## Test children are skipped when none of their guesses can meet the
+    ## policy
+    #
+    def test_child_pruning(self):
+
+        # Make the last capitalization mask all uppercase
+        self.pcfg.grammar['C3'][2] = {'values':['UUU'], 'prob':0.0625}
+        compile_capitalization_masks(self.pcfg.grammar['C3'])
+        self.pcfg.base = [{'prob':1.0, 'replacements':['A3','C3']}]
+        self.pcfg.initalize_base_structures()
+
+        node = PtNode(0, (0, 1))
+        prob = self.pcfg._find_prob(node.base_id, node.indices)
+
+        children = [child.indices for _, child in self.pcfg.find_children(node, prob)]
+        assert children == [(1, 1), (0, 2)]
+
+        # Neither (0, 2) or its children can have a lowercase letter
+        self.pcfg.policy = PasswordPolicy(required = ['lower'])
+        assert not self.pcfg.policy.subtree_can_comply(self.pcfg.grammar, ('A3', 'C3'), (0, 2))
+
+        children = [child.indices for _, child in self.pcfg.find_children(node, prob)]
+        assert children == [(1, 1)]
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+
+#######################################################
+# Unit tests for the PCFG priority queue
+#
+#######################################################
+
+
+import unittest
+import configparser
+import sys
+import os
+import tempfile
+import math
+
+
+## Functions and classes to tests
+#
+from ..priority_queue import PcfgQueue
+from .grammar_helper import create_test_grammar
+
+
+## Pops every item off the queue
+#
+# Returns a list of (prob, pt) for each item popped
+#
+def pop_all(pqueue):
+
+    popped = []
+    while True:
+        pt_item = pqueue.next()
+        if pt_item is None:
+            return popped
+
+        popped.append((pt_item['prob'], tuple(pt_item['pt'])))
+
+
+## Responsible for testing the priority queue
+#
+# Note:
+# + = positive test, (valid input handling)
+# - = stress test, (invalid input handling)
+#
+# ==Current Tests==
+# + Items are popped in probability order
+# + Limiting the queue size drops and then regenerates items
+# + Regenerating dropped items doesn't repeat items when probabilities are
+#   one rounding error apart
+# + Restoring a saved session continues where it left off
+# - Restoring a session deeper than Python's recursion limit
+# + Restoring a snapshot continues exactly where it left off
+# - Snapshots that don't match the save config aren't used
+#
+class Test_Priority_Queue(unittest.TestCase):
+
+
+    ## Create the grammar to build the queue from
+    #
+    def setUp(self):
+        self.pcfg = create_test_grammar()
+
+
+    ## Test every pre-terminal is popped once in probability order
+    #
+    def test_probability_order(self):
+
+        popped = pop_all(PcfgQueue(self.pcfg))
+
+        # Every combination of every base structure should be popped
+        expected = 0
+        for base in self.pcfg.base:
+            num = 1
+            for replacement in base['replacements']:
+                num *= len(self.pcfg.grammar[replacement])
+            expected += num
+
+        assert len(popped) == expected
+        assert len(set(popped)) == expected
+        assert [prob for prob, pt in popped] == sorted([prob for prob, pt in popped], reverse=True)
+
+
+    ## Test a small queue gives the same items in the same order as
+    # an unlimited queue
+    #
+    def test_max_queue_size(self):
+
+        expected = pop_all(PcfgQueue(self.pcfg, max_queue_size = 10**6))
+
+        for max_queue_size in [2, 3, 8, 50]:
+            pqueue = PcfgQueue(self.pcfg, max_queue_size = max_queue_size)
+
+            popped = []
+            dropped = False
+            while True:
+                pt_item = pqueue.next()
+                if pt_item is None:
+                    break
+
+                popped.append((pt_item['prob'], tuple(pt_item['pt'])))
+                dropped = dropped or pqueue.lowest_dropped is not None
+
+            # Make sure the queue was actually trimmed
+            assert dropped == (max_queue_size < 50)
+
+            assert [prob for prob, pt in popped] == [prob for prob, pt in expected]
+            assert sorted(popped) == sorted(expected)
+
+
+    ## Test regenerating dropped items when a dropped parent's probability is
+    # the next float below the lowest probability kept in the queue
+    #
+    # (D2 1, O1 1) has a parent with exactly that probability, (D2 0, O1 1),
+    # along with one that was popped. It needs to be created by that parent
+    # when it is popped, and not also by regenerating the dropped items
+    #
+    def test_max_queue_size_rounding(self):
+
+        self.pcfg.grammar['D2'] = [{'values':['12'], 'prob':1.0}, {'values':['01'], 'prob':0.3}]
+        self.pcfg.grammar['O1'] = [{'values':['!'], 'prob':1.0}, {'values':['#'], 'prob':math.nextafter(0.3, 0)}]
+        self.pcfg.grammar['X1'] = [{'values':['x'], 'prob':1.0}]
+
+        self.pcfg.base = [
+            {'prob':1.0, 'replacements':['D2','O1']},
+            {'prob':0.5, 'replacements':['X1']},
+            {'prob':0.02, 'replacements':['X1']},
+            {'prob':0.01, 'replacements':['X1']},
+        ]
+
+        expected = pop_all(PcfgQueue(self.pcfg))
+        assert len(expected) == 7
+
+        pqueue = PcfgQueue(self.pcfg, max_queue_size = 4)
+        popped = pop_all(pqueue)
+
+        assert popped == expected
+
+
+    ## Test restoring a session from the save config
+    #
+    def test_restore_session(self):
+
+        expected = pop_all(PcfgQueue(self.pcfg))
+
+        for num_popped in [1, 5, 20, 40]:
+            pqueue = PcfgQueue(self.pcfg)
+            for _ in range(num_popped):
+                pqueue.next()
+
+            save_config = configparser.ConfigParser()
+            save_config.add_section('guessing_info')
+            pqueue.update_save_config(save_config)
+
+            restored = pop_all(PcfgQueue(self.pcfg, save_config))
+
+            # Everything not popped yet should be restored
+            remaining = expected[num_popped:]
+            assert set(remaining) <= set(restored)
+
+            # Items with the same probability as the last item popped may be
+            # repeated, but nothing else
+            max_probability = expected[num_popped - 1][0]
+            for prob, pt in set(restored) - set(remaining):
+                assert prob == max_probability
+
+
+    ## Test restoring a session where the already popped parse trees are
+    # nested deeper than Python's recursion limit
+    #
+    def test_restore_deep(self):
+
+        num_items = sys.getrecursionlimit() * 2
+        self.pcfg.grammar['X1'] = [
+            {'values':[str(index)], 'prob':0.5 ** (index / 100)} for index in range(num_items)
+        ]
+        self.pcfg.base = [{'prob':1.0, 'replacements':['X1']}]
+
+        pqueue = PcfgQueue(self.pcfg)
+        for _ in range(num_items - 10):
+            pqueue.next()
+
+        save_config = configparser.ConfigParser()
+        save_config.add_section('guessing_info')
+        pqueue.update_save_config(save_config)
+
+        # The last item popped is restored since it has the same probability
+        # as max_probability
+        restored = pop_all(PcfgQueue(self.pcfg, save_config))
+        assert len(restored) == 11
+        assert restored[1:] == pop_all(pqueue)
+
+
+    ## Test restoring a session from a snapshot of the queue
+    #
+    # The last item popped hasn't had its guesses generated yet when the
+    # session is saved, so it should be popped again
+    #
+    def test_snapshot(self):
+
+        expected = pop_all(PcfgQueue(self.pcfg))
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            snapshot_file = os.path.join(temp_dir, "session.pqs")
+
+            for max_queue_size in [8, 50000]:
+                for num_popped in [1, 5, 20, 40]:
+                    pqueue = PcfgQueue(self.pcfg, max_queue_size = max_queue_size)
+                    for _ in range(num_popped - 1):
+                        pqueue.next()
+                    last = pqueue.next()
+
+                    save_config = configparser.ConfigParser()
+                    save_config.add_section('guessing_info')
+                    pqueue.update_save_config(save_config)
+                    save_config.set('guessing_info', 'snapshot_id', '1')
+                    assert pqueue.save_snapshot(snapshot_file, 1)
+
+                    restored = pop_all(PcfgQueue(
+                        self.pcfg,
+                        save_config,
+                        max_queue_size = max_queue_size,
+                        snapshot_file = snapshot_file
+                        ))
+
+                    # Should match continuing the session without saving it
+                    remaining = [(last['prob'], tuple(last['pt']))] + pop_all(pqueue)
+                    assert sorted(restored) == sorted(remaining)
+                    assert [prob for prob, pt in restored] == [prob for prob, pt in remaining]
+
+            # A snapshot from a different save falls back to rebuilding the
+            # queue from the grammar
+            save_config.set('guessing_info', 'snapshot_id', '2')
+            restored = pop_all(PcfgQueue(self.pcfg, save_config, snapshot_file = snapshot_file))
+            assert set(expected[num_popped:]) <= set(restored)
+
+            # As does a missing snapshot
+            os.remove(snapshot_file)
+            restored = pop_all(PcfgQueue(self.pcfg, save_config, snapshot_file = snapshot_file))
+            assert set(expected[num_popped:]) <= set(restored)
@@ -15,6 +15,9 @@ import json
 import codecs
 from collections import Counter
 
+# Local imports
+from lib_guesser.grammar_cache import load_cached
+
 
 def load_grammar(grammar, rule_directory):
     """
@@ -24,6 +27,9 @@ def load_grammar(grammar, rule_directory):
     doesn't load info that we will need for essentially 're-stemming' the
     input words to score
 
+    The loaded values are cached next to the ruleset so they only have to be
+    read in from the text files the first time
+
     Inputs:
         grammar: The pcfg grammar object to save the results in
 
@@ -35,6 +41,46 @@ def load_grammar(grammar, rule_directory):
         False: If an error occured
     """
 
+    values = load_cached(
+        rule_directory,
+        'scorer_grammar',
+        None,
+        lambda: _load_grammar_values(rule_directory)
+        )
+
+    if values is None:
+        return False
+
+    for name, value in values.items():
+        setattr(grammar, name, value)
+
+    return True
+
+
+def _load_grammar_values(rule_directory):
+    """
+    Loads the values for the grammar from the ruleset's text files
+
+    Inputs:
+        rule_directory: The file directory of the rule/grammar
+
+    Returns:
+        values: A dictionary of {attribute name: value} to set on the grammar
+
+        None: If an error occured
+    """
+
+    values = {
+        'count_years': Counter(),
+        'count_context_sensitive': Counter(),
+        'count_base_structures': Counter(),
+        'count_keyboard': {},
+        'count_alpha': {},
+        'count_alpha_masks': {},
+        'count_digits': {},
+        'count_other': {},
+    }
+
     # Read the top level config file for the grammar
     config = configparser.ConfigParser()
 
@@ -42,54 +88,55 @@ def load_grammar(grammar, rule_directory):
         config.read_file(open(os.path.join(rule_directory,"config.ini")))
 
         # Find the encoding for the config file
-        grammar.encoding = config.get('TRAINING_DATASET_DETAILS','encoding')
+        values['encoding'] = config.get('TRAINING_DATASET_DETAILS','encoding')
+        encoding = values['encoding']
 
         # Load the values for the grammar
 
         # Load Years
         filename = os.path.join(rule_directory, 'Years', '1.txt')
-        if not _load_from_file(grammar.count_years, filename, grammar.encoding):
-            return False
+        if not _load_from_file(values['count_years'], filename, encoding):
+            return None
 
         # Load context sensitive replacements
         filename = os.path.join(rule_directory, 'Context', '1.txt')
-        if not _load_from_file(grammar.count_context_sensitive, filename, grammar.encoding):
-            return False
+        if not _load_from_file(values['count_context_sensitive'], filename, encoding):
+            return None
 
         # Load base structures
         filename = os.path.join(rule_directory, 'Grammar', 'grammar.txt')
-        if not _load_from_file(grammar.count_base_structures, filename, grammar.encoding):
-            return False
+        if not _load_from_file(values['count_base_structures'], filename, encoding):
+            return None
 
         # Load keyboard structures
-        if not _load_from_multiple_files(grammar.count_keyboard, config['BASE_K'], rule_directory, grammar.encoding):
-            return False
+        if not _load_from_multiple_files(values['count_keyboard'], config['BASE_K'], rule_directory, encoding):
+            return None
 
         # Load alpha strings
-        if not _load_from_multiple_files(grammar.count_alpha, config['BASE_A'], rule_directory, grammar.encoding):
-            return False
+        if not _load_from_multiple_files(values['count_alpha'], config['BASE_A'], rule_directory, encoding):
+            return None
 
         # Load alpha string masks (aka capitalizatoin masks)
-        if not _load_from_multiple_files(grammar.count_alpha_masks, config['CAPITALIZATION'], rule_directory, grammar.encoding):
-            return False
+        if not _load_from_multiple_files(values['count_alpha_masks'], config['CAPITALIZATION'], rule_directory, encoding):
+            return None
 
         # Load digits
-        if not _load_from_multiple_files(grammar.count_digits, config['BASE_D'], rule_directory, grammar.encoding):
-            return False
+        if not _load_from_multiple_files(values['count_digits'], config['BASE_D'], rule_directory, encoding):
+            return None
 
         # Load "other" structures. E.g. punctuation
-        if not _load_from_multiple_files(grammar.count_other, config['BASE_O'], rule_directory, grammar.encoding):
-            return False
+        if not _load_from_multiple_files(values['count_other'], config['BASE_O'], rule_directory, encoding):
+            return None
 
     except IOError as msg:
         print("Could not open the config file for the ruleset specified. The rule directory may not exist")
         print(f"Ruleset: {rule_directory}")
-        return False
+        return None
     except configparser.Error as msg:
         print(f"Error occured parsing the configuration file: {msg}")
-        return False
+        return None
 
-    return True
+    return values
 
 
 def _load_from_multiple_files(grammar_counter, config, rule_directory, encoding):
@@ -13,6 +13,9 @@ import os
 import sys
 import codecs
 
+# Local imports
+from lib_guesser.grammar_cache import load_cached
+
 
 class OmenScorer:
     """
@@ -105,7 +108,7 @@ class OmenScorer:
 
     def _load_omen(self, base_directory):
         """
-        Loads the OMEN ruleset from disk
+        Loads the OMEN ruleset, using the grammar cache if possible
 
         Note: If an error occurs, it will forward/raise an Exception
 
@@ -116,6 +119,26 @@ class OmenScorer:
             None
         """
 
+        self.ip, self.cp, self.ln, self.ngram = load_cached(
+            base_directory,
+            'omen_scorer',
+            None,
+            lambda: self._load_omen_files(base_directory)
+            )
+
+    def _load_omen_files(self, base_directory):
+        """
+        Loads the OMEN ruleset from disk
+
+        Note: If an error occurs, it will forward/raise an Exception
+
+        Inputs:
+            base_directory: The rule directory the OMEN training will be found
+
+        Returns:
+            (ip, cp, ln, ngram): The loaded OMEN ruleset
+        """
+
         # Note, realized we don't need to parse the config file since
         # the encoding will be the same as the rest of the PCFG grammar
         # and we can figure out the NGRAM length based on the IP/CPs
@@ -234,3 +257,5 @@ class OmenScorer:
         except Exception as msg:
             print(f"Exception: {msg}", file=sys.stderr)
             raise
+
+        return self.ip, self.cp, self.ln, self.ngram
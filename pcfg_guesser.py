@@ -64,7 +64,13 @@ import datetime
 from lib_guesser.banner_info import print_banner
 from lib_guesser.pcfg_grammar import PcfgGrammar
 from lib_guesser.cracking_session import CrackingSession
+from lib_guesser.metrics import MetricsExporter, DEFAULT_METRICS_INTERVAL
+from lib_guesser.hash_output import HashOutput, load_hashes, DIGEST_SIZES
+from lib_guesser.filter_output import DedupOutput, DEFAULT_DEDUP_MEMORY
+from lib_guesser.filter_output import ExcludeOutput, load_exclude_list
 from lib_guesser.honeyword_session import HoneywordSession
+from lib_guesser.password_policy import PasswordPolicy, CHARACTER_CLASSES
+from lib_guesser.coordinator import run_coordinator, run_worker
 
 
 def parse_command_line(program_info):
@@ -131,6 +137,15 @@ def parse_command_line(program_info):
 
     # Advanced options
 
+    parser.add_argument(
+        '--output',
+        '-o',
+        help = 'File or named pipe to write guesses to. Default is stdout',
+        metavar = 'OUTPUT_FILE',
+        required = False,
+        default = program_info['output_file']
+    )
+
     parser.add_argument(
         '--limit',
         '-n',
@@ -139,6 +154,192 @@ def parse_command_line(program_info):
         default=program_info['limit']
     )
 
+    parser.add_argument(
+        '--workers',
+        '-w',
+        help='The number of processes to generate guesses with. Only supported ' +
+            'in the true_prob_order mode. OMEN levels are split up by length and ' +
+            'starting ngram across the processes. Default is ' + str(program_info['workers']),
+        type=int,
+        default=program_info['workers']
+    )
+
+    parser.add_argument(
+        '--relaxed_order',
+        help='When using multiple --workers, write guesses out as soon as they ' +
+            'are generated. Faster, but guesses from parse trees with similar ' +
+            'probabilities may be mixed together',
+        dest='strict_order',
+        action='store_const',
+        const= not program_info['strict_order'],
+        default = program_info['strict_order']
+    )
+
+    parser.add_argument(
+        '--node',
+        help='When splitting a session across multiple machines, which part ' +
+            'of the session to generate guesses for. From 0 to --nodes minus 1. ' +
+            'Default is ' + str(program_info['node']),
+        type=int,
+        default=program_info['node']
+    )
+
+    parser.add_argument(
+        '--nodes',
+        help='The number of machines to split the session across. Every ' +
+            'machine runs the same command with a different --node, and ' +
+            'between them every guess is generated exactly once. Default is ' +
+            str(program_info['nodes']),
+        type=int,
+        default=program_info['nodes']
+    )
+
+    parser.add_argument(
+        '--snapshot',
+        help='Save the contents of the priority queue along with the session. ' +
+            'Restoring the session with --load then reads the queue back in ' +
+            'rather than rebuilding it from the grammar, which is much faster ' +
+            'for long sessions',
+        action='store_true',
+        default=program_info['snapshot']
+    )
+
+    parser.add_argument(
+        '--checkpoint',
+        help='Automatically save the session every N seconds, so it can be ' +
+            'restored with --load if the guesser is killed. 0 disables it. ' +
+            'Default is ' + str(program_info['checkpoint']),
+        type=int,
+        default=program_info['checkpoint']
+    )
+
+    parser.add_argument(
+        '--checkpoint_guesses',
+        help='Automatically save the session every N guesses. Can be used ' +
+            'along with --checkpoint',
+        type=int,
+        default=program_info['checkpoint_guesses']
+    )
+
+    parser.add_argument(
+        '--min_length',
+        help='Only create guesses at least this long. Parse trees that are ' +
+            'too short are skipped without creating their guesses',
+        type=int,
+        default=program_info['min_length']
+    )
+
+    parser.add_argument(
+        '--max_length',
+        help='Only create guesses at most this long',
+        type=int,
+        default=program_info['max_length']
+    )
+
+    parser.add_argument(
+        '--require',
+        help='Comma seperated list of the character classes every guess ' +
+            'needs to have, from: ' + ','.join(CHARACTER_CLASSES) + '. For ' +
+            'example, "digit,upper". Along with --min_length and --max_length, ' +
+            'this is a password policy. When restoring a session the policy ' +
+            'it was started with is used. --serve and --connect need to use ' +
+            'the same policy',
+        metavar='CLASSES',
+        default=program_info['require']
+    )
+
+    parser.add_argument(
+        '--dedup',
+        help='Do not write out guesses that were already created by an ' +
+            'earlier pre-terminal. Uses a Bloom filter, so a small number ' +
+            'of new guesses are dropped as well, (see the status report)',
+        action='store_true',
+        default=program_info['dedup']
+    )
+
+    parser.add_argument(
+        '--dedup_memory',
+        help='The maximum memory to use for --dedup, in MiB. Default is ' +
+            str(program_info['dedup_memory']),
+        metavar='MIB',
+        type=int,
+        default=program_info['dedup_memory']
+    )
+
+    parser.add_argument(
+        '--exclude',
+        help='Do not write out guesses that are in this file. Files ending ' +
+            'in .pot or .potfile are read as potfiles, (hash:plaintext), ' +
+            'so passwords cracked in an earlier session are skipped. ' +
+            'Anything else is read as a wordlist',
+        metavar='FILE',
+        default=program_info['exclude_file']
+    )
+
+    parser.add_argument(
+        '--hashes',
+        help='Check guesses against the hashes in this file, (one hex ' +
+            'encoded hash per line), instead of writing every guess out. ' +
+            'Only guesses that crack a hash are written, as hash:plaintext. ' +
+            'Stops once every hash is cracked',
+        metavar='FILE',
+        default=program_info['hash_file']
+    )
+
+    parser.add_argument(
+        '--hash_type',
+        '--hash-type',
+        help="The type of the --hashes. Default is '" + program_info['hash_type'] + "'",
+        dest='hash_type',
+        default=program_info['hash_type'],
+        choices=sorted(DIGEST_SIZES)
+    )
+
+    parser.add_argument(
+        '--metrics',
+        help='Append the counters of the session, (guesses, parse trees, ' +
+            'queue size, time spent waiting on the output, etc), to this file ' +
+            'as a JSON line every --metrics_interval seconds',
+        metavar='FILE',
+        default=program_info['metrics_file']
+    )
+
+    parser.add_argument(
+        '--metrics_port',
+        help='Serve the counters of the session in the Prometheus text format ' +
+            'at http://127.0.0.1:PORT/metrics',
+        metavar='PORT',
+        type=int,
+        default=program_info['metrics_port']
+    )
+
+    parser.add_argument(
+        '--metrics_interval',
+        help='The number of seconds between lines written to the --metrics ' +
+            'file. Default is ' + str(program_info['metrics_interval']),
+        type=float,
+        default=program_info['metrics_interval']
+    )
+
+    parser.add_argument(
+        '--serve',
+        help='Run as a coordinator that hands out work to other guessers ' +
+            'started with --connect. Does not generate any guesses itself. ' +
+            'ADDRESS is either HOST:PORT or the path of a Unix socket',
+        metavar='ADDRESS',
+        default=program_info['serve']
+    )
+
+    parser.add_argument(
+        '--connect',
+        help='Run as a worker that generates guesses for the work handed out ' +
+            'by a coordinator started with --serve. Must use the same ruleset ' +
+            'and options as the coordinator. ADDRESS is either HOST:PORT or ' +
+            'the path of a Unix socket',
+        metavar='ADDRESS',
+        default=program_info['connect']
+    )
+
     parser.add_argument(
         '--skip_brute',
         help='Do not perform Markov based guesses using OMEN. This is useful ' +
@@ -158,6 +359,23 @@ def parse_command_line(program_info):
         default = program_info['skip_case']
     )
 
+    parser.add_argument(
+        '--omen_optimizer_length',
+        help='The maximum length of OMEN strings to cache results for. Higher ' +
+            'values use more memory. Default is ' + str(program_info['omen_optimizer_length']),
+        type=int,
+        default=program_info['omen_optimizer_length']
+    )
+
+    parser.add_argument(
+        '--omen_optimizer_size',
+        help='The maximum number of results the OMEN optimizer caches. Results ' +
+            'are saved with the ruleset and reused by later sessions. Default is ' +
+            str(program_info['omen_optimizer_size']),
+        type=int,
+        default=program_info['omen_optimizer_size']
+    )
+
     # Debugging and research information
     parser.add_argument(
         '--debug',
@@ -190,9 +408,32 @@ def parse_command_line(program_info):
     program_info['load_session'] = args.load
 
     # Advanced Options
+    program_info['output_file'] = args.output
     program_info['limit'] = args.limit
+    program_info['workers'] = args.workers
+    program_info['strict_order'] = args.strict_order
+    program_info['node'] = args.node
+    program_info['nodes'] = args.nodes
+    program_info['snapshot'] = args.snapshot
+    program_info['checkpoint'] = args.checkpoint
+    program_info['checkpoint_guesses'] = args.checkpoint_guesses
+    program_info['min_length'] = args.min_length
+    program_info['max_length'] = args.max_length
+    program_info['require'] = args.require
+    program_info['dedup'] = args.dedup
+    program_info['dedup_memory'] = args.dedup_memory
+    program_info['exclude_file'] = args.exclude
+    program_info['hash_file'] = args.hashes
+    program_info['hash_type'] = args.hash_type
+    program_info['metrics_file'] = args.metrics
+    program_info['metrics_port'] = args.metrics_port
+    program_info['metrics_interval'] = args.metrics_interval
+    program_info['serve'] = args.serve
+    program_info['connect'] = args.connect
     program_info['skip_brute'] = args.skip_brute
     program_info['skip_case'] = args.skip_case
+    program_info['omen_optimizer_length'] = args.omen_optimizer_length
+    program_info['omen_optimizer_size'] = args.omen_optimizer_size
     program_info['cracking_mode'] = args.mode
 
     # Debugging Options
@@ -203,6 +444,85 @@ def parse_command_line(program_info):
         print(f"The guess --limit/-n must be a positive number. The value specified was {program_info['limit']}")
         return False
 
+    if program_info['omen_optimizer_length'] < 0 or program_info['omen_optimizer_size'] <= 0:
+        print("The --omen_optimizer_length can not be negative and the --omen_optimizer_size must be a positive number")
+        return False
+
+    if program_info['checkpoint'] < 0:
+        print(f"The --checkpoint interval can not be negative. The value specified was {program_info['checkpoint']}")
+        return False
+
+    if program_info['checkpoint_guesses'] is not None and program_info['checkpoint_guesses'] <= 0:
+        print(f"--checkpoint_guesses must be a positive number. The value specified was {program_info['checkpoint_guesses']}")
+        return False
+
+    if program_info['min_length'] < 0:
+        print(f"The --min_length can not be negative. The value specified was {program_info['min_length']}")
+        return False
+
+    if program_info['max_length'] is not None and program_info['max_length'] < max(program_info['min_length'], 1):
+        print(f"The --max_length must be a positive number that is at least the --min_length. The value specified was {program_info['max_length']}")
+        return False
+
+    if program_info['require']:
+        for name in program_info['require'].split(','):
+            if name not in CHARACTER_CLASSES:
+                print(f"Unknown character class for --require: '{name}'. Supported classes are: {','.join(CHARACTER_CLASSES)}")
+                return False
+
+    if program_info['dedup_memory'] <= 0:
+        print(f"The --dedup_memory must be a positive number. The value specified was {program_info['dedup_memory']}")
+        return False
+
+    if program_info['metrics_interval'] <= 0:
+        print(f"The --metrics_interval must be a positive number. The value specified was {program_info['metrics_interval']}")
+        return False
+
+    if program_info['metrics_port'] is not None and not 0 < program_info['metrics_port'] < 65536:
+        print(f"The --metrics_port must be from 1 to 65535. The value specified was {program_info['metrics_port']}")
+        return False
+
+    if program_info['workers'] <= 0:
+        print(f"The number of --workers must be a positive number. The value specified was {program_info['workers']}")
+        return False
+
+    if program_info['nodes'] <= 0 or not 0 <= program_info['node'] < program_info['nodes']:
+        print(f"The --node must be from 0 to {program_info['nodes'] - 1} and the number of --nodes must be a positive number")
+        return False
+
+    if program_info['nodes'] > 1 and program_info['cracking_mode'] != 'true_prob_order':
+        print(f"Multiple --nodes are only supported in the true_prob_order mode. The mode specified was {program_info['cracking_mode']}")
+        return False
+
+    if program_info['serve'] or program_info['connect']:
+        if program_info['serve'] and program_info['connect']:
+            print("Only one of --serve or --connect can be used")
+            return False
+
+        if program_info['cracking_mode'] != 'true_prob_order':
+            print(f"--serve and --connect are only supported in the true_prob_order mode. The mode specified was {program_info['cracking_mode']}")
+            return False
+
+        if program_info['load_session'] or program_info['nodes'] > 1 or program_info['workers'] > 1:
+            print("--serve and --connect can not be used with --load, --nodes, or --workers")
+            return False
+
+        if program_info['serve'] and program_info['hash_file']:
+            print("--hashes can not be used with --serve since the coordinator doesn't generate guesses. Use it with --connect instead")
+            return False
+
+        if program_info['serve'] and program_info['dedup']:
+            print("--dedup can not be used with --serve since the coordinator doesn't generate guesses. Use it with --connect instead")
+            return False
+
+        if program_info['serve'] and program_info['exclude_file']:
+            print("--exclude can not be used with --serve since the coordinator doesn't generate guesses. Use it with --connect instead")
+            return False
+
+    if program_info['workers'] > 1 and program_info['cracking_mode'] != 'true_prob_order':
+        print(f"Multiple --workers are only supported in the true_prob_order mode. The mode specified was {program_info['cracking_mode']}")
+        return False
+
     return True
 
 
@@ -230,7 +550,28 @@ def main():
         'rule_name':'Default',
         'session_name':'default_run',
         'load_session':False,
+        'output_file': None,
         'limit': None,
+        'workers': 1,
+        'strict_order': True,
+        'node': 0,
+        'nodes': 1,
+        'snapshot': False,
+        'checkpoint': 300,
+        'checkpoint_guesses': None,
+        'min_length': 0,
+        'max_length': None,
+        'require': '',
+        'dedup': False,
+        'dedup_memory': DEFAULT_DEDUP_MEMORY,
+        'exclude_file': None,
+        'hash_file': None,
+        'hash_type': 'md5',
+        'metrics_file': None,
+        'metrics_port': None,
+        'metrics_interval': DEFAULT_METRICS_INTERVAL,
+        'serve': None,
+        'connect': None,
 
         # Cracking Mode options
         'cracking_mode':'true_prob_order',
@@ -239,6 +580,8 @@ def main():
         # Advanced Options
         'skip_brute': False,
         'skip_case': False,
+        'omen_optimizer_length': 4,
+        'omen_optimizer_size': 100000,
 
         # Debugging Options
         'debug': False,
@@ -288,15 +631,76 @@ def main():
             save_filename,
             skip_brute = program_info['skip_brute'],
             skip_case = program_info['skip_case'],
-            debug = program_info['debug']
+            debug = program_info['debug'],
+            omen_optimizer_length = program_info['omen_optimizer_length'],
+            omen_optimizer_size = program_info['omen_optimizer_size']
             )
 
     except:
         print("Exiting")
         return
 
+    # Only create guesses that meet the password policy
+    pcfg.policy = create_policy(program_info)
+
+    # Set up where guesses are written to, either stdout or a file/named pipe
+    try:
+        pcfg.save_to_file(program_info['output_file'])
+    except OSError as msg:
+        print(f"Could not open the output file: {msg}",file=sys.stderr)
+        print("Exiting...",file=sys.stderr)
+        return
+
+    # Check guesses against a list of hashes, and only write out the
+    # ones that crack a hash
+    if program_info['hash_file']:
+        try:
+            targets = load_hashes(program_info['hash_file'], program_info['hash_type'])
+        except OSError as msg:
+            print(f"Could not read the hashes file: {msg}",file=sys.stderr)
+            print("Exiting...",file=sys.stderr)
+            return
+
+        if not targets:
+            print(f"No {program_info['hash_type']} hashes were found in {program_info['hash_file']}",file=sys.stderr)
+            print("Exiting...",file=sys.stderr)
+            return
+
+        print(f"Loaded {len(targets):,} {program_info['hash_type']} hashes to crack",file=sys.stderr)
+        pcfg.output = HashOutput(pcfg.output, targets, program_info['hash_type'])
+
+    # Drop duplicate guesses before they are written out, (or hashed)
+    if program_info['dedup']:
+        pcfg.output = DedupOutput(pcfg.output, program_info['dedup_memory'])
+
+    # Skip guesses that are already known, (such as from a potfile)
+    if program_info['exclude_file']:
+        try:
+            exclude_list = load_exclude_list(program_info['exclude_file'])
+        except OSError as msg:
+            print(f"Could not read the exclude file: {msg}",file=sys.stderr)
+            print("Exiting...",file=sys.stderr)
+            return
+
+        print(f"Loaded {len(exclude_list):,} passwords to exclude",file=sys.stderr)
+        pcfg.output = ExcludeOutput(pcfg.output, exclude_list)
+
     # Initiate cracking mode specific features
-    if program_info['cracking_mode'] == 'true_prob_order':
+    if program_info['serve']:
+        run_coordinator(pcfg, program_info['serve'], limit = program_info['limit'])
+
+    elif program_info['connect']:
+        print("Connecting to coordinator: " + program_info['connect'],file=sys.stderr)
+        try:
+            num_guesses = run_worker(pcfg, program_info['connect'])
+            print(f"No more work. Generated {num_guesses:,} guesses",file=sys.stderr)
+
+        # Either the coordinator couldn't be reached, or the receiving program
+        # is no longer accepting guesses
+        except OSError as msg:
+            print(f"Stopping worker: {msg}",file=sys.stderr)
+
+    elif program_info['cracking_mode'] == 'true_prob_order':
         # Check to see if we need to load up a previous guessing session
         if program_info['load_session']:     
             print("Restoring previous session: " + program_info['session_name'],file=sys.stderr)
@@ -307,6 +711,9 @@ def main():
                 print("Exiting...",file=sys.stderr)
                 return
 
+            # Use the password policy the session was started with
+            pcfg.policy = create_policy(program_info)
+
         # Create a new save config
         # It's easeir to just create a default config even if a non-supported guessing mode like honeywords was selected
         else:
@@ -327,8 +734,34 @@ def main():
         else:
             save_config.set('rule_info', 'uuid', pcfg.ruleset_info['uuid'])
 
+        # Set up exporting the session's counters while it runs
+        metrics = None
+        if program_info['metrics_file'] or program_info['metrics_port'] is not None:
+            try:
+                metrics = MetricsExporter(
+                    program_info['metrics_file'],
+                    program_info['metrics_port'],
+                    program_info['metrics_interval']
+                    )
+            except OSError as msg:
+                print(f"Could not start the metrics export: {msg}",file=sys.stderr)
+                print("Exiting...",file=sys.stderr)
+                return
+
         # Initalize the cracking session
-        current_cracking_session = CrackingSession(pcfg, save_config, save_filename)
+        current_cracking_session = CrackingSession(
+            pcfg,
+            save_config,
+            save_filename,
+            workers = program_info['workers'],
+            strict_order = program_info['strict_order'],
+            node = program_info['node'],
+            nodes = program_info['nodes'],
+            snapshot = program_info['snapshot'],
+            checkpoint_interval = program_info['checkpoint'],
+            checkpoint_guesses = program_info['checkpoint_guesses'],
+            metrics = metrics
+        )
 
         # Setup is done, now start generating rules
         current_cracking_session.run(load_session = program_info['load_session'], limit = program_info['limit'])
@@ -338,6 +771,30 @@ def main():
         # Setup is done, now start generating rules
         current_cracking_session.run(limit = program_info['limit'])
 
+    # Write out any guesses that are still buffered
+    pcfg.shutdown()
+
+
+def create_policy(program_info):
+    """
+    Creates the password policy from the command line options
+
+    Inputs:
+        program_info: A dictionary containing information about the current session
+
+    Returns:
+        policy: A PasswordPolicy, or None if no policy was specified
+    """
+
+    if not program_info['min_length'] and program_info['max_length'] is None and not program_info['require']:
+        return None
+
+    required = []
+    if program_info['require']:
+        required = program_info['require'].split(',')
+
+    return PasswordPolicy(program_info['min_length'], program_info['max_length'], required)
+
 
 def create_save_config(program_info):
     """
@@ -358,10 +815,16 @@ def create_save_config(program_info):
     save_config.set(section, 'rule_name', program_info['rule_name'])
     save_config.set(section, 'skip_brute', str(program_info['skip_brute']))
     save_config.set(section, 'skip_case', str(program_info['skip_case']))
+    save_config.set(section, 'node', str(program_info['node']))
+    save_config.set(section, 'nodes', str(program_info['nodes']))
+    save_config.set(section, 'min_length', str(program_info['min_length']))
+    save_config.set(section, 'max_length', str(program_info['max_length'] or ''))
+    save_config.set(section, 'require', program_info['require'])
 
     section = "session_info"
     save_config.add_section(section)
     save_config.set(section, 'first_started', datetime.datetime.now().isoformat())
+    save_config.set(section, 'snapshot', str(program_info['snapshot']))
 
     section = "guessing_info"
     save_config.add_section(section)
@@ -410,6 +873,23 @@ def load_save(save_filename, program_info):
         # Set the skip_case flag for not doing case mangling
         program_info['skip_case'] = save_config.getboolean('rule_info','skip_case')
 
+        # Keep generating the same part of the session. Sessions saved before
+        # sessions could be split up cover everything
+        program_info['node'] = save_config.getint('rule_info', 'node', fallback = 0)
+        program_info['nodes'] = save_config.getint('rule_info', 'nodes', fallback = 1)
+
+        # Keep using the same password policy. Sessions saved before policies
+        # were supported don't have one
+        program_info['min_length'] = save_config.getint('rule_info', 'min_length', fallback = 0)
+        max_length = save_config.get('rule_info', 'max_length', fallback = '')
+        program_info['max_length'] = int(max_length) if max_length else None
+        program_info['require'] = save_config.get('rule_info', 'require', fallback = '')
+
+        # Keep saving snapshots if the session was started with them
+        if save_config.getboolean('session_info', 'snapshot', fallback = False):
+            program_info['snapshot'] = True
+        save_config.set('session_info', 'snapshot', str(program_info['snapshot']))
+
         return save_config
 
     except IOError as msg: